@@ -0,0 +1,375 @@
+"""
+performance benchmarks of the coordinator on one Linux machine
+
+The raspberries are simulated by workers running in a separate process and communicating with the coordinator
+over a loopback transport (Unix domain sockets or TCP on 127.0.0.1) with the protocol of the real workers.
+The coordinator side uses the components of the real coordinator (Receiver_server, Connection_pool,
+Pending_replies and fan_out).
+
+Measures:
+
+    status latency: time between a status request and its reply (one worker, sequential requests)
+    picture transfer: throughput of the pictures for each resolution of RESOLUTIONS and each receiver buffer size
+    receive memory: peak of the memory allocated by the coordinator while receiving a picture (tracemalloc)
+    status sweep: time to ask the status of all the workers as the number of workers grows
+
+Examples:
+
+    python3 benchmark.py
+    python3 benchmark.py --output results.json --workers 1 10 50 --buffer-sizes 4096 65536 1048576
+    python3 benchmark.py --transport tcp --repeat 200
+
+The results are written in JSON (--output) so that runs can be compared.
+The simulated pictures are random bytes (not compressible) of about width x height x --bytes-per-pixel bytes.
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import pathlib
+import argparse
+import platform
+import tempfile
+import threading
+import statistics
+import tracemalloc
+import multiprocessing
+
+# the benchmark uses the modules of the coordinator
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent / "coordinator"))
+
+from config_coordinator import (RESOLUTIONS, RECEIVER_BUFFER_SIZE, RECEIVER_MAX_THREADS, RECEIVER_BACKLOG,
+                                FANOUT_MAX_WORKERS, COMPRESSION_CODECS, COMPRESSION_MIN_SIZE)
+from transport import get_transport, WORKER_PORT, COORDINATOR_PORT
+from protocol import recv_message, MSG_COMMAND, MSG_REPLY, MSG_KEEPALIVE, MSG_HELLO, CODECS
+from connection import Connection_pool
+from receiver import Receiver_server
+from replies import Pending_replies
+from fanout import fan_out
+
+# name of the simulated coordinator (Unix transport)
+COORDINATOR_NAME = "bench_coordinator"
+
+# first port of the simulated workers (TCP transport)
+TCP_BASE_PORT = 15600
+
+
+def addresses(transport_name, workers_number):
+    """
+    return the address of the coordinator and the addresses of the simulated workers
+    """
+    if transport_name == "tcp":
+        return (f"127.0.0.1:{TCP_BASE_PORT}",
+                [f"127.0.0.1:{TCP_BASE_PORT + 1 + idx}" for idx in range(workers_number)])
+    return COORDINATOR_NAME, [f"bench_worker{idx:03d}" for idx in range(workers_number)]
+
+
+def transport_options(transport_name, socket_dir):
+    return {"socket_dir": socket_dir} if transport_name == "unix" else {}
+
+
+class Simulated_worker:
+    """
+    worker answering the status and one_picture requests like a raspberry (without camera)
+    """
+
+    def __init__(self, name, address, transport, connection_pool, bytes_per_pixel):
+        """
+        Args:
+            name (str): hostname of the worker
+            address (str): address the worker listens on
+            connection_pool (Connection_pool): connections to the coordinator
+            bytes_per_pixel (float): size of the simulated JPEG pictures
+        """
+        self.name = name
+        self.address = address
+        self.transport = transport
+        self.connection_pool = connection_pool
+        self.bytes_per_pixel = bytes_per_pixel
+        self.pictures = {}
+
+    def start(self):
+        server_sock = self.transport.listen(self.address, WORKER_PORT, backlog=16)
+        threading.Thread(target=self.accept, args=(server_sock,), daemon=True).start()
+
+    def accept(self, server_sock):
+        while True:
+            client_sock, _ = server_sock.accept()
+            threading.Thread(target=self.read_connection, args=(client_sock,), daemon=True).start()
+
+    def picture(self, resolution):
+        """
+        return random bytes with a JPEG signature (the same content for all the pictures of a resolution)
+        """
+        if resolution not in self.pictures:
+            width, height = [int(x) for x in resolution.split("x")]
+            self.pictures[resolution] = b"\xff\xd8\xff" + os.urandom(int(width * height * self.bytes_per_pixel))
+        return self.pictures[resolution]
+
+    def reply(self, coordinator_address, metadata, payloads=None):
+        self.connection_pool.send(coordinator_address,
+                                  {"hostname": self.name, "bluetooth_address": self.address, **metadata},
+                                  payloads, msg_type=MSG_REPLY)
+
+    def read_connection(self, client_sock):
+        coordinator_address = None
+        while True:
+            message = recv_message(client_sock)
+            if message is None:
+                break
+            msg_type, _, metadata, _ = message
+            if msg_type == MSG_KEEPALIVE:
+                continue
+            if msg_type == MSG_HELLO:
+                coordinator_address = metadata["address"]
+                self.connection_pool.set_peer_codecs(coordinator_address, metadata.get("codecs", []))
+                continue
+            msg = metadata.get("msg", "")
+            # the reply is identified by the id of the request (see Worker.sendMessageTo)
+            reply_to = {"reply_to": msg, "request_id": metadata.get("request_id")}
+            if msg == "status":
+                self.reply(coordinator_address, {**reply_to, "msg": "status", "status": "OK",
+                                                 "epoch": time.time(), "time lapse running": False})
+            elif msg.startswith("one_picture*"):
+                resolution = msg.split("*")[1]
+                self.reply(coordinator_address,
+                           {**reply_to, "picture": {"file_name": f"{self.name}_{resolution}.jpg"}},
+                           payloads={"picture": self.picture(resolution)})
+        client_sock.close()
+
+
+def run_workers(transport_name, options, coordinator_address, worker_addresses, bytes_per_pixel, ready):
+    """
+    run the simulated workers (in a separate process: the memory and the CPU of the workers are not counted
+    with the coordinator)
+    """
+    transport = get_transport(transport_name, options)
+    for address in worker_addresses:
+        name = address.replace(":", "_")
+        connection_pool = Connection_pool(transport, COORDINATOR_PORT, keepalive_interval=0,
+                                          hello={"hostname": name, "address": address, "codecs": list(CODECS)},
+                                          preferred_codecs=COMPRESSION_CODECS, min_size=COMPRESSION_MIN_SIZE)
+        Simulated_worker(name, address, transport, connection_pool, bytes_per_pixel).start()
+    ready.set()
+    while True:
+        time.sleep(3600)
+
+
+class Bench_coordinator:
+    """
+    receiver, connections and pending replies of the coordinator (see Coordinator_core)
+    """
+
+    def __init__(self, transport, address, received_files_dir, buffer_size, max_threads):
+        self.transport = transport
+        self.connection_pool = Connection_pool(transport, WORKER_PORT, keepalive_interval=0,
+                                               hello={"hostname": socket.gethostname(), "address": address,
+                                                      "codecs": list(CODECS)},
+                                               preferred_codecs=COMPRESSION_CODECS, min_size=COMPRESSION_MIN_SIZE)
+        self.replies = Pending_replies(self.send)
+        self.server = Receiver_server(transport, address, COORDINATOR_PORT, on_message=self.message_received,
+                                      received_files_dir=received_files_dir, backlog=RECEIVER_BACKLOG,
+                                      max_threads=max_threads, buffer_size=buffer_size,
+                                      on_hello=lambda metadata: None)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.server.ready.wait(5)
+
+    def send(self, address, msg, timeout, request_id):
+        try:
+            self.connection_pool.send(address, {"msg": msg, "request_id": request_id}, msg_type=MSG_COMMAND,
+                                      timeout=timeout)
+            return False, ""
+        except OSError:
+            return True, str(sys.exc_info()[1])
+
+    def message_received(self, metadata):
+        self.replies.resolve(metadata["hostname"], metadata)
+
+    def request(self, worker_address, msg, timeout=30):
+        """
+        send a request to a simulated worker and wait for the reply
+
+        Returns:
+            float: time between the request and the reply (in seconds)
+            dict: reply
+        """
+        t1 = time.perf_counter()
+        reply = self.replies.request(worker_address.replace(":", "_"), worker_address, msg, timeout=timeout)
+        return time.perf_counter() - t1, reply
+
+    def stop(self):
+        self.server.stop()
+        self.connection_pool.close_all()
+
+
+def summary(durations):
+    """
+    return the statistics of durations (in milliseconds)
+    """
+    durations = sorted(durations)
+
+    def percentile(p):
+        return durations[min(len(durations) - 1, int(p * len(durations)))]
+
+    return {"count": len(durations),
+            "min (ms)": round(durations[0] * 1000, 3),
+            "mean (ms)": round(statistics.mean(durations) * 1000, 3),
+            "p50 (ms)": round(percentile(0.5) * 1000, 3),
+            "p90 (ms)": round(percentile(0.9) * 1000, 3),
+            "p99 (ms)": round(percentile(0.99) * 1000, 3),
+            "max (ms)": round(durations[-1] * 1000, 3)}
+
+
+def status_latency(coordinator, worker_address, repeat):
+    coordinator.request(worker_address, "status")  # connection opened
+    return summary([coordinator.request(worker_address, "status")[0] for _ in range(repeat)])
+
+
+def picture_transfer(coordinator, worker_address, resolution, pictures):
+    """
+    Returns:
+        dict: size of the picture, duration statistics and throughput (median)
+    """
+    durations = []
+    for _ in range(pictures):
+        duration, reply = coordinator.request(worker_address, f"one_picture*{resolution}")
+        durations.append(duration)
+        size = os.path.getsize(reply["picture"]["path"])
+        os.remove(reply["picture"]["path"])
+    return {"resolution": resolution,
+            "buffer size": coordinator.server.buffer_size,
+            "picture size (bytes)": size,
+            **summary(durations),
+            "throughput (MB/s)": round(size / statistics.median(durations) / 1e6, 2)}
+
+
+def receive_memory(coordinator, worker_address, resolution):
+    """
+    Returns:
+        dict: peak of the memory allocated (Python allocations of all threads) during the transfer of one picture
+    """
+    coordinator.request(worker_address, f"one_picture*{resolution}")  # picture generated by the worker
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    _, reply = coordinator.request(worker_address, f"one_picture*{resolution}")
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    size = os.path.getsize(reply["picture"]["path"])
+    os.remove(reply["picture"]["path"])
+    return {"resolution": resolution,
+            "buffer size": coordinator.server.buffer_size,
+            "picture size (bytes)": size,
+            "peak memory (bytes)": peak,
+            "peak memory / picture size": round(peak / size, 3)}
+
+
+def status_sweep(coordinator, worker_addresses, max_workers, timeout):
+    """
+    ask the status of all the workers concurrently (see Coordinator_core.run_all)
+
+    Returns:
+        dict: number of workers, duration and number of errors
+    """
+
+    def status(address):
+        try:
+            coordinator.request(address, "status", timeout=timeout)
+            return False, ""
+        except (OSError, TimeoutError):
+            return True, str(sys.exc_info()[1])
+
+    t1 = time.perf_counter()
+    results = fan_out(worker_addresses, status, max_workers=max_workers)
+    duration = time.perf_counter() - t1
+    return {"workers": len(worker_addresses),
+            "max workers": max_workers,
+            "duration (ms)": round(duration * 1000, 3),
+            "per worker (ms)": round(duration * 1000 / len(worker_addresses), 3),
+            "errors": sum(error for error, _ in results.values())}
+
+
+def parse_arguments(argv):
+    parser = argparse.ArgumentParser(description="performance benchmarks of the coordinator (loopback transport)")
+    parser.add_argument("--transport", choices=("unix", "tcp"), default="unix", help="loopback transport (default: unix)")
+    parser.add_argument("--output", help="JSON file where the results are written (default: standard output only)")
+    parser.add_argument("--repeat", type=int, default=100, help="number of status requests for the latency (default: 100)")
+    parser.add_argument("--pictures", type=int, default=5, help="number of pictures by resolution and buffer size (default: 5)")
+    parser.add_argument("--resolutions", nargs="+", default=RESOLUTIONS, help="resolutions (default: RESOLUTIONS)")
+    parser.add_argument("--buffer-sizes", nargs="+", type=int, default=[4096, RECEIVER_BUFFER_SIZE, 1048576],
+                        help="receiver buffer sizes in bytes (default: 4096, RECEIVER_BUFFER_SIZE, 1048576)")
+    parser.add_argument("--workers", nargs="+", type=int, default=[1, 5, 10, 20, 50],
+                        help="numbers of simulated workers of the status sweep (default: 1 5 10 20 50)")
+    parser.add_argument("--fanout-workers", type=int, nargs="+", default=[FANOUT_MAX_WORKERS],
+                        help="maximum numbers of concurrent requests of the status sweep (default: FANOUT_MAX_WORKERS)")
+    parser.add_argument("--bytes-per-pixel", type=float, default=0.2,
+                        help="size of the simulated JPEG pictures (default: 0.2 byte by pixel)")
+    parser.add_argument("--timeout", type=float, default=30, help="maximum time to wait for a reply (default: 30 s)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_arguments(argv)
+
+    with tempfile.TemporaryDirectory(prefix="time_lapse_benchmark_") as temp_dir:
+        options = transport_options(args.transport, temp_dir)
+        coordinator_address, worker_addresses = addresses(args.transport, max(args.workers))
+
+        context = multiprocessing.get_context("spawn")
+        ready = context.Event()
+        workers_process = context.Process(target=run_workers,
+                                          args=(args.transport, options, coordinator_address, worker_addresses,
+                                                args.bytes_per_pixel, ready),
+                                          daemon=True)
+        workers_process.start()
+        if not ready.wait(60):
+            print("the simulated workers did not start", file=sys.stderr)
+            return 2
+
+        received_files_dir = str(pathlib.Path(temp_dir) / "received")
+        os.makedirs(received_files_dir)
+        coordinator = Bench_coordinator(get_transport(args.transport, options), coordinator_address,
+                                        received_files_dir, RECEIVER_BUFFER_SIZE, RECEIVER_MAX_THREADS)
+
+        results = {"date": time.strftime("%Y-%m-%d %H:%M:%S"),
+                   "host": {"hostname": socket.gethostname(), "platform": platform.platform(),
+                            "python": platform.python_version(), "cpus": os.cpu_count()},
+                   "parameters": {key: value for key, value in vars(args).items() if key != "output"},
+                  }
+        try:
+            print("status latency", file=sys.stderr)
+            results["status latency"] = status_latency(coordinator, worker_addresses[0], args.repeat)
+
+            results["picture transfer"], results["receive memory"] = [], []
+            for buffer_size in args.buffer_sizes:
+                # read by the receiver for each message
+                coordinator.server.buffer_size = buffer_size
+                for resolution in args.resolutions:
+                    print(f"picture transfer {resolution}, buffer size {buffer_size}", file=sys.stderr)
+                    results["picture transfer"].append(picture_transfer(coordinator, worker_addresses[0],
+                                                                        resolution, args.pictures))
+                    results["receive memory"].append(receive_memory(coordinator, worker_addresses[0], resolution))
+            coordinator.server.buffer_size = RECEIVER_BUFFER_SIZE
+
+            results["status sweep"] = []
+            for workers_number in sorted(args.workers):
+                for max_workers in args.fanout_workers:
+                    print(f"status sweep {workers_number} workers, {max_workers} concurrent requests", file=sys.stderr)
+                    # first sweep: the connections are opened
+                    status_sweep(coordinator, worker_addresses[:workers_number], max_workers, args.timeout)
+                    results["status sweep"].append(status_sweep(coordinator, worker_addresses[:workers_number],
+                                                                max_workers, args.timeout))
+        finally:
+            coordinator.stop()
+            workers_process.terminate()
+
+    print(json.dumps(results, indent=1))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f_out:
+            json.dump(results, f_out, indent=1)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,24 +3,26 @@ Raspberry remote bluetooth control
 
 """
 
-# require pybluez 
-# apt install bluetooth libbluetooth-dev
-# python3 -m pip install pybluez)
-import bluetooth  
-
 from PyQt5.QtWidgets import *
 from PyQt5.QtGui import *
 from PyQt5.QtCore import *
 import os
 import sys
 import json
-import pathlib
-import datetime
 import time
 import subprocess
 from functools import partial
 
 from config_coordinator import *
+from protocol import compression_stats
+from fanout import fan_out
+from coordinator_core import Coordinator_core, date_iso
+from registry import Device_registry
+from log_view import Device_log
+from fleet_model import Fleet_model
+from device_panel import Device_panel
+
+core = Coordinator_core(Device_registry(DEVICES_FILE, RASPBERRY_LIST))
 
 __version__ = "0.0.1"
 __version_date__ = "2020-04-07"
@@ -28,10 +30,10 @@ __version_date__ = "2020-04-07"
 
 class bt_receiver(QThread):
     """
-    class for receiving message from raspberries by bluetooth
+    class for receiving message from raspberries
     """
 
-    received = pyqtSignal(bytes)
+    received = pyqtSignal(dict)
 
     def __init__(self):
         QThread.__init__(self)
@@ -41,73 +43,58 @@ class bt_receiver(QThread):
 
     def run(self):
 
-        print("bluetooth receiver thread started")
+        print("receiver thread started")
 
-        while True:
-            server_sock=bluetooth.BluetoothSocket( bluetooth.RFCOMM )
+        core.on_message = self.received.emit
+        core.serve_forever()
 
-            port = 2
-            server_sock.bind(("", port))
-            server_sock.listen(1)
-        
-            client_sock, address = server_sock.accept()
-            print("Accepted connection from " + str(address))
-
-            time1 = time.time()
-            data = b""
-            while True:
-                try:
-                    data_chunk = client_sock.recv(RECEIVER_BUFFER_SIZE)
-                except:
-                    break
-                if len(data_chunk) == 0:
-                    break
-                #print("received: {%s}".format(data_chunk))
-                data += data_chunk
-
-            print(f"transmission time: {time.time() - time1}")
-            #self.received.emit(data.decode("utf-8"))
-            self.received.emit(data)
-            client_sock.close()
-            server_sock.close()
-
-
-def sendMessageTo(targetBluetoothMacAddress, msg):
+
+class Fan_out_thread(QThread):
+    """
+    class for sending a request to many raspberries concurrently without blocking the GUI
     """
-    send message to raspberry by bluetooth
 
-    args:
-        targetBluetoothMacAddress (str): bluetooth MAC address of receiver
-        msg (str): message to send
+    # raspberry id, error, message, number of done, number of raspberries
+    progress = pyqtSignal(str, bool, str, int, int)
 
-    Returns:
-        bool:
-        str:
-    """
+    def __init__(self, targets, function):
+        QThread.__init__(self)
+        self.targets = targets
+        self.function = function
 
-    try:
-        port = 1
-        sock=bluetooth.BluetoothSocket(bluetooth.RFCOMM)
-        sock.connect((targetBluetoothMacAddress, port))
-        sock.send(msg)
-        sock.close()
-        return False, ""
-    except:
-        return True, str(sys.exc_info()[0])
+    def run(self):
+        fan_out(self.targets, self.function, max_workers=FANOUT_MAX_WORKERS, progress=self.progress.emit)
 
 
-def date_iso():
+class Group_capture_thread(QThread):
     """
-    return current date in ISO 8601 format
+    class for taking a picture with many raspberries at the same time without blocking the GUI
     """
-    return datetime.datetime.now().isoformat().split(".")[0].replace("T", " ")
+
+    # raspberry id, error, message, number of done, number of raspberries
+    progress = pyqtSignal(str, bool, str, int, int)
+
+    def __init__(self, targets, resolution):
+        QThread.__init__(self)
+        self.targets = targets
+        self.resolution = resolution
+        self.skew = None
+
+    def run(self):
+        _, self.skew = core.group_capture(self.targets, self.resolution, progress=self.progress.emit)
 
 
 class Coordinator(QMainWindow):
 
-    raspberry_msg = {}
-    status_list, synctime_list, text_list = [], [], {}
-    start_time, end_time, interval, prefix, resolution = {}, {}, {}, {}, {}
+    fan_out_threads = []
+    # detail panel of the opened raspberries
+    panels = {}
+    # log of each raspberry (kept when the detail panel is closed)
+    logs = {}
+    # last preview of each raspberry (content, tool tip)
+    last_preview = {}
+    # position in the log file of each raspberry of the first byte not yet received
+    log_offset = {}
 
 
     def __init__(self):
@@ -116,109 +103,42 @@ class Coordinator(QMainWindow):
         self.setWindowTitle("Raspberry coordinator")
         self.statusBar().showMessage("v. " + __version__)
 
+        if LOG_HISTORY_DIR:
+            os.makedirs(LOG_HISTORY_DIR, exist_ok=True)
+        # the log lines are displayed by batches
+        self.log_timer = QTimer(self)
+        self.log_timer.setInterval(LOG_VIEW_REFRESH_INTERVAL)
+        self.log_timer.timeout.connect(self.flush_logs)
+        self.log_timer.start()
+
         layout = QVBoxLayout()
-        hlayout1 = QHBoxLayout()
-
-        tw = QTabWidget()
-
-        q1=QWidget()
-
-        rasp_count = 0
-        group_count = 0
-        for rb in sorted(RASPBERRY_LIST.keys()):
-
-            print("Raspberry: {rb}".format(rb=rb))
-            rasp_count += 1
-            l = QVBoxLayout()
-            l.addWidget(QLabel(rb))
-
-            self.text_list[rb] = QTextEdit()
-            self.text_list[rb].setLineWrapMode(QTextEdit.NoWrap)
-            self.text_list[rb].setFontFamily("Courrier")
-            l.addWidget(self.text_list[rb])
-
-            l2 = QHBoxLayout()
- 
-            self.status_list.append(QPushButton("Status", clicked=partial(self.status, rb)))
-            l2.addWidget(self.status_list[-1])
-
-            self.synctime_list.append(QPushButton("Sync time", clicked=partial(self.sync_time, rb)))
-            l2.addWidget(self.synctime_list[-1])
-
-            q = QPushButton("Get log", clicked=partial(self.get_log, rb))
-            l2.addWidget(q)
-
-            q = QPushButton("Send command", clicked=partial(self.send_command, rb))
-            l2.addWidget(q)
-
-            q = QPushButton("Clear output", clicked=partial(self.clear_log, rb))
-            l2.addWidget(q)
-
-            l.addLayout(l2)
-
-            l2 = QHBoxLayout()
-            l2.addWidget(QLabel("Resolution"))
-            self.resolution[rb] = QComboBox()
-            for resol in RESOLUTIONS:
-                self.resolution[rb].addItem(resol)
-            self.resolution[rb].setCurrentIndex(DEFAULT_RESOLUTION)
-            l2.addWidget(self.resolution[rb])
-            l.addLayout(l2)
-
-            q = QPushButton("Take one picture", clicked=partial(self.one_picture, rb))
-            l.addWidget(q)
-
-            l2 = QHBoxLayout()
-            q = QPushButton("Start time lapse", clicked=partial(self.start_time_lapse, rb))
-            l2.addWidget(q)
-
-            q = QPushButton("Stop time lapse", clicked=partial(self.stop_time_lapse, rb))
-            l2.addWidget(q)
-            l.addLayout(l2)
-
-            l2 = QHBoxLayout()
-            l2.addWidget(QLabel("Start"))
-            self.start_time[rb] = QDateTimeEdit()
-            self.start_time[rb].setDateTime(QDateTime.currentDateTime())
-            self.start_time[rb].setDisplayFormat("yyyy-MM-dd hh:mm:ss")
-            l2.addWidget(self.start_time[rb])
-            l.addLayout(l2)
-
-            l2 = QHBoxLayout()
-            l2.addWidget(QLabel("End"))
-            self.end_time[rb] = QDateTimeEdit()
-            self.end_time[rb].setDateTime(QDateTime.currentDateTime())
-            self.end_time[rb].setDisplayFormat("yyyy-MM-dd hh:mm:ss")
-            l2.addWidget(self.end_time[rb])
-            l.addLayout(l2)
-
-            l2 = QHBoxLayout()
-            l2.addWidget(QLabel("Interval"))
-            self.interval[rb] = QSpinBox()
-            self.interval[rb].setMinimum(5)
-            self.interval[rb].setValue(DEFAULT_INTERVAL)
-            l2.addWidget(self.interval[rb])
-            l2.addWidget(QLabel("Prefix"))
-            self.prefix[rb] = QLineEdit(rb)
-            l2.addWidget(self.prefix[rb])
-
-            l.addLayout(l2)
-
-            hlayout1.addLayout(l)
-            if rasp_count % GUI_COLUMNS_NUMBER == 0:
-                q1.setLayout(hlayout1)
-                group_count += 1
-                tw.addTab(q1, f"Raspberries group #{group_count}")
-                hlayout1 = QHBoxLayout()
-                q1 = QWidget()
-
-        if rasp_count % GUI_COLUMNS_NUMBER:
-            q1.setLayout(hlayout1)
-            tw.addTab(q1, f"Raspberries group #{group_count}")
-            hlayout1 = QHBoxLayout()
-            q1 = QWidget()
-
-        layout.addWidget(tw)
+        splitter = QSplitter(Qt.Horizontal)
+
+        # dashboard: one row per raspberry
+        self.fleet_model = Fleet_model(core.registry, refresh_interval=LOG_VIEW_REFRESH_INTERVAL,
+                                       max_time_difference=MAX_TIME_DIFFERENCE, parent=self)
+        proxy_model = QSortFilterProxyModel(self)
+        proxy_model.setSourceModel(self.fleet_model)
+        proxy_model.setSortRole(Qt.UserRole)
+        self.fleet_view = QTableView()
+        self.fleet_view.setModel(proxy_model)
+        self.fleet_view.setSortingEnabled(True)
+        self.fleet_view.sortByColumn(0, Qt.AscendingOrder)
+        self.fleet_view.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.fleet_view.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.fleet_view.verticalHeader().setVisible(False)
+        self.fleet_view.horizontalHeader().setStretchLastSection(True)
+        self.fleet_view.doubleClicked.connect(
+            lambda index: self.open_panel(self.fleet_model.rasp_ids[proxy_model.mapToSource(index).row()]))
+        splitter.addWidget(self.fleet_view)
+
+        # detail panels (created when a raspberry is double-clicked)
+        self.panels_widget = QTabWidget()
+        self.panels_widget.setTabsClosable(True)
+        self.panels_widget.tabCloseRequested.connect(self.close_panel)
+        splitter.addWidget(self.panels_widget)
+
+        layout.addWidget(splitter)
 
         # "all" buttons
         hlayout2 = QHBoxLayout()
@@ -243,6 +163,18 @@ class Coordinator(QMainWindow):
         pb.clicked.connect(self.update_all)
         hlayout2.addWidget(pb)
 
+        pb = QPushButton("Sync frames from all")
+        pb.clicked.connect(self.sync_frames_all)
+        hlayout2.addWidget(pb)
+
+        pb = QPushButton("Synchronized capture")
+        pb.clicked.connect(self.group_capture)
+        hlayout2.addWidget(pb)
+
+        pb = QPushButton("Metrics from all")
+        pb.clicked.connect(self.metrics_all)
+        hlayout2.addWidget(pb)
+
         layout.addLayout(hlayout2)
 
         main_widget = QWidget(self)
@@ -252,6 +184,19 @@ class Coordinator(QMainWindow):
         
         self.show()
 
+        # reload the inventory file when it is modified
+        self.registry_timer = QTimer(self)
+        self.registry_timer.setInterval(REGISTRY_RELOAD_INTERVAL * 1000)
+        self.registry_timer.timeout.connect(self.reload_registry)
+        self.registry_timer.start()
+
+        # write the metrics of the coordinator and of the raspberries in METRICS_FILE
+        self.metrics_timer = QTimer(self)
+        self.metrics_timer.setInterval(METRICS_INTERVAL * 1000)
+        self.metrics_timer.timeout.connect(self.metrics_all)
+        if METRICS_FILE and METRICS_INTERVAL:
+            self.metrics_timer.start()
+
         # set bluetooth receiver thread
         self.bt_receiver_thread = bt_receiver()
         self.bt_receiver_thread.received.connect(self.thread_data_received)
@@ -261,17 +206,78 @@ class Coordinator(QMainWindow):
         self.status_all()
 
 
+    def open_panel(self, rb):
+        """
+        show the detail panel of raspberry rb (created if not already opened)
+        """
+        if rb not in self.panels:
+            panel = Device_panel(rb, self, self.device_log(rb), RESOLUTIONS, DEFAULT_RESOLUTION, MIN_INTERVAL, DEFAULT_INTERVAL)
+            if rb in self.last_preview:
+                self.show_preview(panel, *self.last_preview[rb])
+            self.panels[rb] = panel
+            self.panels_widget.addTab(panel, rb)
+        self.panels_widget.setCurrentWidget(self.panels[rb])
+
+
+    def close_panel(self, index):
+        """
+        destroy the detail panel (the log of the raspberry is kept)
+        """
+        panel = self.panels_widget.widget(index)
+        self.panels_widget.removeTab(index)
+        del self.panels[panel.rb]
+        panel.log_view.detach()
+        panel.deleteLater()
+
+
+    def show_preview(self, panel, content, tool_tip):
+        pixmap = QPixmap()
+        pixmap.loadFromData(content)
+        panel.preview.setPixmap(pixmap)
+        panel.preview.setToolTip(tool_tip)
+
+
+    def reload_registry(self):
+        """
+        update the dashboard if the inventory file was modified
+        the detail panels of the removed raspberries are closed
+        """
+        if not core.registry.reload_if_changed():
+            return
+        for rb in [rb for rb in self.panels if rb not in core.registry]:
+            self.close_panel(self.panels_widget.indexOf(self.panels[rb]))
+        self.fleet_model.set_registry(core.registry)
+        self.statusBar().showMessage(f"{core.registry.path} reloaded: {len(core.registry)} raspberries")
+
+
+    def device_log(self, rb):
+        """
+        return the log of raspberry rb (created at the first message)
+        """
+        if rb not in self.logs:
+            self.logs[rb] = Device_log(history_file=os.path.join(LOG_HISTORY_DIR, rb + ".log") if LOG_HISTORY_DIR else "",
+                                       max_lines=LOG_VIEW_MAX_LINES)
+        return self.logs[rb]
+
+
+    def flush_logs(self):
+        for device_log in self.logs.values():
+            device_log.flush()
+
+
     def rb_msg(self, rb, msg):
         """
-        update text_list specific for raspberry rb with message
+        add message to the log of raspberry rb
 
         Args:
             rb (str): raspberry id
             msg (str): messag to display
         """
 
-        self.text_list[rb].append("{}: {}".format(date_iso(), msg))
-        app.processEvents()
+        if rb not in core.registry:
+            print(f"{rb}: {msg}")
+            return
+        self.device_log(rb).append("{}: {}".format(date_iso(), msg))
 
 
     def send_command(self, rb):
@@ -279,42 +285,78 @@ class Coordinator(QMainWindow):
         if not ok:
             return
         self.rb_msg(rb, "sent command: {}".format(text))
-        r, msg = sendMessageTo(RASPBERRY_LIST[rb], "command***{}".format(text))
+        r, msg = core.send(rb, "command***{}".format(text))
         print(f"result: {r}")
         if r:
             self.rb_msg(rb, msg)
 
 
+    def start_fan_out(self, action, function, targets=None):
+        """
+        call function(raspberry id) for all raspberries concurrently in a separate thread
+
+        Args:
+            action (str): name of the action (displayed in status bar)
+            function (callable): function(raspberry id) returning (bool error, str message)
+            targets (list): raspberries id (default: all raspberries)
+        """
+        if targets is None:
+            targets = core.targets()
+        thread = Fan_out_thread(targets, function)
+        thread.progress.connect(partial(self.fan_out_progress, action))
+        thread.finished.connect(partial(self.fan_out_threads.remove, thread))
+        self.fan_out_threads.append(thread)
+        self.statusBar().showMessage(f"{action}: 0/{len(targets)}")
+        thread.start()
+
+
+    def fan_out_progress(self, action, rb, error, msg, done, total):
+        """
+        display the result of a fan out request for raspberry rb
+        """
+        if action in ("status", "update", "sync time", "sync frames", "synchronized capture", "metrics") and not error:
+            self.rb_msg(rb, msg)
+        if action in ("status", "sync time") and rb in core.clock_offsets:
+            offset, round_trip = core.clock_offsets[rb]
+            self.fleet_model.set_values(rb, **{"clock offset": offset, "round trip": round_trip})
+        if error:
+            self.rb_msg(rb, msg)
+            if action == "status":
+                # mark the raspberry in the dashboard
+                self.fleet_model.set_values(rb, status="error")
+        self.statusBar().showMessage(f"{action}: {done}/{total}")
+        if action == "metrics" and done == total and METRICS_FILE:
+            error, msg = core.export_metrics(METRICS_FILE)
+            self.statusBar().showMessage(f"{action}: {done}/{total}, {msg}")
+
+
     def status_all(self):
         """
         ask status to all raspberries
         """
-        for rasp_id in sorted(RASPBERRY_LIST.keys()):
-            if not RASPBERRY_LIST[rasp_id]:
-                continue
+        for rasp_id in core.targets():
             self.rb_msg(rasp_id, "asked status")
-            r, msg = sendMessageTo(RASPBERRY_LIST[rasp_id], "status")
-            print(rasp_id, "r", r, msg)
-            if r:
-                self.rb_msg(rasp_id, msg)
-                # change status button color
-                self.status_list[sorted(RASPBERRY_LIST.keys()).index(rasp_id)].setStyleSheet(f"background: #ff0000;")
-            time.sleep(5)
+        self.start_fan_out("status", self.status_and_clock)
+
 
+    def status_and_clock(self, rb):
+        """
+        ask the status of raspberry rb and measure its clock offset (run in a fan out thread)
+        """
+        error, msg = core.send(rb, "status", timeout=FANOUT_TIMEOUT)
+        if error:
+            return error, msg
+        error, msg, _, _ = core.measure_clock(rb)
+        return error, msg
 
 
     def sync_all(self):
         """
         sync time on all raspberries
         """
-        for rb in sorted(RASPBERRY_LIST.keys()):
-            if not RASPBERRY_LIST[rb]:
-                continue
-            self.rb_msg(rb, "sent sync time command")
-            date, hour = date_iso().split(" ")
-            r, msg = sendMessageTo(RASPBERRY_LIST[rb], "sync_time*{}*{}".format(date, hour))
-            if r:
-                self.rb_msg(rb, msg)
+        for rb in core.targets():
+            self.rb_msg(rb, "asked clock synchronization")
+        self.start_fan_out("sync time", core.sync_time)
 
 
     def command_all(self):
@@ -325,13 +367,10 @@ class Coordinator(QMainWindow):
         if not ok:
             return
 
-        for rb in sorted(RASPBERRY_LIST.keys()):
-            if not RASPBERRY_LIST[rb]:
-                continue
+        for rb in core.targets():
             self.rb_msg(rb, "sent command")
-            r, msg = sendMessageTo(RASPBERRY_LIST[rb], "command***{}".format(text))
-            if r:
-                self.rb_msg(rb, msg)
+        self.start_fan_out("command",
+                           lambda rb: core.send(rb, "command***{}".format(text), timeout=FANOUT_TIMEOUT))
 
 
     def update_all(self):
@@ -339,68 +378,138 @@ class Coordinator(QMainWindow):
         update rasp
         send the bluetooth_listener.py file to all rasp
         """
-        for rb in sorted(RASPBERRY_LIST.keys()):
-            if not RASPBERRY_LIST[rb]:
-                continue
-            completed = subprocess.run(["obexftp", "--nopath", "--noconn", "--uuid", "none", "--bluetooth",
-                                        RASPBERRY_LIST[rb], "--channel", "9", "-p", "listener/bluetooth_listener.py"])
-            if completed.returncode == 255:
-                self.rb_msg(rb, "file sent")
+        def update(rb):
+            try:
+                completed = subprocess.run(["obexftp", "--nopath", "--noconn", "--uuid", "none", "--bluetooth",
+                                            core.registry[rb], "--channel", "9", "-p", "listener/bluetooth_listener.py"],
+                                           timeout=FANOUT_TIMEOUT)
+            except subprocess.TimeoutExpired:
+                return True, "file NOT sent: timeout"
+            return (False, "file sent") if completed.returncode == 255 else (True, "file NOT sent")
+
+        self.start_fan_out("update", update)
+
+
+    def sync_frames(self, rb):
+        """
+        copy the new time lapse frames of raspberry rb in RECEIVED_FILES_DIR/rb
+        """
+        self.rb_msg(rb, "asked frames synchronization")
+        self.start_fan_out("sync frames", core.fetch_frames, targets=[rb])
+
+
+    def sync_frames_all(self):
+        """
+        copy the new time lapse frames of all raspberries
+        """
+        for rb in core.targets():
+            self.rb_msg(rb, "asked frames synchronization")
+        self.start_fan_out("sync frames", core.fetch_frames)
+
+
+    def metrics_all(self):
+        """
+        ask the metrics of all raspberries (latencies, capture durations, queue depths),
+        written with the metrics of the coordinator in METRICS_FILE
+        """
+        self.start_fan_out("metrics", core.metrics)
+
+
+    def group_capture(self):
+        """
+        take a picture with all raspberries at the same time (in GROUP_CAPTURE_DELAY seconds)
+        """
+        resolution, ok = QInputDialog.getItem(self, "Synchronized capture", "Resolution", RESOLUTIONS, DEFAULT_RESOLUTION, False)
+        if not ok:
+            return
+        targets = core.targets()
+        for rb in targets:
+            self.rb_msg(rb, f"asked synchronized capture {resolution}")
+        thread = Group_capture_thread(targets, resolution)
+        thread.progress.connect(partial(self.fan_out_progress, "synchronized capture"))
+        thread.finished.connect(partial(self.group_capture_finished, thread))
+        self.fan_out_threads.append(thread)
+        self.statusBar().showMessage(f"synchronized capture in {GROUP_CAPTURE_DELAY} s")
+        thread.start()
+
+
+    def group_capture_finished(self, thread):
+        self.fan_out_threads.remove(thread)
+        if thread.skew is not None:
+            self.statusBar().showMessage(f"synchronized capture: skew between the cameras {thread.skew * 1000:.1f} ms")
 
 
     def reset_all(self):
-        for rb in RASPBERRY_LIST:
-             self.text_list[rb].clear()
-        app.processEvents()
+        for device_log in self.logs.values():
+             device_log.clear()
 
 
     def clear_log(self, rb):
-        self.text_list[rb].clear()
-        app.processEvents()
+        self.device_log(rb).clear()
 
 
-    def thread_data_received(self, data):
+    def thread_data_received(self, d):
         """
         display data received by bluetooth receiver thread
-        check raspberry id or bluetooth address is in RASPBERRY_LIST
+        check raspberry id or bluetooth address is in the registry
 
         Args:
-            data (bytes): data received from raspberry
+            d (dict): message received from raspberry
         """
 
         try:
-            d = eval(data)
             print(f'Received from {d["hostname"]}: {list(d.keys())}')
-            rasp_id = d["hostname"]
-
-            # if hostname not in list check bluetooth address
-            if rasp_id not in RASPBERRY_LIST:
-                for key in RASPBERRY_LIST:
-                    if d["bluetooth_address"].upper() == RASPBERRY_LIST[key].upper():
-                        rasp_id = key
+            rasp_id = core.rasp_id_of(d)
+            if rasp_id not in core.registry:
+                print(f'{d.get("hostname", "")} is not in the registry')
+                return
+            self.fleet_model.set_values(rasp_id, **{"last seen": time.time()})
 
             if "picture" in d:
-                with open(RECEIVED_FILES_DIR + d["picture"]["file_name"], "wb") as f:
-                    f.write(d["picture"]["file_content"])
+                self.rb_msg(rasp_id, f'picture received: {d["picture"]["path"]}')
+
+            if "preview" in d:
+                self.last_preview[rasp_id] = (d["payloads"]["preview"],
+                                              f'{d["preview"]["file_name"]} ({d["datetime"].replace("_", " ")})')
+                if rasp_id in self.panels:
+                    self.show_preview(self.panels[rasp_id], *self.last_preview[rasp_id])
 
-            if "msg":
+            if "log" in d:
+                self.log_received(rasp_id, d)
+
+            if "msg" in d:
                 self.rb_msg(rasp_id, d["msg"])
                 # check status
                 if d["msg"] == "status":
-                    color = "#00ff00" if d["status"] == "OK" else "#ff0000"
-                    self.status_list[sorted(RASPBERRY_LIST.keys()).index(rasp_id)].setStyleSheet(f"background: {color};")
-                    # check time
-                    if time.time() - MAX_TIME_DIFFERENCE < d["epoch"] < time.time() + MAX_TIME_DIFFERENCE:
-                        self.synctime_list[sorted(RASPBERRY_LIST.keys()).index(rasp_id)].setStyleSheet(f"background: {color};")
+                    self.fleet_model.set_values(rasp_id, **{"status": "OK" if d["status"] == "OK" else "error",
+                                                           "time lapse": "running" if d["time lapse running"] else "",
+                                                           "frames": d.get("number of pict"),
+                                                           "free space": d.get("free space (MB)"),
+                                                           "hours remaining": d.get("hours remaining")})
                     # display status
                     self.rb_msg(rasp_id,
                                 (f'status: {d["status"]}\n'
                                  f'Raspberry time: {d["local time"]}\n'
                                  f'worker version: {d["version installed"]}\n'
                                  f'time lapse running: {d["time lapse running"]}\n'
-                                 f'camera enabled: {d["camera enabled"]}'
+                                 f'camera enabled: {d["camera enabled"]}\n'
+                                 f'number of pictures: {d.get("number of pict", "")} ({d.get("pictures size (MB)", "")} MB), '
+                                 f'last: {d.get("last picture", "")}\n'
+                                 f'free space: {d.get("free space (MB)", "")} MB\n'
+                                 f'storage headroom: {d.get("storage headroom (MB)", "")} MB '
+                                 f'(reclaimable: {d.get("reclaimable (MB)", "")} MB, '
+                                 f'capture rate: {d.get("capture rate (MB/h)", "")} MB/h, '
+                                 f'hours remaining: {d.get("hours remaining", "")})'
                                 )
                      )
+                    if d.get("compression"):
+                        self.rb_msg(rasp_id, "compression: " + ", ".join(f"{k}: {v}" for k, v in d["compression"].items()))
+                    self.statusBar().showMessage("coordinator compression: " +
+                                                 ", ".join(f"{k}: {v}" for k, v in compression_stats.snapshot().items()))
+                    if d.get("time lapse stats"):
+                        self.rb_msg(rasp_id, "time lapse frames: " + ", ".join(f"{k}: {v}" for k, v in d["time lapse stats"].items()))
+                    if d.get("camera"):
+                        self.rb_msg(rasp_id, "camera: " + ", ".join(f"{k}: {v}" for k, v in d["camera"].items()))
 
         except:
             raise
@@ -410,21 +519,20 @@ class Coordinator(QMainWindow):
     def status(self, rasp_id):
         
         self.rb_msg(rasp_id, "asked status")
-        r, msg = sendMessageTo(RASPBERRY_LIST[rasp_id], "status")
+        r, msg = core.send(rasp_id, "status")
         if r:
             self.rb_msg(rasp_id, msg)
             # change status button color
-            self.status_list[sorted(RASPBERRY_LIST.keys()).index(rasp_id)].setStyleSheet(f"background: #ff0000;")
+            self.fleet_model.set_values(rasp_id, status="error")
 
 
 
     def sync_time(self, rb):
-        self.rb_msg(rb, "sent sync time command")
-        date, hour = date_iso().split(" ")
-        r, msg = sendMessageTo(RASPBERRY_LIST[rb], "sync_time*{}*{}".format(date, hour))
-        print(f"result: {r}")
-        if r:
-            self.rb_msg(rb, msg)
+        """
+        measure the clock offset of raspberry rb and correct its clock if needed
+        """
+        self.rb_msg(rb, "asked clock synchronization")
+        self.start_fan_out("sync time", core.sync_time, targets=[rb])
 
 
     def one_picture(self, rb):
@@ -432,52 +540,73 @@ class Coordinator(QMainWindow):
         ask to raspberry to take one picture
         the taken picture is then sent back by raspberry
         """
-        self.rb_msg(rb, "asked one picture " + self.resolution[rb].currentText())
-        r, msg = sendMessageTo(RASPBERRY_LIST[rb], "one_picture*" + self.resolution[rb].currentText())
+        resolution = self.panels[rb].resolution.currentText()
+        self.rb_msg(rb, "asked one picture " + resolution)
+        r, msg = core.send(rb, "one_picture*" + resolution)
         if r:
             self.rb_msg(rb, msg)
 
 
     def start_time_lapse(self, rb):
 
-        dt1 = self.start_time[rb].dateTime().toString(Qt.ISODate)
-        dt2 = self.end_time[rb].dateTime().toString(Qt.ISODate)
+        panel = self.panels[rb]
+        dt1 = panel.start_time.dateTime().toString(Qt.ISODate)
+        dt2 = panel.end_time.dateTime().toString(Qt.ISODate)
         if dt2 < dt1:
             QMessageBox.warning(self, "Bluetooth controller", "end time is before start time")
             return
-        prefix = self.prefix[rb].text().replace(" ", "_")
+        prefix = panel.prefix.text().replace(" ", "_")
         try:
-            interval = self.interval[rb].value()
+            interval = panel.interval.value()
         except:
-             QMessageBox.warning(self, "Bluetooth controller", "{} is not a valid interval (seconds)".format(self.interval[rb].text()))
+             QMessageBox.warning(self, "Bluetooth controller", "{} is not a valid interval (seconds)".format(panel.interval.text()))
              return
         self.rb_msg(rb, "Asked to start time lapse from {} to {} resolution: {}".format(dt1.replace("T", " "),
                                                                          dt2.replace("T", " "),
-                                                                         self.resolution[rb].currentText()))
+                                                                         panel.resolution.currentText()))
         command_dict = {"start":dt1, "end":dt2, "interval": interval,
-                        "prefix": prefix, "resolution": self.resolution[rb].currentText()}
+                        "prefix": prefix, "resolution": panel.resolution.currentText()}
         #print(command_dict)
 
-        r, msg = sendMessageTo(RASPBERRY_LIST[rb], "time_lapse|{}".format(json.dumps(command_dict, indent=0, separators=(",",":"))))
+        r, msg = core.send(rb, "time_lapse|{}".format(json.dumps(command_dict, indent=0, separators=(",",":"))))
         if r:
             self.rb_msg(rb, msg)
 
 
     def stop_time_lapse(self, rb):
         self.rb_msg(rb, "asked to stop time lapse")
-        r, msg = sendMessageTo(RASPBERRY_LIST[rb], "stop_time_lapse")
+        r, msg = core.send(rb, "stop_time_lapse")
         if r:
             self.rb_msg(rb, msg)
 
 
     def get_log(self, rb):
+        """
+        ask the log lines written since the last request
+        """
         self.rb_msg(rb, "asked log")
-        r, msg = sendMessageTo(RASPBERRY_LIST[rb], "get_log")
-        print(f"result: {r}")
+        self.request_log(rb)
+
+
+    def request_log(self, rb):
+        params = {"offset": self.log_offset.get(rb, 0), "level": LOG_LEVEL, "pattern": LOG_PATTERN}
+        r, msg = core.send(rb, f"get_log|{json.dumps(params)}")
         if r:
             self.rb_msg(rb, msg)
 
 
+    def log_received(self, rb, d):
+        """
+        display the log lines received and ask the next ones if the end of log was not reached
+        """
+        lines = d["payloads"]["log"].decode("utf-8")
+        if lines:
+            self.device_log(rb).append(lines)
+        self.log_offset[rb] = d["log"]["offset"]
+        if not d["log"]["complete"]:
+            self.request_log(rb)
+
+
 if __name__ == '__main__':
     app = QApplication(sys.argv)
     bt_control = Coordinator()
@@ -7,6 +7,12 @@ RASPBERRY_LIST  = {
     "rasp01": "b8:27:eb:42:d2:xx"
 }
 
+# inventory file of the raspberries (JSON or CSV with id, address, groups and tags, see registry.py)
+# used instead of RASPBERRY_LIST if not empty. The file is reloaded when it is modified
+DEVICES_FILE = ""
+# seconds between two checks of the modification of DEVICES_FILE by the graphical interface
+REGISTRY_RELOAD_INTERVAL = 5
+
 # maximum time difference between coordinator and raspberries (in seconds)
 MAX_TIME_DIFFERENCE = 10
 
@@ -15,11 +21,80 @@ RECEIVED_FILES_DIR = "/tmp/"
 
 # seconds between 2 pictures in time lapse mode
 DEFAULT_INTERVAL = 20
+# minimum interval (in seconds), intervals shorter than PIPELINE_INTERVAL of the worker use the high-rate capture pipeline
+MIN_INTERVAL = 0.2
 
-# number of columns in the interface
-GUI_COLUMNS_NUMBER = 2
-
-RECEIVER_BUFFER_SIZE = 1024
+# size of a single read when receiving data (pictures are written to disk by blocks of this size)
+RECEIVER_BUFFER_SIZE = 65536
+# number of pending connections of the receiver server
+RECEIVER_BACKLOG = 16
+# maximum number of messages received at the same time
+RECEIVER_MAX_THREADS = 8
 
 RESOLUTIONS = ["3280x2464", "1920x1080", "1640x1232", "1640x922", "1280x720", "640x480"]
 DEFAULT_RESOLUTION = 5 # index of RESOLUTIONS (list starts at index 0!)
+
+# transport used to communicate with the raspberries: "bluetooth", "tcp" or "unix"
+# with "tcp" the RASPBERRY_LIST values are IP addresses ("192.168.1.10" or "127.0.0.1:5601")
+# with "unix" the RASPBERRY_LIST values are the names of the workers (all on this machine)
+TRANSPORT = "bluetooth"
+# options of the transport, for example {"base_port": 5600} for tcp or {"socket_dir": "/tmp/time_lapse_sockets"} for unix
+TRANSPORT_OPTIONS = {}
+# address the coordinator listens on ("" for bluetooth and tcp, "coordinator" for unix)
+LISTEN_ADDRESS = ""
+
+# maximum number of raspberries contacted at the same time by the "all" actions
+# (a bluetooth adapter can only handle a few simultaneous connections)
+FANOUT_MAX_WORKERS = 3
+# timeout (in seconds) for contacting a single raspberry
+FANOUT_TIMEOUT = 20
+
+# seconds of inactivity after which a keepalive message is sent on the connections to the raspberries
+KEEPALIVE_INTERVAL = 30
+# seconds of inactivity after which the connection of a raspberry is closed
+CONNECTION_IDLE_TIMEOUT = 120
+
+# frames synchronization: size of the chunks (in bytes) and maximum time (in seconds) to wait for a reply
+SYNC_CHUNK_SIZE = 262144
+SYNC_TIMEOUT = 60
+
+# filters applied by the raspberries on the log lines sent with "Get log"
+# minimum level (INFO, WARNING, ERROR) or "" for all lines
+LOG_LEVEL = ""
+# regular expression or "" for all lines
+LOG_PATTERN = ""
+
+# compression codecs used for the messages, in order of preference ("zlib", "lzma" or [] for no compression).
+# The codec must also be supported by the other side
+COMPRESSION_CODECS = ["zlib"]
+# messages and payload sections smaller than COMPRESSION_MIN_SIZE bytes are not compressed
+COMPRESSION_MIN_SIZE = 512
+
+# maximum number of lines displayed in the log view of a raspberry (older lines are removed)
+LOG_VIEW_MAX_LINES = 5000
+# delay (in milliseconds) between two updates of the log views and of the dashboard (the messages received meanwhile are displayed together)
+LOG_VIEW_REFRESH_INTERVAL = 200
+# directory where the full log history of each raspberry is written (RASPBERRY_ID.log), "" for no history
+LOG_HISTORY_DIR = "/tmp/time_lapse_logs"
+
+# coordinator without interface (coordinator_cli.py daemon): seconds between two status requests
+# and between two frames synchronizations (0 to disable)
+DAEMON_STATUS_INTERVAL = 600
+DAEMON_FETCH_INTERVAL = 3600
+
+# clock offset measurement: number of time probes sent to a raspberry (the probe with the shortest round trip is used)
+CLOCK_SAMPLES = 8
+# the clock of a raspberry is corrected by "Sync time" only if its offset is larger than this value (in seconds),
+# a smaller offset is applied to the capture times of the frames
+CLOCK_CORRECTION_THRESHOLD = 0.5
+
+# synchronized capture: the capture time is chosen GROUP_CAPTURE_DELAY seconds in the future
+# (the request must reach all the raspberries and their released cameras must warm up before the capture time,
+# see CAMERA_WARM_UP_TIME and CAPTURE_ARM_TIME of the workers: a shorter delay shortens the warm-up)
+GROUP_CAPTURE_DELAY = 5
+
+# file where the metrics (latencies, bytes, queue depths) of the coordinator and of the raspberries are written
+# (Prometheus text format, CSV if the name ends with .csv), "" for no file
+METRICS_FILE = ""
+# seconds between two writings of METRICS_FILE (the metrics of the raspberries are asked at the same time)
+METRICS_INTERVAL = 300
@@ -0,0 +1,194 @@
+"""
+Raspberry remote control from the command line (no graphical interface)
+
+Examples:
+
+    python3 coordinator_cli.py status
+    python3 coordinator_cli.py sync-time rasp00 rasp01
+    python3 coordinator_cli.py start-timelapse --start 2020-04-08T08:00:00 --end 2020-04-08T18:00:00 --interval 20
+    python3 coordinator_cli.py fetch
+    python3 coordinator_cli.py capture --delay 5
+    python3 coordinator_cli.py metrics --output /tmp/time_lapse_metrics.prom
+    python3 coordinator_cli.py daemon
+
+The exit code is 1 if the command failed on at least one raspberry.
+The GUI coordinator must not be running at the same time (both listen on the same port).
+"""
+
+import sys
+import json
+import signal
+import time
+import argparse
+import threading
+
+
+def parse_arguments(argv):
+    parser = argparse.ArgumentParser(description="Raspberry remote control from the command line")
+    parser.add_argument("--json", action="store_true", help="print the results in JSON format")
+    parser.add_argument("--group", default="", help="only the raspberries of this group (see DEVICES_FILE)")
+    parser.add_argument("--tag", default="", help="only the raspberries with this tag (see DEVICES_FILE)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    for command, help in (("status", "ask the status of the raspberries"),
+                          ("sync-time", "set the time of the raspberries to the time of the coordinator"),
+                          ("fetch", "copy the new time lapse frames of the raspberries in RECEIVED_FILES_DIR")):
+        subparser = subparsers.add_parser(command, help=help)
+        subparser.add_argument("raspberries", nargs="*", help="raspberries id (default: all)")
+
+    subparser = subparsers.add_parser("start-timelapse", help="start a time lapse on the raspberries")
+    subparser.add_argument("raspberries", nargs="*", help="raspberries id (default: all)")
+    subparser.add_argument("--start", required=True, help="start date time (YYYY-MM-DDTHH:MM:SS)")
+    subparser.add_argument("--end", required=True, help="end date time (YYYY-MM-DDTHH:MM:SS)")
+    subparser.add_argument("--interval", type=float, help="seconds between 2 pictures (default: DEFAULT_INTERVAL)")
+    subparser.add_argument("--prefix", default="", help="prefix of the pictures file names (default: raspberry id)")
+    subparser.add_argument("--resolution", help="resolution WIDTHxHEIGHT (default: DEFAULT_RESOLUTION)")
+
+    subparser = subparsers.add_parser("capture", help="take a picture with the raspberries at the same time")
+    subparser.add_argument("raspberries", nargs="*", help="raspberries id (default: all)")
+    subparser.add_argument("--delay", type=float, help="seconds before the capture (default: GROUP_CAPTURE_DELAY)")
+    subparser.add_argument("--prefix", default="", help="prefix of the pictures file names (default: hostname)")
+    subparser.add_argument("--resolution", help="resolution WIDTHxHEIGHT (default: DEFAULT_RESOLUTION)")
+
+    subparser = subparsers.add_parser("metrics", help="ask the metrics of the raspberries (latencies, capture durations, "
+                                                      "queue depths) and write them with the metrics of the coordinator")
+    subparser.add_argument("raspberries", nargs="*", help="raspberries id (default: all)")
+    subparser.add_argument("--output", help="file written (Prometheus text format, CSV if the name ends with .csv) "
+                                            "(default: METRICS_FILE)")
+
+    subparser = subparsers.add_parser("daemon", help="run the coordinator without interface: "
+                                                     "periodic status and frames synchronization")
+    subparser.add_argument("raspberries", nargs="*", help="raspberries id (default: all)")
+
+    return parser.parse_args(argv)
+
+
+def print_results(results, as_json, extra=None):
+    """
+    print the result of each raspberry
+
+    Args:
+        results (dict): raspberry id -> (error, message)
+        extra (dict): other results printed after the raspberries (for example the skew of a synchronized capture)
+
+    Returns:
+        int: 1 if at least one error else 0
+    """
+    if as_json:
+        print(json.dumps({**{rb: {"error": error, "message": msg} for rb, (error, msg) in sorted(results.items())},
+                          **(extra or {})}))
+    else:
+        for rb, (error, msg) in sorted(results.items()):
+            print(f'{rb}: {"ERROR" if error else "OK"} {msg}')
+        for key, value in (extra or {}).items():
+            print(f"{key}: {value}")
+    return int(any(error for error, _ in results.values()))
+
+
+def daemon(core, args):
+    """
+    receive the messages of the raspberries and periodically ask their status, synchronize their frames
+    and write the metrics in METRICS_FILE (until SIGTERM or SIGINT)
+    The inventory file is reloaded when it is modified.
+    """
+    from coordinator_core import date_iso
+    from config_coordinator import DAEMON_STATUS_INTERVAL, DAEMON_FETCH_INTERVAL, METRICS_FILE, METRICS_INTERVAL
+
+    stop_event = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop_event.set())
+    signal.signal(signal.SIGINT, lambda signum, frame: stop_event.set())
+
+    def log(msg):
+        print(f"{date_iso()}: {msg}", flush=True)
+
+    core.on_message = lambda d: log(f'{core.rasp_id_of(d)}: {d.get("msg", ", ".join(d.keys()))}')
+
+    def progress(action):
+        return lambda rb, error, msg, done, total: log(f'{action} {rb}: {"ERROR" if error else "OK"} {msg}')
+
+    # monotonic time of the next status request, of the next frames synchronization
+    # and of the next writing of the metrics (counted from the end of the previous one)
+    next_status = next_fetch = next_metrics = time.monotonic()
+    while not stop_event.is_set():
+        if core.registry.reload_if_changed():
+            log(f"{core.registry.path} reloaded: {len(core.registry)} raspberries")
+        # the raspberries removed from the inventory are ignored
+        rasp_ids = [rb for rb in core.targets(group=args.group, tag=args.tag)
+                    if not args.raspberries or rb in args.raspberries]
+        if DAEMON_STATUS_INTERVAL and time.monotonic() >= next_status:
+            core.run_all(core.status, rasp_ids, progress=progress("status"))
+            next_status = time.monotonic() + DAEMON_STATUS_INTERVAL
+        if DAEMON_FETCH_INTERVAL and time.monotonic() >= next_fetch:
+            core.run_all(core.fetch_frames, rasp_ids, progress=progress("fetch"))
+            next_fetch = time.monotonic() + DAEMON_FETCH_INTERVAL
+        if METRICS_FILE and METRICS_INTERVAL and time.monotonic() >= next_metrics:
+            core.run_all(core.metrics, rasp_ids)
+            error, msg = core.export_metrics(METRICS_FILE)
+            if error:
+                log(msg)
+            next_metrics = time.monotonic() + METRICS_INTERVAL
+        deadlines = [deadline for interval, deadline in ((DAEMON_STATUS_INTERVAL, next_status),
+                                                         (DAEMON_FETCH_INTERVAL, next_fetch),
+                                                         (METRICS_FILE and METRICS_INTERVAL, next_metrics)) if interval]
+        # the inventory file is checked at least every second
+        stop_event.wait(max(0, min([time.monotonic() + 1] + deadlines) - time.monotonic()))
+
+    log("stopped")
+    return 0
+
+
+def main(argv=None):
+    args = parse_arguments(argv)
+
+    # imported after parsing the arguments: --help does not need a connection
+    from config_coordinator import (RASPBERRY_LIST, DEVICES_FILE, RESOLUTIONS, DEFAULT_RESOLUTION, DEFAULT_INTERVAL,
+                                    GROUP_CAPTURE_DELAY, METRICS_FILE)
+    from coordinator_core import Coordinator_core
+    from registry import Device_registry
+
+    core = Coordinator_core(Device_registry(DEVICES_FILE, RASPBERRY_LIST))
+    try:
+        rasp_ids = core.targets(args.raspberries, group=args.group, tag=args.tag)
+    except KeyError:
+        print(sys.exc_info()[1], file=sys.stderr)
+        return 2
+
+    if not core.start():
+        print("the receiver can not listen (is the coordinator already running?)", file=sys.stderr)
+        return 2
+
+    try:
+        if args.command == "daemon":
+            return daemon(core, args)
+
+        if args.command == "capture":
+            results, skew = core.group_capture(rasp_ids, args.resolution or RESOLUTIONS[DEFAULT_RESOLUTION],
+                                               prefix=args.prefix,
+                                               delay=args.delay if args.delay is not None else GROUP_CAPTURE_DELAY)
+            return print_results(results, args.json,
+                                 extra={"skew (ms)": round(skew * 1000, 1) if skew is not None else None})
+
+        if args.command == "metrics":
+            results = core.run_all(core.metrics, rasp_ids)
+            output = args.output or METRICS_FILE
+            error, msg = core.export_metrics(output) if output else (False, "")
+            return print_results(results, args.json, extra={"metrics file": msg} if output else None) or int(error)
+
+        if args.command == "status":
+            function = core.status
+        elif args.command == "sync-time":
+            function = core.sync_time
+        elif args.command == "fetch":
+            function = core.fetch_frames
+        elif args.command == "start-timelapse":
+            function = lambda rb: core.start_time_lapse(rb, args.start, args.end,
+                                                        args.interval or DEFAULT_INTERVAL,
+                                                        args.prefix or rb,
+                                                        args.resolution or RESOLUTIONS[DEFAULT_RESOLUTION])
+        return print_results(core.run_all(function, rasp_ids), args.json)
+    finally:
+        core.stop()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,432 @@
+"""
+coordination of the raspberries without graphical interface
+
+Used by the graphical coordinator (bluetooth_coordinator.py) and by the command line
+coordinator (coordinator_cli.py). This module must not import PyQt5.
+"""
+
+import sys
+import json
+import time
+import socket
+import datetime
+import threading
+
+from config_coordinator import *
+from transport import get_transport, WORKER_PORT, COORDINATOR_PORT, COORDINATOR_BULK_PORT
+from protocol import MSG_COMMAND, CODECS
+from connection import Connection_pool
+from receiver import Receiver_server
+from fanout import fan_out
+from replies import Pending_replies
+from frame_sync import Frame_sync
+from metrics import metrics, summary, write_metrics
+
+
+def date_iso():
+    """
+    return current date in ISO 8601 format
+    """
+    return datetime.datetime.now().isoformat().split(".")[0].replace("T", " ")
+
+
+class Coordinator_core:
+    """
+    registry of the raspberries, sending of the requests, reception of the messages and status of each raspberry
+    """
+
+    def __init__(self, registry, on_message=None):
+        """
+        Args:
+            registry (Device_registry): raspberries
+            on_message (callable): called with the received messages that are not replies to a pending request
+        """
+        self.registry = registry
+        self.on_message = on_message
+        # last status received from each raspberry
+        self.last_status = {}
+        # last clock offset measured of each raspberry (offset, round trip) in seconds
+        self.clock_offsets = {}
+        # last metrics received from each raspberry (see metrics.Metrics.entries)
+        self.worker_metrics = {}
+
+        self.transport = get_transport(TRANSPORT, TRANSPORT_OPTIONS)
+        # long-lived connections to the raspberries
+        self.connection_pool = Connection_pool(self.transport, WORKER_PORT, keepalive_interval=KEEPALIVE_INTERVAL,
+                                               hello={"hostname": socket.gethostname(),
+                                                      "address": self.transport.local_address(LISTEN_ADDRESS),
+                                                      "codecs": list(CODECS)},
+                                               preferred_codecs=COMPRESSION_CODECS,
+                                               min_size=COMPRESSION_MIN_SIZE)
+        # requests waiting for a reply
+        self.replies = Pending_replies(lambda address, msg, timeout, request_id:
+                                       self.send_to_address(address, msg, timeout, request_id=request_id))
+        self.server = None
+        # raspberries whose frames are being synchronized
+        self.syncing = set()
+        self.syncing_lock = threading.Lock()
+
+
+    def new_server(self):
+        return Receiver_server(self.transport, LISTEN_ADDRESS, COORDINATOR_PORT, on_message=self.message_received,
+                               received_files_dir=RECEIVED_FILES_DIR,
+                               backlog=RECEIVER_BACKLOG,
+                               max_threads=RECEIVER_MAX_THREADS,
+                               buffer_size=RECEIVER_BUFFER_SIZE,
+                               idle_timeout=CONNECTION_IDLE_TIMEOUT,
+                               on_hello=self.hello_received,
+                               bulk_port=COORDINATOR_BULK_PORT)
+
+
+    def serve_forever(self):
+        """
+        receive the messages of the raspberries (blocking)
+        """
+        self.server = self.new_server()
+        self.server.serve_forever()
+
+
+    def start(self, timeout=5):
+        """
+        receive the messages of the raspberries in a background thread
+
+        Returns:
+            bool: True if the receiver is listening
+        """
+        self.server = self.new_server()
+        threading.Thread(target=self.server.serve_forever, daemon=True, name="receiver_server").start()
+        return self.server.ready.wait(timeout)
+
+
+    def stop(self):
+        if self.server:
+            self.server.stop()
+        self.connection_pool.close_all()
+
+
+    def rasp_id_of(self, d):
+        """
+        return the raspberry id of the sender of message d
+        if hostname not in the registry check bluetooth address
+        """
+        return self.registry.lookup(d.get("hostname", ""), d.get("bluetooth_address", ""))
+
+
+    def targets(self, rasp_ids=None, group="", tag=""):
+        """
+        return the raspberries id with an address (all raspberries if rasp_ids is empty)
+
+        Args:
+            rasp_ids (list): raspberries id
+            group (str): only the raspberries of this group ("" for all)
+            tag (str): only the raspberries with this tag ("" for all)
+
+        Raises:
+            KeyError: if a raspberry id is unknown
+        """
+        for rb in rasp_ids or []:
+            if rb not in self.registry:
+                raise KeyError(f"unknown raspberry: {rb}")
+        return [rb for rb in self.registry.select(rasp_ids, group=group, tag=tag) if self.registry[rb]]
+
+
+    def hello_received(self, metadata):
+        """
+        record the compression codecs accepted by the raspberry
+        """
+        rasp_id = self.rasp_id_of({"hostname": metadata.get("hostname", ""), "bluetooth_address": metadata.get("address", "")})
+        if rasp_id in self.registry:
+            self.connection_pool.set_peer_codecs(self.registry[rasp_id], metadata.get("codecs", []))
+
+
+    def message_received(self, metadata):
+        """
+        update the status of the raspberry, replies to pending requests are not given to on_message
+        """
+        rasp_id = self.rasp_id_of(metadata)
+        if "probe" in metadata:
+            metadata["received epoch"] = time.time()
+        if metadata.get("msg") == "status":
+            self.last_status[rasp_id] = metadata
+        if not self.replies.resolve(rasp_id, metadata) and self.on_message:
+            self.on_message(metadata)
+
+
+    def send_to_address(self, address, msg, timeout=None, request_id=None):
+        """
+        send message to raspberry on port WORKER_PORT
+
+        Args:
+            address (str): address of receiver (bluetooth MAC address, IP address or name)
+            msg (str): message to send
+            timeout (float): connection timeout in seconds (None for no timeout)
+            request_id (int): id of the request echoed by the worker in its reply (None if no reply is waited)
+
+        Returns:
+            bool: True if error
+            str: error message
+        """
+        try:
+            metadata = {"msg": msg} if request_id is None else {"msg": msg, "request_id": request_id}
+            self.connection_pool.send(address, metadata, msg_type=MSG_COMMAND, timeout=timeout)
+            return False, ""
+        except:
+            return True, str(sys.exc_info()[0])
+
+
+    def send(self, rasp_id, msg, timeout=None):
+        """
+        send message to raspberry rasp_id without waiting for a reply
+
+        Returns:
+            bool: True if error
+            str: error message
+        """
+        return self.send_to_address(self.registry[rasp_id], msg, timeout=timeout)
+
+
+    def request(self, rasp_id, msg, timeout=FANOUT_TIMEOUT):
+        """
+        send message to raspberry rasp_id and wait for the reply
+
+        Returns:
+            bool: True if error
+            str: message of the reply or error message
+            dict: reply
+        """
+        try:
+            reply = self.replies.request(rasp_id, self.registry[rasp_id], msg, timeout=timeout)
+        except (OSError, TimeoutError):
+            return True, str(sys.exc_info()[1]), {}
+        return "error" in reply, reply.get("error", reply.get("msg", "")), reply
+
+
+    def status(self, rasp_id, timeout=FANOUT_TIMEOUT):
+        """
+        ask the status of raspberry rasp_id
+
+        Returns:
+            bool: True if error
+            str: status summary or error message
+        """
+        error, msg, reply = self.request(rasp_id, "status", timeout=timeout)
+        if error:
+            return True, msg
+        return reply["status"] != "OK", (f'{reply["status"]}, time: {reply["local time"]}, '
+                                         f'pictures: {reply.get("number of pict", "")}, '
+                                         f'free space: {reply.get("free space (MB)", "")} MB, '
+                                         f'headroom: {reply.get("storage headroom (MB)", "")} MB, '
+                                         f'hours remaining: {reply.get("hours remaining", "")}, '
+                                         f'time lapse running: {reply["time lapse running"]}')
+
+
+    def measure_clock(self, rasp_id, samples=CLOCK_SAMPLES, timeout=FANOUT_TIMEOUT):
+        """
+        estimate the offset of the clock of raspberry rasp_id (NTP-style)
+
+        Each probe records the emission time t0 and the reception time t3 of the coordinator,
+        the raspberry answers with its reception time t1 and its emission time t2.
+        The offset of the probe with the shortest round trip is kept (the least affected by the transfer delays).
+        The offset is sent to the raspberry (applied to the capture times of the frames).
+
+        Returns:
+            bool: True if error
+            str: message
+            float: offset of the raspberry clock (in seconds, positive if the raspberry is ahead)
+            float: round trip time of the best probe (in seconds)
+        """
+        best = None
+        for idx in range(samples):
+            t0 = time.time()
+            error, msg, reply = self.request(rasp_id, f"time_probe|{json.dumps({'t0': t0, 'idx': idx})}", timeout=timeout)
+            if error:
+                return True, msg, None, None
+            t1, t2, t3 = reply["probe"]["t1"], reply["probe"]["t2"], reply["received epoch"]
+            round_trip = (t3 - t0) - (t2 - t1)
+            offset = ((t1 - t0) + (t2 - t3)) / 2
+            if best is None or round_trip < best[1]:
+                best = (offset, round_trip)
+
+        offset, round_trip = best
+        self.clock_offsets[rasp_id] = best
+        error, msg, _ = self.request(rasp_id, f"set_clock_offset|{json.dumps({'offset': offset})}", timeout=timeout)
+        if error:
+            return True, msg, offset, round_trip
+        return False, f"clock offset: {offset:+.3f} s (round trip: {round_trip * 1000:.0f} ms)", offset, round_trip
+
+
+    def sync_time(self, rasp_id, timeout=FANOUT_TIMEOUT):
+        """
+        measure the clock offset of raspberry rasp_id and correct its clock if the offset is larger
+        than CLOCK_CORRECTION_THRESHOLD. The residual offset is applied to the capture times of the frames
+
+        Returns:
+            bool: True if error
+            str: message
+        """
+        error, msg, offset, _ = self.measure_clock(rasp_id, timeout=timeout)
+        if error or abs(offset) <= CLOCK_CORRECTION_THRESHOLD:
+            return error, msg
+
+        error, adjust_msg, _ = self.request(rasp_id, f"adjust_time|{json.dumps({'offset': offset})}", timeout=timeout)
+        if error:
+            return True, f"{msg}, clock NOT corrected: {adjust_msg}"
+        error, residual_msg, _, _ = self.measure_clock(rasp_id, timeout=timeout)
+        return error, f"{msg}, clock corrected, residual {residual_msg}"
+
+
+    def start_time_lapse(self, rasp_id, start, end, interval, prefix, resolution, timeout=FANOUT_TIMEOUT):
+        """
+        start a time lapse on raspberry rasp_id
+
+        Args:
+            start (str): start date time in ISO 8601 format (YYYY-MM-DDTHH:MM:SS)
+            end (str): end date time in ISO 8601 format
+            interval (float): seconds between 2 pictures
+            prefix (str): prefix of the pictures file names
+            resolution (str): resolution (WIDTHxHEIGHT)
+
+        Returns:
+            bool: True if error
+            str: message
+        """
+        command_dict = {"start": start, "end": end, "interval": interval,
+                        "prefix": prefix.replace(" ", "_"), "resolution": resolution}
+        error, msg, _ = self.request(rasp_id,
+                                     "time_lapse|{}".format(json.dumps(command_dict, indent=0, separators=(",", ":"))),
+                                     timeout=timeout)
+        return error or msg != "Time lapse started", msg
+
+
+    def group_capture(self, rasp_ids, resolution, prefix="", delay=GROUP_CAPTURE_DELAY, progress=None):
+        """
+        take a picture with many raspberries at the same time
+
+        The capture time is chosen delay seconds in the future: the requests are sent to all the raspberries
+        (FANOUT_MAX_WORKERS at a time) and the replies are waited after the capture time.
+        Each raspberry takes the picture at the capture time of its own clock corrected by its clock offset
+        and replies with the time its capture ended (the latency of each camera is included in the skew).
+
+        Args:
+            rasp_ids (list): raspberries id
+            resolution (str): resolution (WIDTHxHEIGHT)
+            prefix (str): prefix of the pictures file names ("" for the hostname)
+            delay (float): seconds between the request and the capture
+            progress (callable): called with (raspberry id, error, message, number of done, number of raspberries)
+
+        Returns:
+            dict: raspberry id -> (error, message)
+            float: skew between the first and the last capture (in seconds, None if less than 2 captures)
+        """
+        epoch = time.time() + delay
+        msg = f'capture_at|{json.dumps({"epoch": epoch, "resolution": resolution, "prefix": prefix})}'
+        futures = {}
+
+        def send(rb):
+            futures[rb] = self.replies.submit(rb, self.registry[rb], msg, timeout=FANOUT_TIMEOUT)
+            return False, ""
+
+        results = {rb: result for rb, result in self.run_all(send, rasp_ids).items() if result[0]}
+        if progress:
+            for rb in results:
+                progress(rb, *results[rb], len(results), len(rasp_ids))
+
+        captured = {}
+        for rb, future in futures.items():
+            try:
+                reply = self.replies.wait(rb, msg, future, timeout=max(0, epoch - time.time()) + FANOUT_TIMEOUT)
+                if "error" in reply:
+                    results[rb] = (True, reply["error"])
+                else:
+                    captured[rb] = reply["capture"]["captured"]
+                    results[rb] = (False, (f'picture taken: {reply["capture"]["file_name"]} '
+                                           f'({(captured[rb] - epoch) * 1000:+.1f} ms)'))
+            except TimeoutError:
+                results[rb] = (True, str(sys.exc_info()[1]))
+            if progress:
+                progress(rb, *results[rb], len(results), len(rasp_ids))
+
+        return results, max(captured.values()) - min(captured.values()) if len(captured) > 1 else None
+
+
+    def metrics(self, rasp_id, timeout=FANOUT_TIMEOUT):
+        """
+        ask the metrics of raspberry rasp_id (kept in worker_metrics, see export_metrics)
+
+        Returns:
+            bool: True if error
+            str: summary of the request latencies, capture durations, camera ready latencies and queue depths or error message
+        """
+        error, msg, reply = self.request(rasp_id, "metrics", timeout=timeout)
+        if error:
+            return True, msg
+        self.worker_metrics[rasp_id] = reply["metrics"]
+        summaries = []
+        for entry in reply["metrics"]:
+            if entry["name"] in ("command_seconds", "capture_seconds", "camera_ready_seconds") and entry["value"]["count"]:
+                values = summary(entry)
+                summaries.append(f'{entry["name"]} {"/".join(entry["labels"].values())}: '
+                                 f'n={values["count"]} p50={values["p50"] * 1000:.0f} ms p99={values["p99"] * 1000:.0f} ms')
+            elif entry["type"] == "gauge":
+                summaries.append(f'{entry["name"]}: {entry["value"]}')
+        return False, ", ".join(summaries)
+
+
+    def metrics_entries(self):
+        """
+        return the metrics of the coordinator and the last metrics received from the raspberries
+        (label rasp: raspberry id, "" for the coordinator)
+        """
+        entries = metrics.entries(rasp="")
+        for rasp_id, worker_entries in sorted(self.worker_metrics.items()):
+            entries.extend({**entry, "labels": {**entry["labels"], "rasp": rasp_id}} for entry in worker_entries)
+        return entries
+
+
+    def export_metrics(self, path=METRICS_FILE):
+        """
+        write the metrics of the coordinator and of the raspberries in path (Prometheus text format or CSV)
+
+        Returns:
+            bool: True if error
+            str: message
+        """
+        try:
+            write_metrics(path, self.metrics_entries())
+        except OSError:
+            return True, f"Error writing {path}: {sys.exc_info()[1]}"
+        return False, f"metrics written in {path}"
+
+
+    def fetch_frames(self, rasp_id, progress=None):
+        """
+        pull the new time lapse frames of raspberry rasp_id in RECEIVED_FILES_DIR/rasp_id
+        Only one synchronization of a raspberry runs at a time (both would write the same .part files)
+
+        Returns:
+            bool: True if error
+            str: message
+        """
+        with self.syncing_lock:
+            if rasp_id in self.syncing:
+                return True, "frames synchronization already running"
+            self.syncing.add(rasp_id)
+        try:
+            return Frame_sync(rasp_id, self.registry[rasp_id], self.replies, RECEIVED_FILES_DIR,
+                              chunk_size=SYNC_CHUNK_SIZE, timeout=SYNC_TIMEOUT, progress=progress).run()
+        finally:
+            with self.syncing_lock:
+                self.syncing.discard(rasp_id)
+
+
+    def run_all(self, function, rasp_ids, progress=None):
+        """
+        call function(raspberry id) for many raspberries concurrently
+
+        Args:
+            rasp_ids (list): raspberries id (see targets)
+
+        Returns:
+            dict: raspberry id -> (error, message)
+        """
+        return fan_out(rasp_ids, function, max_workers=FANOUT_MAX_WORKERS, progress=progress)
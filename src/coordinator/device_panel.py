@@ -0,0 +1,97 @@
+"""
+detail panel of a raspberry in the coordinator interface (log, last preview and commands)
+
+The panels are only created when the raspberry is opened from the dashboard.
+"""
+
+from functools import partial
+
+from PyQt5.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QLabel, QPushButton, QComboBox,
+                             QDateTimeEdit, QDoubleSpinBox, QLineEdit)
+from PyQt5.QtCore import Qt, QDateTime
+
+from log_view import Log_view
+
+
+class Device_panel(QWidget):
+
+    def __init__(self, rb, coordinator, device_log, resolutions, default_resolution,
+                 min_interval, default_interval, parent=None):
+        """
+        Args:
+            rb (str): raspberry id
+            coordinator (Coordinator): main window (the buttons call its methods with rb)
+            device_log (Device_log): log of the raspberry
+        """
+        super().__init__(parent)
+        self.rb = rb
+
+        l = QVBoxLayout()
+        l.addWidget(QLabel(rb))
+
+        self.log_view = Log_view(device_log)
+        l.addWidget(self.log_view)
+
+        # last time lapse preview
+        self.preview = QLabel("No preview")
+        self.preview.setAlignment(Qt.AlignCenter)
+        l.addWidget(self.preview)
+
+        l2 = QHBoxLayout()
+        for label, method in (("Status", coordinator.status),
+                              ("Sync time", coordinator.sync_time),
+                              ("Get log", coordinator.get_log),
+                              ("Send command", coordinator.send_command),
+                              ("Clear output", coordinator.clear_log)):
+            l2.addWidget(QPushButton(label, clicked=partial(method, rb)))
+        l.addLayout(l2)
+
+        l2 = QHBoxLayout()
+        l2.addWidget(QLabel("Resolution"))
+        self.resolution = QComboBox()
+        for resol in resolutions:
+            self.resolution.addItem(resol)
+        self.resolution.setCurrentIndex(default_resolution)
+        l2.addWidget(self.resolution)
+        l.addLayout(l2)
+
+        l2 = QHBoxLayout()
+        l2.addWidget(QPushButton("Take one picture", clicked=partial(coordinator.one_picture, rb)))
+        l2.addWidget(QPushButton("Sync frames", clicked=partial(coordinator.sync_frames, rb)))
+        l.addLayout(l2)
+
+        l2 = QHBoxLayout()
+        l2.addWidget(QPushButton("Start time lapse", clicked=partial(coordinator.start_time_lapse, rb)))
+        l2.addWidget(QPushButton("Stop time lapse", clicked=partial(coordinator.stop_time_lapse, rb)))
+        l.addLayout(l2)
+
+        l2 = QHBoxLayout()
+        l2.addWidget(QLabel("Start"))
+        self.start_time = QDateTimeEdit()
+        self.start_time.setDateTime(QDateTime.currentDateTime())
+        self.start_time.setDisplayFormat("yyyy-MM-dd hh:mm:ss")
+        l2.addWidget(self.start_time)
+        l.addLayout(l2)
+
+        l2 = QHBoxLayout()
+        l2.addWidget(QLabel("End"))
+        self.end_time = QDateTimeEdit()
+        self.end_time.setDateTime(QDateTime.currentDateTime())
+        self.end_time.setDisplayFormat("yyyy-MM-dd hh:mm:ss")
+        l2.addWidget(self.end_time)
+        l.addLayout(l2)
+
+        l2 = QHBoxLayout()
+        l2.addWidget(QLabel("Interval"))
+        self.interval = QDoubleSpinBox()
+        self.interval.setDecimals(1)
+        self.interval.setMinimum(min_interval)
+        self.interval.setMaximum(86400)
+        self.interval.setValue(default_interval)
+        l2.addWidget(self.interval)
+        l2.addWidget(QLabel("Prefix"))
+        self.prefix = QLineEdit(rb)
+        l2.addWidget(self.prefix)
+        l.addLayout(l2)
+
+        self.setLayout(l)
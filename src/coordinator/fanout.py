@@ -0,0 +1,45 @@
+"""
+send the same request to many raspberries concurrently
+
+The number of simultaneous connections is limited (max_workers):
+a bluetooth adapter can only open a few RFCOMM connections at the same time.
+"""
+
+import sys
+import concurrent.futures
+
+
+def fan_out(targets, function, max_workers=3, progress=None):
+    """
+    call function(target) for all targets using a bounded pool of threads
+
+    Args:
+        targets (list): raspberries id
+        function (callable): function(target) returning (bool error, str message).
+                             The function must enforce its own timeout (for example the connection timeout)
+        max_workers (int): maximum number of concurrent calls
+        progress (callable): called with (target, error, message, number of done, number of targets)
+                             each time a call is finished
+
+    Returns:
+        dict: target -> (error, message)
+    """
+
+    results = {}
+    if not targets:
+        return results
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(targets))),
+                                               thread_name_prefix="fan_out") as executor:
+        futures = {executor.submit(function, target): target for target in targets}
+        for future in concurrent.futures.as_completed(futures):
+            target = futures[future]
+            try:
+                error, msg = future.result()
+            except Exception:
+                error, msg = True, str(sys.exc_info()[1])
+            results[target] = (error, msg)
+            if progress:
+                progress(target, bool(error), str(msg), len(results), len(targets))
+
+    return results
@@ -0,0 +1,130 @@
+"""
+table model of the raspberries (one row per raspberry) for the coordinator dashboard
+
+The values are updated with set_values; the views are notified by batches on a timer
+(one dataChanged signal for all the rows updated meanwhile).
+"""
+
+import time
+
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex, QTimer
+from PyQt5.QtGui import QColor
+
+# column title, key in the values of a raspberry
+COLUMNS = [("Raspberry", "id"),
+           ("Groups / tags", "groups"),
+           ("Status", "status"),
+           ("Clock offset (s)", "clock offset"),
+           ("Round trip (ms)", "round trip"),
+           ("Time lapse", "time lapse"),
+           ("Frames", "frames"),
+           ("Free space (MB)", "free space"),
+           ("Hours remaining", "hours remaining"),
+           ("Last seen", "last seen"),
+          ]
+
+STATUS_COLORS = {"OK": QColor("#80ff80"), "error": QColor("#ff8080")}
+
+
+class Fleet_model(QAbstractTableModel):
+
+    def __init__(self, registry, refresh_interval=200, max_time_difference=10, parent=None):
+        """
+        Args:
+            registry (Device_registry): raspberries (one row each, in the order of the registry)
+            refresh_interval (int): delay (in milliseconds) between two notifications of the views
+            max_time_difference (float): clock offsets larger than this value (in seconds) are highlighted
+        """
+        super().__init__(parent)
+        self.rasp_ids, self.row_of, self.values = [], {}, []
+        self.max_time_difference = max_time_difference
+        self.dirty_rows = set()
+        self.set_registry(registry)
+
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(refresh_interval)
+        self.timer.timeout.connect(self.flush)
+
+
+    def set_registry(self, registry):
+        """
+        rebuild the rows from the registry (after a reload), the values of the remaining raspberries are kept
+        """
+        self.beginResetModel()
+        old_values = {rasp_id: self.values[row] for rasp_id, row in self.row_of.items()}
+        self.rasp_ids = list(registry.ids)
+        self.row_of = dict(registry.position)
+        self.values = [{**old_values.get(rasp_id, {}),
+                        "id": rasp_id,
+                        "groups": ", ".join(registry.devices[rasp_id]["groups"] + registry.devices[rasp_id]["tags"])}
+                       for rasp_id in self.rasp_ids]
+        self.dirty_rows = set()
+        self.endResetModel()
+
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rasp_ids)
+
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(COLUMNS)
+
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return COLUMNS[section][0]
+        return None
+
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        key = COLUMNS[index.column()][1]
+        value = self.values[index.row()].get(key)
+
+        if role == Qt.DisplayRole:
+            if value is None:
+                return ""
+            if key == "last seen":
+                return time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(value))
+            if key == "clock offset":
+                return f"{value:+.3f}"
+            if key == "round trip":
+                return f"{value * 1000:.0f}"
+            return str(value)
+
+        # raw values for sorting
+        if role == Qt.UserRole:
+            return value if value is not None else ""
+
+        if role == Qt.BackgroundRole:
+            if key == "status":
+                return STATUS_COLORS.get(value)
+            if key == "clock offset" and value is not None and abs(value) > self.max_time_difference:
+                return STATUS_COLORS["error"]
+        return None
+
+
+    def set_values(self, rasp_id, **values):
+        """
+        update the values of raspberry rasp_id (keys of COLUMNS), the views are notified by flush
+        """
+        if rasp_id not in self.row_of:
+            return
+        row = self.row_of[rasp_id]
+        self.values[row].update(values)
+        self.dirty_rows.add(row)
+        if not self.timer.isActive():
+            self.timer.start()
+
+
+    def flush(self):
+        """
+        notify the views of the rows updated since the last flush
+        """
+        if not self.dirty_rows:
+            return
+        first, last = min(self.dirty_rows), max(self.dirty_rows)
+        self.dirty_rows = set()
+        self.dataChanged.emit(self.index(first, 0), self.index(last, len(COLUMNS) - 1))
@@ -0,0 +1,138 @@
+"""
+resumable incremental transfer of the time lapse frames from a raspberry
+
+The coordinator asks the manifest of the frames saved after a cursor (name, size and CRC32 of each frame)
+and pulls the missing frames by chunks. The frames are saved in RECEIVED_FILES_DIR/raspberry id/.
+A partial frame is kept in a .part file and the transfer restarts from its size after a disconnection.
+The cursor is saved in the .sync_state.json file when all the frames of a manifest are received
+and the raspberry is told that the frames up to the cursor are confirmed (they can be deleted when the space is needed).
+"""
+
+import os
+import json
+import pathlib
+import binascii
+
+STATE_FILE = ".sync_state.json"
+
+
+def file_crc32(path):
+    crc = 0
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            crc = binascii.crc32(block, crc)
+    return crc
+
+
+class Frame_sync:
+    """
+    synchronize the frames of one raspberry
+    """
+
+    def __init__(self, rasp_id, address, replies, directory, chunk_size=262144, timeout=60, progress=None):
+        """
+        Args:
+            rasp_id (str): raspberry id
+            address (str): raspberry address
+            replies (Pending_replies): used for sending the requests and waiting for the replies
+            directory (str): directory where the frames are saved (a sub-directory is created for the raspberry)
+            chunk_size (int): size of the chunks requested
+            timeout (float): maximum time (in seconds) to wait for a reply
+            progress (callable): called with a message after each frame
+        """
+        self.rasp_id = rasp_id
+        self.address = address
+        self.replies = replies
+        self.directory = pathlib.Path(directory) / rasp_id
+        self.chunk_size = chunk_size
+        self.timeout = timeout
+        self.progress = progress
+        self.frames_received = 0
+        self.bytes_received = 0
+
+    def request(self, command, params):
+        reply = self.replies.request(self.rasp_id, self.address,
+                                     f"{command}|{json.dumps(params, separators=(',', ':'), sort_keys=True)}",
+                                     timeout=self.timeout)
+        if "error" in reply:
+            raise OSError(f"{self.rasp_id}: {reply['error']}")
+        return reply
+
+    def load_cursor(self):
+        try:
+            with open(self.directory / STATE_FILE) as f:
+                return json.load(f)["cursor"]
+        except (OSError, ValueError, KeyError):
+            return ""
+
+    def save_cursor(self, cursor):
+        temp = self.directory / (STATE_FILE + ".tmp")
+        with open(temp, "w") as f:
+            json.dump({"cursor": cursor}, f)
+        os.replace(temp, self.directory / STATE_FILE)
+
+    def fetch_frame(self, name, size, crc, mtime=None):
+        """
+        pull a frame by chunks (resume the .part file if any)
+        The modification time of the frame is set to its capture time corrected by the clock offset of the raspberry
+
+        Returns:
+            bool: True if the frame was received, False if it was already present
+        """
+        destination = self.directory / pathlib.Path(name).name
+        if destination.is_file() and destination.stat().st_size == size:
+            return False
+
+        part = destination.with_name(destination.name + ".part")
+        offset = part.stat().st_size if part.is_file() else 0
+        if offset > size:
+            part.unlink()
+            offset = 0
+
+        with open(part, "ab") as f:
+            while offset < size:
+                reply = self.request("get_chunk", {"name": name, "offset": offset, "length": self.chunk_size})
+                chunk = reply.get("payloads", {}).get("chunk", b"")
+                if not chunk:
+                    raise OSError(f"{self.rasp_id}: empty chunk for {name} at offset {offset}")
+                f.write(chunk)
+                offset += len(chunk)
+                self.bytes_received += len(chunk)
+
+        if file_crc32(part) != crc:
+            part.unlink()
+            raise OSError(f"{self.rasp_id}: CRC error for {name}")
+        os.replace(part, destination)
+        if mtime is not None:
+            os.utime(destination, (mtime, mtime))
+        self.frames_received += 1
+        return True
+
+    def run(self):
+        """
+        pull all the new frames
+
+        Returns:
+            bool: True if error
+            str: result message
+        """
+        self.directory.mkdir(parents=True, exist_ok=True)
+        cursor = self.load_cursor()
+        try:
+            while True:
+                manifest = self.request("manifest", {"since": cursor})["manifest"]
+                for frame in manifest["frames"]:
+                    # frame: name, size, CRC32 and capture time (not sent by the older workers)
+                    if self.fetch_frame(*frame) and self.progress:
+                        self.progress(f"frame received: {frame[0]}")
+                cursor = manifest["cursor"]
+                self.save_cursor(cursor)
+                if manifest["frames"]:
+                    self.request("confirm_frames", {"cursor": cursor})
+                if manifest["complete"]:
+                    break
+        except (OSError, TimeoutError) as exc:
+            return True, (f"frames synchronization interrupted ({self.frames_received} frames received, "
+                          f"it will be resumed): {exc}")
+
+        return False, f"frames synchronized: {self.frames_received} frames received ({self.bytes_received / 1e6:.1f} MB)"
@@ -0,0 +1,104 @@
+"""
+log of a raspberry in the coordinator interface
+
+Device_log keeps the last lines of a raspberry (ring buffer of max_lines lines) and
+writes the full history in a file on disk. The lines are queued and processed by batches
+(flush is called on a timer by the coordinator: one repaint for many messages).
+Log_view is the widget displaying a Device_log, it is only created when the detail panel of the raspberry is opened.
+"""
+
+import collections
+
+from PyQt5.QtWidgets import QPlainTextEdit
+from PyQt5.QtGui import QFont
+
+
+class Device_log:
+
+    def __init__(self, history_file="", max_lines=5000):
+        """
+        Args:
+            history_file (str): path of the file where all the lines are appended ("" for no history)
+            max_lines (int): maximum number of lines kept in memory
+        """
+        self.history_file = history_file
+        self.lines = collections.deque(maxlen=max_lines)
+        self.pending = []
+        # widget displaying the log (None if the detail panel is not opened)
+        self.view = None
+
+
+    def append(self, text):
+        """
+        queue text (one or many lines), processed by flush
+        """
+        self.pending.append(text.rstrip("\n"))
+
+
+    def flush(self):
+        """
+        keep the queued lines, write them in the history file and display them
+        """
+        if not self.pending:
+            return
+        text = "\n".join(self.pending)
+        self.pending = []
+        self.lines.extend(text.split("\n"))
+
+        if self.history_file:
+            try:
+                with open(self.history_file, "a", encoding="utf-8") as f_out:
+                    f_out.write(text + "\n")
+            except OSError:
+                # the history is not essential, the lines are still displayed
+                pass
+
+        if self.view is not None:
+            self.view.add(text)
+
+
+    def clear(self):
+        """
+        clear the lines in memory and the widget (the history file is kept)
+        """
+        self.pending = []
+        self.lines.clear()
+        if self.view is not None:
+            self.view.clear()
+
+
+class Log_view(QPlainTextEdit):
+
+    def __init__(self, device_log, parent=None):
+        """
+        Args:
+            device_log (Device_log): log displayed (the lines already in memory are displayed)
+        """
+        super().__init__(parent)
+        self.setReadOnly(True)
+        self.setLineWrapMode(QPlainTextEdit.NoWrap)
+        self.setMaximumBlockCount(device_log.lines.maxlen)
+        self.setFont(QFont("Courier"))
+
+        self.device_log = device_log
+        if device_log.lines:
+            self.appendPlainText("\n".join(device_log.lines))
+        device_log.view = self
+
+
+    def detach(self):
+        """
+        stop displaying the log (before destroying the widget)
+        """
+        self.device_log.view = None
+
+
+    def add(self, text):
+        """
+        append text, the view stays at the end only if the user did not scroll up
+        """
+        scroll_bar = self.verticalScrollBar()
+        at_end = scroll_bar.value() == scroll_bar.maximum()
+        self.appendPlainText(text)
+        if at_end:
+            scroll_bar.setValue(scroll_bar.maximum())
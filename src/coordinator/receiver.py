@@ -0,0 +1,233 @@
+"""
+multi-client server receiving the messages of the raspberries
+
+One listening socket is kept open for the whole session.
+The open connections are watched with a selector and, when a message arrives on a connection,
+the message is read by a thread of a bounded pool: messages from many raspberries are received in parallel.
+The reception times, the bytes received (label peer: hostname of the raspberry), the number of open connections
+and the number of messages waiting for a thread of the pool are recorded in metrics.
+"""
+
+import os
+import sys
+import time
+import threading
+import pathlib
+import queue
+import socket
+import selectors
+import tempfile
+import concurrent.futures
+
+from protocol import recv_message, ProtocolError, MSG_KEEPALIVE, MSG_HELLO
+from metrics import metrics, SIZE_BUCKETS
+
+
+class Picture_file:
+    """
+    stream the "picture" payload section of a message to a temporary file in directory.
+    The file is renamed atomically when the message is complete.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.temp_file = None
+
+    def sink(self, name, size, metadata):
+        """
+        payload_sink for protocol.recv_message
+        """
+        if name != "picture":
+            return None
+        self.temp_file = tempfile.NamedTemporaryFile(dir=self.directory, prefix=".receiving_", suffix=".part", delete=False)
+        return self.temp_file
+
+    def commit(self, file_name):
+        """
+        rename the temporary file
+
+        Returns:
+            str: path of picture file
+        """
+        self.temp_file.close()
+        path = str(pathlib.Path(self.directory) / pathlib.Path(file_name).name)
+        os.replace(self.temp_file.name, path)
+        return path
+
+    def discard(self):
+        """
+        remove the temporary file of an incomplete transmission
+        """
+        if self.temp_file:
+            self.temp_file.close()
+            if os.path.isfile(self.temp_file.name):
+                os.remove(self.temp_file.name)
+
+
+class Receiver_server:
+    """
+    server receiving the messages of many raspberries concurrently
+    """
+
+    def __init__(self, transport, address, port, on_message,
+                 received_files_dir="/tmp/", backlog=16, max_threads=8, buffer_size=65536, idle_timeout=120,
+                 on_hello=None, bulk_port=None):
+        """
+        Args:
+            transport (Transport): transport used to listen
+            address (str): local address to bind
+            port (int): port to listen on
+            on_message (callable): called with the metadata (dict) of each received message
+                                   (the payload sections that are not pictures are in metadata["payloads"])
+            received_files_dir (str): directory where the received pictures are saved
+            backlog (int): number of pending connections
+            max_threads (int): maximum number of messages read at the same time
+            buffer_size (int): size of a single read
+            idle_timeout (float): connections without activity for this time (in seconds) are closed
+            on_hello (callable): called with the metadata of the hello messages (codecs supported by the raspberry)
+            bulk_port (int): second port to listen on (replies with large payloads), None for none
+        """
+        self.transport = transport
+        self.address = address
+        self.port = port
+        self.bulk_port = bulk_port
+        self.on_message = on_message
+        self.received_files_dir = received_files_dir
+        self.backlog = backlog
+        self.max_threads = max_threads
+        self.buffer_size = buffer_size
+        self.idle_timeout = idle_timeout
+        self.on_hello = on_hello
+
+        self.selector = selectors.DefaultSelector()
+        # connections returned by the reading threads, re-registered by the selector loop
+        self.returned = queue.Queue()
+        self.wakeup_r, self.wakeup_w = socket.socketpair()
+        self.last_activity = {}
+        self.running = False
+        # set when the server is listening
+        self.ready = threading.Event()
+        # messages arrived and waiting for a thread of the pool
+        self.waiting = 0
+        self.waiting_lock = threading.Lock()
+        metrics.set_gauge("receiver_waiting_messages", lambda: self.waiting)
+        metrics.set_gauge("receiver_open_connections", lambda: len(self.last_activity))
+
+    def serve_forever(self):
+        """
+        accept connections and dispatch the incoming messages to the pool of threads
+        """
+        server_socks = [self.transport.listen(self.address, self.port, backlog=self.backlog)]
+        if self.bulk_port is not None:
+            try:
+                server_socks.append(self.transport.listen(self.address, self.bulk_port, backlog=self.backlog))
+            except OSError:
+                # same address as port (tcp address with explicit port): the bulk connections arrive on port
+                print(f"bulk port not available: {sys.exc_info()[1]}", file=sys.stderr)
+        for server_sock in server_socks:
+            self.selector.register(server_sock, selectors.EVENT_READ)
+        self.selector.register(self.wakeup_r, selectors.EVENT_READ)
+        self.running = True
+        self.ready.set()
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_threads,
+                                                   thread_name_prefix="receiver") as executor:
+            while self.running:
+                for key, _ in self.selector.select(timeout=1):
+                    if key.fileobj in server_socks:
+                        client_sock, address = key.fileobj.accept()
+                        print("Accepted connection from " + str(address), file=sys.stderr)
+                        client_sock.settimeout(self.idle_timeout)
+                        self.watch(client_sock)
+                    elif key.fileobj is self.wakeup_r:
+                        self.wakeup_r.recv(4096)
+                        while not self.returned.empty():
+                            self.watch(self.returned.get())
+                    else:
+                        # a message is arriving: read it in a thread
+                        self.selector.unregister(key.fileobj)
+                        with self.waiting_lock:
+                            self.waiting += 1
+                        executor.submit(self.read_message, key.fileobj)
+                self.close_idle()
+
+        for server_sock in server_socks:
+            server_sock.close()
+
+    def stop(self):
+        self.running = False
+        self.wakeup_w.send(b"x")
+
+    def watch(self, client_sock):
+        self.last_activity[client_sock] = time.monotonic()
+        self.selector.register(client_sock, selectors.EVENT_READ)
+
+    def close_idle(self):
+        """
+        close the connections without activity for more than idle_timeout seconds
+        """
+        now = time.monotonic()
+        for client_sock, last_activity in list(self.last_activity.items()):
+            if now - last_activity > self.idle_timeout:
+                try:
+                    self.selector.unregister(client_sock)
+                except KeyError:
+                    # being read by a thread
+                    continue
+                self.close(client_sock)
+
+    def close(self, client_sock):
+        self.last_activity.pop(client_sock, None)
+        try:
+            client_sock.close()
+        except OSError:
+            pass
+
+    def read_message(self, client_sock):
+        """
+        read one message from a connection and give the connection back to the selector
+        """
+        with self.waiting_lock:
+            self.waiting -= 1
+        time1 = time.monotonic()
+        picture_file = Picture_file(self.received_files_dir)
+        stats = {}
+        try:
+            message = recv_message(client_sock, self.buffer_size, payload_sink=picture_file.sink, stats=stats)
+        except Exception:
+            print("Error " + str(sys.exc_info()[1]), file=sys.stderr)
+            picture_file.discard()
+            message = None
+        if message is None:
+            self.close(client_sock)
+            return
+
+        # the message was read entirely: the connection is given back even if the message is wrong
+        try:
+            self.dispatch(message, picture_file, stats, time1)
+        except Exception:
+            print("Error " + str(sys.exc_info()[1]), file=sys.stderr)
+            picture_file.discard()
+        finally:
+            self.returned.put(client_sock)
+            self.wakeup_w.send(b"x")
+
+    def dispatch(self, message, picture_file, stats, time1):
+        """
+        give a received message to on_hello or on_message (the streamed picture is saved under its file name)
+        """
+        msg_type, _, metadata, payloads = message
+        if msg_type == MSG_HELLO:
+            if self.on_hello:
+                self.on_hello(metadata)
+        elif msg_type != MSG_KEEPALIVE:
+            peer = metadata.get("hostname", "")
+            metrics.observe("receive_seconds", time.monotonic() - time1, peer=peer)
+            metrics.observe("received_message_bytes", stats["bytes"], buckets=SIZE_BUCKETS, peer=peer)
+            metrics.inc("received_bytes_total", stats["bytes"], peer=peer)
+            if picture_file.temp_file:
+                metadata["picture"]["path"] = picture_file.commit(metadata["picture"]["file_name"])
+            # small payload sections (previews) are given with the metadata
+            if payloads:
+                metadata["payloads"] = payloads
+            self.on_message(metadata)
@@ -0,0 +1,180 @@
+"""
+registry of the raspberries
+
+The raspberries are read from an inventory file (JSON or CSV) or from the RASPBERRY_LIST dictionary.
+The lookups by id (hostname), by address and the display position are precomputed when the registry is loaded.
+The inventory file is reloaded when it is modified (reload_if_changed).
+
+JSON inventory:
+
+    {"rasp00": {"address": "b8:27:eb:0b:06:8c", "groups": ["garden"], "tags": ["noir"]},
+     "rasp01": {"address": "b8:27:eb:42:d2:32"}}
+
+CSV inventory (groups and tags separated by ;):
+
+    id,address,groups,tags
+    rasp00,b8:27:eb:0b:06:8c,garden,noir
+    rasp01,b8:27:eb:42:d2:32,,
+"""
+
+import os
+import sys
+import csv
+import json
+
+
+def normalize_address(address):
+    """
+    return the address in a form usable as key (MAC addresses are case insensitive)
+    """
+    return address.strip().upper()
+
+
+def read_inventory(path):
+    """
+    read the inventory file
+
+    Args:
+        path (str): path of a .json or .csv file
+
+    Returns:
+        dict: raspberry id -> {"address": str, "groups": list, "tags": list}
+
+    Raises:
+        OSError: if the file can not be read
+        ValueError: if the file content is not valid
+    """
+    devices = {}
+    if path.lower().endswith(".csv"):
+        with open(path, newline="", encoding="utf-8") as f_in:
+            reader = csv.DictReader(f_in)
+            if not reader.fieldnames or "id" not in reader.fieldnames:
+                raise ValueError("the first line must contain the column names (id, address, groups, tags)")
+            for row in reader:
+                if not row.get("id"):
+                    continue
+                devices[row["id"].strip()] = {"address": (row.get("address") or "").strip(),
+                                              "groups": [x.strip() for x in (row.get("groups") or "").split(";") if x.strip()],
+                                              "tags": [x.strip() for x in (row.get("tags") or "").split(";") if x.strip()]}
+    else:
+        with open(path, encoding="utf-8") as f_in:
+            content = json.load(f_in)
+        if not isinstance(content, dict):
+            raise ValueError("the inventory must be a JSON object (raspberry id -> device)")
+        for rasp_id, device in content.items():
+            if isinstance(device, str):
+                device = {"address": device}
+            devices[rasp_id] = {"address": device.get("address", ""),
+                                "groups": list(device.get("groups", [])),
+                                "tags": list(device.get("tags", []))}
+    return devices
+
+
+class Device_registry:
+    """
+    raspberries with precomputed lookups
+
+    The registry can be used as the RASPBERRY_LIST dictionary (raspberry id -> address).
+    """
+
+    def __init__(self, path="", devices=None):
+        """
+        Args:
+            path (str): inventory file (JSON or CSV), "" to use devices
+            devices (dict): raspberry id -> address (used if path is empty)
+        """
+        self.path = path
+        self.mtime = None
+        self.set_devices({rasp_id: {"address": address, "groups": [], "tags": []}
+                          for rasp_id, address in (devices or {}).items()})
+        if path:
+            self.reload_if_changed()
+
+
+    def set_devices(self, devices):
+        """
+        build the lookup tables and replace the current ones
+        """
+        ids = sorted(devices.keys())
+        by_address = {normalize_address(devices[rasp_id]["address"]): rasp_id
+                      for rasp_id in ids if devices[rasp_id]["address"]}
+        position = {rasp_id: idx for idx, rasp_id in enumerate(ids)}
+        groups, tags = {}, {}
+        for rasp_id in ids:
+            for group in devices[rasp_id]["groups"]:
+                groups.setdefault(group, set()).add(rasp_id)
+            for tag in devices[rasp_id]["tags"]:
+                tags.setdefault(tag, set()).add(rasp_id)
+        self.devices, self.ids, self.by_address, self.position, self.groups, self.tags = (devices, ids, by_address,
+                                                                                         position, groups, tags)
+
+
+    def reload_if_changed(self):
+        """
+        reload the inventory file if it was modified since the last loading
+
+        Returns:
+            bool: True if the registry was reloaded
+        """
+        if not self.path:
+            return False
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            return False
+        if mtime == self.mtime:
+            return False
+        try:
+            devices = read_inventory(self.path)
+        except (OSError, ValueError):
+            # a file being edited can be invalid: the current registry is kept until the next modification
+            print(f"Error reading {self.path}: {sys.exc_info()[1]}")
+            self.mtime = mtime
+            return False
+        self.mtime = mtime
+        self.set_devices(devices)
+        return True
+
+
+    def lookup(self, hostname="", address=""):
+        """
+        return the raspberry id from its hostname or its address ("" if not found)
+        """
+        if hostname in self.devices:
+            return hostname
+        return self.by_address.get(normalize_address(address), "")
+
+
+    def select(self, rasp_ids=None, group="", tag=""):
+        """
+        return the raspberries id (sorted) matching all the criteria
+
+        Args:
+            rasp_ids (list): raspberries id (None or empty for all)
+            group (str): group the raspberries must belong to ("" for all)
+            tag (str): tag the raspberries must have ("" for all)
+        """
+        selected = list(rasp_ids) if rasp_ids else self.ids
+        if group:
+            selected = [rasp_id for rasp_id in selected if rasp_id in self.groups.get(group, ())]
+        if tag:
+            selected = [rasp_id for rasp_id in selected if rasp_id in self.tags.get(tag, ())]
+        return selected
+
+
+    # dictionary interface (raspberry id -> address)
+
+    def __getitem__(self, rasp_id):
+        return self.devices[rasp_id]["address"]
+
+    def __contains__(self, rasp_id):
+        return rasp_id in self.devices
+
+    def __iter__(self):
+        return iter(self.ids)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def keys(self):
+        return self.ids
@@ -0,0 +1,134 @@
+"""
+wait for the reply of a raspberry to a request
+
+Each request is sent with its own id (request_id) that the worker echoes in its reply with the request
+("reply_to" field): a reply is identified by the raspberry id and the request id, so that identical requests
+sent at the same time get their own reply. The replies of the workers not sending the request id
+are given to the oldest request of the same message.
+The time between the sending of a request and its reply is recorded in metrics
+(histogram request_seconds, labels command and peer: raspberry id).
+"""
+
+import time
+import itertools
+import threading
+import concurrent.futures
+
+from metrics import metrics
+
+
+def command_of(msg):
+    """
+    return the command of a request (for example "status" or "get_chunk")
+    """
+    return msg.split("|")[0]
+
+
+class Pending_replies:
+    """
+    requests waiting for their reply
+    """
+
+    def __init__(self, send):
+        """
+        Args:
+            send (callable): send(address, msg, timeout, request_id) returning (bool error, str message)
+        """
+        self.send = send
+        # (raspberry id, request id) -> (request, future of the reply)
+        self.pending = {}
+        # time when each pending request was sent
+        self.sent_at = {}
+        self.request_ids = itertools.count(1)
+        self.lock = threading.Lock()
+        metrics.set_gauge("pending_requests", lambda: len(self.pending))
+
+    def request(self, rasp_id, address, msg, timeout=30):
+        """
+        send msg to the raspberry and wait for its reply
+
+        Args:
+            rasp_id (str): raspberry id
+            address (str): raspberry address
+            msg (str): request
+            timeout (float): maximum time (in seconds) to wait for the reply
+
+        Returns:
+            dict: reply
+
+        Raises:
+            OSError: if the request can not be sent
+            TimeoutError: if no reply was received in time
+        """
+        return self.wait(rasp_id, msg, self.submit(rasp_id, address, msg, timeout), timeout)
+
+    def submit(self, rasp_id, address, msg, timeout=30):
+        """
+        send msg to the raspberry without waiting for its reply (see wait)
+
+        Args:
+            timeout (float): connection timeout (in seconds)
+
+        Returns:
+            concurrent.futures.Future: future of the reply (request_id attribute: id of the request)
+
+        Raises:
+            OSError: if the request can not be sent
+        """
+        future = concurrent.futures.Future()
+        with self.lock:
+            future.request_id = next(self.request_ids)
+            key = (rasp_id, future.request_id)
+            self.pending[key] = (msg, future)
+            self.sent_at[key] = time.monotonic()
+        error, error_msg = self.send(address, msg, timeout, future.request_id)
+        if error:
+            with self.lock:
+                self.pending.pop(key, None)
+                self.sent_at.pop(key, None)
+            raise OSError(f"{rasp_id}: {error_msg}")
+        return future
+
+    def wait(self, rasp_id, msg, future, timeout=30):
+        """
+        wait for the reply of a request sent with submit
+
+        Returns:
+            dict: reply
+
+        Raises:
+            TimeoutError: if no reply was received in time
+        """
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            metrics.inc("request_timeouts_total", command=command_of(msg), peer=rasp_id)
+            raise TimeoutError(f"{rasp_id}: no reply to {command_of(msg)} after {timeout} s")
+        finally:
+            with self.lock:
+                self.pending.pop((rasp_id, future.request_id), None)
+                self.sent_at.pop((rasp_id, future.request_id), None)
+
+    def resolve(self, rasp_id, reply):
+        """
+        give a received message to the request waiting for it
+
+        Returns:
+            bool: True if a request was waiting for this reply
+        """
+        if "reply_to" not in reply:
+            return False
+        with self.lock:
+            if "request_id" in reply:
+                key = (rasp_id, reply["request_id"])
+            else:
+                # worker not sending the request id: oldest request of the same message
+                key = next((key for key, (msg, _) in self.pending.items()
+                            if key[0] == rasp_id and msg == reply["reply_to"]), None)
+            if key not in self.pending:
+                return False
+            _, future = self.pending.pop(key)
+            sent_at = self.sent_at.pop(key)
+        metrics.observe("request_seconds", time.monotonic() - sent_at, command=command_of(reply["reply_to"]), peer=rasp_id)
+        future.set_result(reply)
+        return True
@@ -0,0 +1,189 @@
+"""
+transport layer used by coordinator and worker
+
+This file is shared by the coordinator and the worker:
+src/coordinator/transport.py and src/worker/transport.py must be kept identical.
+
+Available transports:
+
+    "bluetooth": RFCOMM bluetooth sockets (pybluez). Addresses are bluetooth MAC addresses
+    "tcp": TCP/IP sockets (Wi-Fi, Ethernet or loopback). Addresses are "host" or "host:port"
+    "unix": Unix domain sockets (several workers on the same Linux machine). Addresses are names
+
+The coordinator listens on COORDINATOR_PORT and COORDINATOR_BULK_PORT, the workers listen on WORKER_PORT.
+"""
+
+import os
+import pathlib
+import socket
+
+# RFCOMM channels (ports) used by the worker and the coordinator
+WORKER_PORT = 1
+COORDINATOR_PORT = 2
+# replies of the workers with large payloads (pictures, chunks, logs): a RFCOMM channel carries only one connection
+# between two devices, the small replies are not queued behind them on COORDINATOR_PORT
+COORDINATOR_BULK_PORT = 3
+
+
+class Transport:
+    """
+    base class of transports
+    """
+
+    name = ""
+
+    def listen(self, address, port, backlog=1):
+        """
+        create a listening server socket
+
+        Args:
+            address (str): local address to bind ("" for all interfaces / local adapter)
+            port (int): port (RFCOMM channel)
+            backlog (int): number of pending connections
+
+        Returns:
+            socket: listening socket
+        """
+        raise NotImplementedError
+
+    def connect(self, address, port, timeout=None):
+        """
+        connect to a remote listening socket
+
+        Args:
+            address (str): remote address
+            port (int): port (RFCOMM channel)
+            timeout (float): connection timeout in seconds (None for blocking)
+
+        Returns:
+            socket: connected socket
+        """
+        raise NotImplementedError
+
+    def local_address(self, address=""):
+        """
+        return the address of this device as seen by the remote side
+        """
+        return address
+
+
+class Rfcomm_transport(Transport):
+    """
+    RFCOMM bluetooth transport (pybluez)
+    """
+
+    name = "bluetooth"
+
+    def __init__(self):
+        # require pybluez
+        # apt install bluetooth libbluetooth-dev
+        # python3 -m pip install pybluez
+        import bluetooth
+        self.bluetooth = bluetooth
+
+    def listen(self, address, port, backlog=1):
+        server_sock = self.bluetooth.BluetoothSocket(self.bluetooth.RFCOMM)
+        server_sock.bind((address, port))
+        server_sock.listen(backlog)
+        return server_sock
+
+    def connect(self, address, port, timeout=None):
+        sock = self.bluetooth.BluetoothSocket(self.bluetooth.RFCOMM)
+        if timeout is not None:
+            sock.settimeout(timeout)
+        sock.connect((address, port))
+        sock.settimeout(None)
+        return sock
+
+    def local_address(self, address=""):
+        return self.bluetooth.read_local_bdaddr()[0]
+
+
+class Tcp_transport(Transport):
+    """
+    TCP/IP transport
+
+    An address without explicit port ("192.168.1.10") is mapped to base_port + port,
+    an address with explicit port ("127.0.0.1:5601") is used as is (useful for running many workers on one machine)
+    """
+
+    name = "tcp"
+
+    def __init__(self, base_port=5600):
+        self.base_port = base_port
+
+    def sockaddr(self, address, port):
+        if ":" in address:
+            host, explicit_port = address.rsplit(":", 1)
+            return host, int(explicit_port)
+        return address, self.base_port + port
+
+    def listen(self, address, port, backlog=1):
+        server_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        server_sock.bind(self.sockaddr(address, port))
+        server_sock.listen(backlog)
+        return server_sock
+
+    def connect(self, address, port, timeout=None):
+        sock = socket.create_connection(self.sockaddr(address, port), timeout=timeout)
+        sock.settimeout(None)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return sock
+
+    def local_address(self, address=""):
+        return address if address else socket.gethostname()
+
+
+class Unix_transport(Transport):
+    """
+    Unix domain socket transport
+
+    The socket of the device named NAME listening on port PORT is SOCKET_DIR/NAME_PORT.sock
+    """
+
+    name = "unix"
+
+    def __init__(self, socket_dir="/tmp/time_lapse_sockets"):
+        self.socket_dir = pathlib.Path(socket_dir)
+
+    def socket_path(self, address, port):
+        return str(self.socket_dir / f"{address}_{port}.sock")
+
+    def listen(self, address, port, backlog=1):
+        self.socket_dir.mkdir(parents=True, exist_ok=True)
+        path = self.socket_path(address, port)
+        if os.path.exists(path):
+            os.remove(path)
+        server_sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server_sock.bind(path)
+        server_sock.listen(backlog)
+        return server_sock
+
+    def connect(self, address, port, timeout=None):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(timeout)
+        sock.connect(self.socket_path(address, port))
+        sock.settimeout(None)
+        return sock
+
+
+TRANSPORTS = {"bluetooth": Rfcomm_transport,
+              "tcp": Tcp_transport,
+              "unix": Unix_transport}
+
+
+def get_transport(name, options=None):
+    """
+    return an instance of the transport named name
+
+    Args:
+        name (str): transport name (bluetooth, tcp or unix)
+        options (dict): keyword arguments for the transport constructor
+
+    Returns:
+        Transport: transport instance
+    """
+    if name not in TRANSPORTS:
+        raise ValueError(f"unknown transport {name!r} (available: {', '.join(TRANSPORTS)})")
+    return TRANSPORTS[name](**(options or {}))
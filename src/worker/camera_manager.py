@@ -0,0 +1,247 @@
+"""
+camera session management of the worker
+
+The camera is opened when it is needed and kept warm (open, at a fixed sensor resolution) while the captures
+are frequent. It is released (closed) after keep_warm seconds of inactivity or as soon as the next scheduled
+capture is further than keep_warm seconds away, to save power and heat between sparse frames.
+A released camera is opened again warm_up_time seconds before a scheduled capture (pre-warm).
+
+The sensor resolution is changed only when a capture needs a larger resolution or another aspect ratio:
+smaller pictures of the same aspect ratio are resized by the GPU (resize argument of PiCamera.capture),
+without a mode switch (a resize to another aspect ratio would stretch the picture).
+The warm-up, mode switch and ready latencies are recorded in metrics to tune the policy
+(CAMERA_KEEP_WARM, CAMERA_WARM_UP_TIME and CAMERA_RESOLUTION in config.py).
+"""
+
+import time
+import threading
+
+from metrics import metrics
+
+# relative difference of aspect ratios under which a picture is resized from the sensor resolution
+ASPECT_TOLERANCE = 0.01
+
+
+class Camera_manager(threading.Thread):
+    """
+    thread opening and releasing the camera, and lock of the camera for the captures
+    """
+
+    def __init__(self, factory, resolution=(1640, 1232), warm_up_time=2.0, keep_warm=30, name="camera", log=None):
+        """
+        Args:
+            factory (callable): return an open camera (PiCamera or Fake_camera)
+            resolution (tuple): sensor resolution set when the camera is opened
+            warm_up_time (float): seconds to wait after opening the camera (gain and exposure settle)
+            keep_warm (float): seconds of inactivity after which the camera is released
+            name (str): name of the worker (label of the metrics)
+            log (callable): write a message in the log of the worker
+        """
+        super().__init__(name=f"camera_{name}", daemon=True)
+        self.factory = factory
+        self.resolution = tuple(resolution)
+        self.warm_up_time = warm_up_time
+        self.keep_warm = keep_warm
+        self.log = log or (lambda msg: None)
+
+        self.camera = None
+        self.sensor_resolution = None
+        # resolution of the pictures when it is smaller than the sensor resolution (same aspect ratio)
+        self.resize = None
+        # the camera is used by a capture (or opened by the manager thread)
+        self.in_use = False
+        self.last_used = time.monotonic()
+        # monotonic times of the scheduled captures (the camera is warm at these times)
+        self.scheduled = []
+        self.stopped = False
+        self.condition = threading.Condition()
+
+        self.opens = 0
+        self.releases = 0
+        self.mode_switches = 0
+        self.last_warm_up = 0.0
+        metrics.set_gauge("camera_open", lambda: int(self.camera is not None), worker=name)
+
+    def open_camera(self, warm_up_time=None):
+        """
+        open the camera and wait for the warm-up (called with in_use set)
+
+        Args:
+            warm_up_time (float): seconds of warm-up if shorter than the configured one (capture at a fixed time)
+        """
+        t1 = time.monotonic()
+        camera = self.factory()
+        camera.resolution = self.resolution
+        time.sleep(self.warm_up_time if warm_up_time is None else min(self.warm_up_time, warm_up_time))
+        self.last_warm_up = time.monotonic() - t1
+        metrics.observe("camera_warm_up_seconds", self.last_warm_up)
+        metrics.inc("camera_opens_total")
+        self.opens += 1
+        self.camera, self.sensor_resolution, self.resize = camera, self.resolution, None
+        self.log(f"camera opened in {self.last_warm_up:.3f} s")
+
+    def release_camera(self):
+        """
+        close the camera (called with in_use set or with the condition held)
+        """
+        try:
+            self.camera.close()
+        except:
+            self.log("error closing the camera")
+        self.camera, self.sensor_resolution, self.resize = None, None, None
+        metrics.inc("camera_releases_total")
+        self.releases += 1
+        self.log("camera released")
+
+    def set_resolution(self, resolution):
+        """
+        set the resolution of the next pictures,
+        switch the sensor mode only for a larger resolution or another aspect ratio
+        """
+        width, height = resolution
+        sensor_width, sensor_height = self.sensor_resolution
+        same_aspect = abs(width * sensor_height - height * sensor_width) <= ASPECT_TOLERANCE * height * sensor_width
+        if same_aspect and width <= sensor_width and height <= sensor_height:
+            self.resize = None if (width, height) == self.sensor_resolution else (width, height)
+            return
+        t1 = time.monotonic()
+        self.camera.resolution = (width, height)
+        metrics.observe("camera_mode_switch_seconds", time.monotonic() - t1)
+        self.mode_switches += 1
+        self.sensor_resolution, self.resize = (width, height), None
+
+    def lock(self, resolution, timeout=None, ready_by=None):
+        """
+        lock the camera for captures at resolution (the camera is opened if it was released)
+
+        Args:
+            resolution (tuple): width and height of the pictures
+            timeout (float): seconds to wait for the camera when it is used, None to wait indefinitely
+            ready_by (float): monotonic time the camera must be ready at (the warm-up of a released camera
+                              is shortened if needed), None for a full warm-up
+
+        Returns:
+            bool: True if the camera is locked, False if it is still used after timeout
+        """
+        with self.condition:
+            if not self.condition.wait_for(lambda: not self.in_use, timeout):
+                return False
+            self.in_use = True
+            # the scheduled captures about to happen are served by this lock
+            self.scheduled = [at for at in self.scheduled if at > time.monotonic() + self.warm_up_time]
+
+        t1 = time.monotonic()
+        cold = self.camera is None
+        try:
+            if cold:
+                if ready_by is not None and ready_by - time.monotonic() < self.warm_up_time:
+                    self.log(f"camera warm-up shortened to {max(0, ready_by - time.monotonic()):.3f} s")
+                self.open_camera(None if ready_by is None else max(0, ready_by - time.monotonic()))
+            self.set_resolution(resolution)
+        except:
+            self.unlock()
+            raise
+        metrics.observe("camera_ready_seconds", time.monotonic() - t1, state="cold" if cold else "warm")
+        return True
+
+    def unlock(self, next_use=None):
+        """
+        unlock the camera
+
+        Args:
+            next_use (float): monotonic time of the next capture (the camera is pre-warmed or kept warm), None if unknown
+        """
+        with self.condition:
+            self.in_use = False
+            self.last_used = time.monotonic()
+            if next_use is not None:
+                self.scheduled.append(next_use)
+            self.condition.notify_all()
+
+    def prewarm(self, at):
+        """
+        schedule a capture: the camera will be warm at monotonic time at
+        """
+        with self.condition:
+            self.scheduled.append(at)
+            self.condition.notify_all()
+
+    def capture(self, output, format="jpeg", use_video_port=False):
+        """
+        capture a picture with the locked camera (see PiCamera.capture)
+        """
+        self.camera.capture(output, format=format, use_video_port=use_video_port, resize=self.resize)
+
+    def capture_continuous(self, output, format="jpeg", use_video_port=True):
+        """
+        capture pictures with the locked camera (see PiCamera.capture_continuous)
+        """
+        return self.camera.capture_continuous(output, format=format, use_video_port=use_video_port, resize=self.resize)
+
+    def run(self):
+        """
+        release the idle camera and pre-warm it before the scheduled captures
+        """
+        with self.condition:
+            while not self.stopped:
+                now = time.monotonic()
+                # scheduled captures missed (or served without a lock) are forgotten
+                self.scheduled = [at for at in self.scheduled if at > now]
+                next_use = min(self.scheduled) if self.scheduled else None
+                wake_up = None
+
+                if not self.in_use and self.camera is None and next_use is not None:
+                    if now >= next_use - self.warm_up_time:
+                        self.in_use = True
+                        self.condition.release()
+                        try:
+                            self.open_camera()
+                        except:
+                            self.log("error opening the camera")
+                        finally:
+                            self.condition.acquire()
+                            self.in_use = False
+                            self.last_used = time.monotonic()
+                            self.condition.notify_all()
+                        continue
+                    wake_up = next_use - self.warm_up_time
+
+                elif not self.in_use and self.camera is not None:
+                    if next_use is None:
+                        if now >= self.last_used + self.keep_warm:
+                            self.release_camera()
+                            continue
+                        wake_up = self.last_used + self.keep_warm
+                    elif next_use - now > self.keep_warm:
+                        # sparse frames: the camera is released until the pre-warm of the next one
+                        self.release_camera()
+                        continue
+                    else:
+                        wake_up = next_use
+
+                self.condition.wait(None if wake_up is None else max(0, wake_up - now))
+
+    def close(self):
+        """
+        stop the thread and release the camera
+        """
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+        if self.is_alive():
+            self.join()
+        if self.camera is not None:
+            self.release_camera()
+
+    def stats(self):
+        """
+        Returns:
+            dict: state of the camera and numbers of openings, releases and mode switches
+        """
+        return {"open": self.camera is not None,
+                "sensor resolution": "{}x{}".format(*self.sensor_resolution) if self.sensor_resolution else "",
+                "opens": self.opens,
+                "releases": self.releases,
+                "mode switches": self.mode_switches,
+                "last warm up (s)": round(self.last_warm_up, 3),
+               }
@@ -0,0 +1,165 @@
+"""
+high-rate capture pipeline for short time lapse intervals
+
+The capture thread captures the frames into memory (video port, capture_continuous)
+and puts them into a bounded queue. A writer thread saves the frames to disk by batches.
+When the queue is full the capture waits (backpressure): the frames that can not be captured
+in time are counted as missed by the scheduler instead of being silently dropped.
+The capture durations and the writing times of the batches are recorded in metrics.
+A frame that can not be written (full card, missing directory) is logged and counted, the next frames are still written.
+If the writer thread stops anyway, put raises OSError (the capture stops) and close returns without waiting.
+"""
+
+import io
+import sys
+import time
+import queue
+import threading
+
+from metrics import metrics
+
+
+class Frame_writer(threading.Thread):
+    """
+    thread writing the captured frames to disk by batches
+    """
+
+    def __init__(self, queue_size=16, batch_size=8, on_batch=None, log=None):
+        """
+        Args:
+            queue_size (int): maximum number of frames waiting to be written
+            batch_size (int): maximum number of frames written in one batch
+            on_batch (callable): called with the lists of paths and contents written in a batch
+            log (callable): write a message in the log of the worker
+        """
+        super().__init__(name="frame_writer", daemon=True)
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.batch_size = batch_size
+        self.on_batch = on_batch
+        self.log = log or (lambda msg: None)
+        self.written = 0
+        self.errors = 0
+        # error that stopped the writer thread (None while it runs)
+        self.failure = None
+        self.batches = 0
+        self.max_depth = 0
+        self.blocked_time = 0.0
+
+    def enqueue(self, item):
+        """
+        put item into the queue, wait while the queue is full and the writer thread runs
+
+        Returns:
+            bool: True if the item was queued, False if the writer thread is stopped
+        """
+        while self.is_alive():
+            try:
+                self.queue.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def put(self, path, data):
+        """
+        add a frame to the queue, wait if the queue is full
+
+        Raises:
+            OSError: if the writer thread is stopped
+        """
+        t1 = time.monotonic()
+        queued = self.enqueue((path, data))
+        self.blocked_time += time.monotonic() - t1
+        if not queued:
+            raise OSError(f"the frame writer is stopped: {self.failure}")
+        self.max_depth = max(self.max_depth, self.queue.qsize())
+
+    def close(self):
+        """
+        write the remaining frames and stop the thread (return at once if the thread is stopped)
+        """
+        if self.enqueue(None):
+            self.join()
+
+    def run(self):
+        try:
+            self.write_frames()
+        except:
+            self.failure = sys.exc_info()[1]
+            self.log(f"frame writer stopped: {self.failure}")
+
+    def write_frames(self):
+        while True:
+            batch = [self.queue.get()]
+            while batch[-1] is not None and len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            t1 = time.monotonic()
+            paths, contents = [], []
+            for item in batch:
+                if item is None:
+                    continue
+                path, data = item
+                try:
+                    with open(path, "wb") as f:
+                        f.write(data)
+                except OSError:
+                    self.errors += 1
+                    metrics.inc("write_errors_total")
+                    self.log(f"error writing {path}: {sys.exc_info()[1]}")
+                    continue
+                paths.append(path)
+                contents.append(data)
+            if paths:
+                metrics.observe("write_batch_seconds", time.monotonic() - t1)
+                self.written += len(paths)
+                self.batches += 1
+                if self.on_batch:
+                    try:
+                        self.on_batch(paths, contents)
+                    except:
+                        self.log(f"error after writing {len(paths)} frames: {sys.exc_info()[1]}")
+
+            if batch[-1] is None:
+                return
+
+    def stats(self):
+        return {"queue depth": self.queue.qsize(),
+                "max queue depth": self.max_depth,
+                "frames written": self.written,
+                "write errors": self.errors,
+                "write batches": self.batches,
+                "capture blocked (s)": round(self.blocked_time, 3),
+               }
+
+
+def capture_frames(camera, scheduler, stop_event, writer, file_name, use_video_port=True):
+    """
+    capture the frames at the deadlines of the scheduler into memory and give them to the writer
+
+    Args:
+        camera (PiCamera): camera (resolution already set)
+        scheduler (Frame_scheduler): deadlines of the frames
+        stop_event (threading.Event): stop the capture when set
+        writer (Frame_writer): writer thread
+        file_name (callable): return the path of the next frame
+        use_video_port (bool): capture from the video port (faster, no mode switch between frames)
+    """
+    stream = io.BytesIO()
+    frames = camera.capture_continuous(stream, format="jpeg", use_video_port=use_video_port)
+    try:
+        while True:
+            deadline = scheduler.wait(stop_event)
+            if deadline is None:
+                break
+            scheduler.record(deadline, time.monotonic())
+            with metrics.timer("capture_seconds", mode="pipeline"):
+                next(frames)
+            writer.put(file_name(), stream.getvalue())
+            stream.seek(0)
+            stream.truncate()
+    finally:
+        frames.close()
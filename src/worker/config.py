@@ -3,9 +3,93 @@
 
 PICTURES_DIR = "/home/pi/projects/time_lapse/pictures"
 
+# address of the coordinator (bluetooth MAC address, IP address or unix socket name depending on TRANSPORT)
 COORDINATOR_BLUETOOTH_ADDRESS = "XX:XX:XX:XX:XX:XX"
 
+# transport used to communicate with the coordinator: "bluetooth", "tcp" or "unix"
+TRANSPORT = "bluetooth"
+# options of the transport, for example {"base_port": 5600} for tcp or {"socket_dir": "/tmp/time_lapse_sockets"} for unix
+TRANSPORT_OPTIONS = {}
+# address the worker listens on ("" for bluetooth and tcp, "127.0.0.1:5601" for many workers on one machine, the worker name for unix)
+LISTEN_ADDRESS = ""
 
+# seconds of inactivity after which a keepalive message is sent on the connection to the coordinator
+KEEPALIVE_INTERVAL = 30
+# seconds of inactivity after which the connection of the coordinator is closed
+CONNECTION_IDLE_TIMEOUT = 120
+# replies with payloads of at least BULK_MIN_SIZE bytes (pictures, chunks, logs) are sent on a second connection
+# to the coordinator: the small replies (status, time probes) are not queued behind them
+BULK_MIN_SIZE = 65536
 
+# number of threads running the slow commands (one picture, command, sync time, get log)
+EXECUTOR_THREADS = 2
 
+# a time lapse frame captured more than LATE_FRAME_TOLERANCE seconds after its scheduled time is counted as late
+LATE_FRAME_TOLERANCE = 0.5
 
+# time lapse with an interval (in seconds) shorter than PIPELINE_INTERVAL capture the frames in memory
+# from the video port and a separate thread writes them to disk by batches
+PIPELINE_INTERVAL = 2
+# maximum number of captured frames waiting to be written (the capture waits when the queue is full)
+PIPELINE_QUEUE_SIZE = 16
+# maximum number of frames written in one batch
+PIPELINE_BATCH_SIZE = 8
+
+# seconds to wait for the camera when it is used by a time lapse
+CAMERA_LOCK_TIMEOUT = 10
+# synchronized capture: the camera is prepared (resolution) at least CAPTURE_ARM_TIME seconds before the capture time
+CAPTURE_ARM_TIME = 0.5
+
+# sensor resolution of the camera while it is kept warm
+# (smaller pictures of the same aspect ratio are resized without a mode switch)
+CAMERA_RESOLUTION = (1640, 1232)
+# seconds to wait after opening the camera for the gain and the exposure to settle
+CAMERA_WARM_UP_TIME = 2
+# the camera is released after CAMERA_KEEP_WARM seconds of inactivity and between time lapse frames
+# further apart than CAMERA_KEEP_WARM seconds (it is opened again CAMERA_WARM_UP_TIME seconds before the next frame)
+CAMERA_KEEP_WARM = 30
+
+# previews of the time lapse frames sent to the coordinator (require Pillow)
+PREVIEW_ENABLED = True
+# maximum width and height of the previews
+PREVIEW_SIZE = (160, 120)
+# JPEG quality of the previews
+PREVIEW_QUALITY = 60
+# minimum time (in seconds) between 2 previews
+PREVIEW_MIN_INTERVAL = 60
+
+# maximum number of frames in a manifest sent to the coordinator (frames synchronization)
+MANIFEST_LIMIT = 500
+
+# pictures are deleted when the free space is below STORAGE_MIN_FREE_MB, until STORAGE_TARGET_FREE_MB are free:
+# first the pictures already received by the coordinator, then the oldest ones if STORAGE_POLICY is "ring"
+# ("keep": the pictures not yet received are never deleted, the captures fail when the card is full)
+STORAGE_MIN_FREE_MB = 500
+STORAGE_TARGET_FREE_MB = 1000
+STORAGE_POLICY = "ring"
+# maximum size of the pictures (ring buffer size) in MB, 0 for no limit other than the free space
+STORAGE_MAX_PICTURES_MB = 0
+# seconds between two checks of the free space
+STORAGE_CHECK_INTERVAL = 30
+# the pictures are deleted by batches of STORAGE_DELETE_BATCH separated by STORAGE_BATCH_PAUSE seconds
+# (the deletion does not compete with the writing of the frames)
+STORAGE_DELETE_BATCH = 50
+STORAGE_BATCH_PAUSE = 0.5
+
+# index of the pictures saved in PICTURES_DIR (rebuilt from the directory if the file does not exist)
+PICTURE_INDEX_FILE = "pictures_index.sqlite"
+
+# maximum number of bytes of log file sent in one message
+LOG_MAX_SIZE = 262144
+
+# compression codecs used for the messages, in order of preference ("zlib", "lzma" or [] for no compression).
+# The codec must also be supported by the other side
+COMPRESSION_CODECS = ["zlib"]
+# messages and payload sections smaller than COMPRESSION_MIN_SIZE bytes are not compressed
+COMPRESSION_MIN_SIZE = 512
+
+# file where the metrics of the worker (latencies, bytes, capture durations, queue depths) are written
+# (Prometheus text format, CSV if the name ends with .csv), "" for no file. The metrics are also sent with the "metrics" command
+METRICS_FILE = ""
+# seconds between two writings of METRICS_FILE
+METRICS_INTERVAL = 60
@@ -0,0 +1,206 @@
+"""
+long-lived connections used by coordinator and worker
+
+This file is shared by the coordinator and the worker:
+src/coordinator/connection.py and src/worker/connection.py must be kept identical.
+
+A connection is opened on first use and kept open for the next messages.
+It is reopened automatically if the remote side closed it and a keepalive message
+is sent when the connection is idle so that the remote side does not drop it.
+The connection times, the send times and the bytes sent are recorded in metrics (label peer: remote address).
+A hello message (codecs supported by this side) is sent first on each new connection and
+the messages are compressed with the preferred codec accepted by the remote side (see set_peer_codecs).
+The messages with large payloads (pictures, chunks, logs) can be sent on a second connection to another port
+(bulk_port of Connection_pool) so that the small messages are not queued behind a long transfer.
+"""
+
+import select
+import threading
+import time
+
+from protocol import send_message, choose_codec, MSG_KEEPALIVE, MSG_REPLY, MSG_HELLO
+from metrics import metrics, SIZE_BUCKETS
+
+
+class Connection:
+    """
+    long-lived connection to a remote listening socket
+    """
+
+    def __init__(self, transport, address, port, connect_timeout=None, hello=None, preferred_codecs=(), min_size=512):
+        """
+        Args:
+            transport (Transport): transport used to connect
+            address (str): remote address
+            port (int): remote port
+            connect_timeout (float): connection timeout in seconds
+            hello (dict): metadata of the hello message sent on each new connection (None for no hello)
+            preferred_codecs (list): compression codecs in order of preference
+            min_size (int): messages smaller than min_size bytes are not compressed
+        """
+        self.transport = transport
+        self.address = address
+        self.port = port
+        self.connect_timeout = connect_timeout
+        self.hello = hello
+        self.preferred_codecs = preferred_codecs
+        self.min_size = min_size
+        # codecs accepted by the remote side (received in its hello message)
+        self.peer_codecs = None
+        self.sock = None
+        self.last_activity = 0
+        self.lock = threading.Lock()
+
+    def is_alive(self):
+        """
+        check if the connection is still open.
+        The remote side never sends data on this connection: a readable socket means that it was closed
+        """
+        if self.sock is None:
+            return False
+        try:
+            readable, _, _ = select.select([self.sock], [], [], 0)
+        except (OSError, ValueError):
+            return False
+        return not readable
+
+    def close_socket(self):
+        if self.sock is not None:
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+        self.sock = None
+
+    def send(self, metadata, payloads=None, msg_type=MSG_REPLY, timeout=None):
+        """
+        send a message, (re)connect if necessary
+
+        Args:
+            metadata (dict): message metadata
+            payloads (dict): binary sections
+            msg_type (int): message type
+            timeout (float): connection timeout (default: connect_timeout)
+
+        Returns:
+            int: number of bytes sent
+
+        Raises:
+            OSError: if the message can not be sent after reconnecting
+        """
+        with self.lock:
+            for attempt in (1, 2):
+                try:
+                    if not self.is_alive():
+                        self.close_socket()
+                        t1 = time.monotonic()
+                        self.sock = self.transport.connect(self.address, self.port,
+                                                           timeout=self.connect_timeout if timeout is None else timeout)
+                        metrics.observe("connect_seconds", time.monotonic() - t1, peer=self.address)
+                        if self.hello is not None:
+                            send_message(self.sock, self.hello, msg_type=MSG_HELLO)
+                    t1 = time.monotonic()
+                    sent = send_message(self.sock, metadata, payloads, msg_type=msg_type,
+                                        codec=choose_codec(self.peer_codecs, self.preferred_codecs), min_size=self.min_size)
+                    self.last_activity = time.monotonic()
+                    metrics.observe("send_seconds", self.last_activity - t1, peer=self.address)
+                    metrics.observe("sent_message_bytes", sent, buckets=SIZE_BUCKETS, peer=self.address)
+                    metrics.inc("sent_bytes_total", sent, peer=self.address)
+                    return sent
+                except OSError:
+                    metrics.inc("send_errors_total", peer=self.address)
+                    self.close_socket()
+                    if attempt == 2:
+                        raise
+
+    def keepalive(self, interval):
+        """
+        send a keepalive message if the connection is open and was idle for more than interval seconds
+        """
+        if self.sock is None or time.monotonic() - self.last_activity < interval:
+            return
+        with self.lock:
+            # the connection may have been closed (or used) while waiting for the lock
+            if self.sock is None or time.monotonic() - self.last_activity < interval:
+                return
+            try:
+                send_message(self.sock, {}, msg_type=MSG_KEEPALIVE)
+                self.last_activity = time.monotonic()
+            except OSError:
+                self.close_socket()
+
+    def close(self):
+        with self.lock:
+            self.close_socket()
+
+
+class Connection_pool:
+    """
+    long-lived connections keyed by remote address and port.
+    A background thread sends keepalive messages on idle connections.
+    """
+
+    def __init__(self, transport, port, connect_timeout=None, keepalive_interval=30,
+                 hello=None, preferred_codecs=(), min_size=512, bulk_port=None, bulk_min_size=65536):
+        """
+        Args:
+            bulk_port (int): port of the messages with payloads of at least bulk_min_size bytes (None: port)
+            bulk_min_size (int): minimum size of the payloads sent on bulk_port
+        """
+        self.transport = transport
+        self.port = port
+        self.bulk_port = bulk_port
+        self.bulk_min_size = bulk_min_size
+        self.connect_timeout = connect_timeout
+        self.keepalive_interval = keepalive_interval
+        self.hello = hello
+        self.preferred_codecs = preferred_codecs
+        self.min_size = min_size
+        self.connections = {}
+        self.peer_codecs = {}
+        self.lock = threading.Lock()
+        if keepalive_interval:
+            threading.Thread(target=self.keepalive_loop, name="keepalive", daemon=True).start()
+
+    def get(self, address, port=None):
+        """
+        return the connection to address on port (default: port of the pool), created if it does not exist
+        """
+        key = (address, self.port if port is None else port)
+        with self.lock:
+            if key not in self.connections:
+                self.connections[key] = Connection(self.transport, address, key[1], self.connect_timeout,
+                                                   hello=self.hello, preferred_codecs=self.preferred_codecs,
+                                                   min_size=self.min_size)
+                self.connections[key].peer_codecs = self.peer_codecs.get(address)
+            return self.connections[key]
+
+    def set_peer_codecs(self, address, codecs):
+        """
+        record the codecs accepted by the remote side (from its hello message)
+        """
+        with self.lock:
+            self.peer_codecs[address] = codecs
+            for (connection_address, _), connection in self.connections.items():
+                if connection_address == address:
+                    connection.peer_codecs = codecs
+
+    def send(self, address, metadata, payloads=None, msg_type=MSG_REPLY, timeout=None):
+        port = None
+        if self.bulk_port is not None and payloads and sum(len(payload) for payload in payloads.values()) >= self.bulk_min_size:
+            port = self.bulk_port
+        return self.get(address, port).send(metadata, payloads, msg_type=msg_type, timeout=timeout)
+
+    def keepalive_loop(self):
+        while True:
+            time.sleep(self.keepalive_interval / 2)
+            with self.lock:
+                connections = list(self.connections.values())
+            for connection in connections:
+                connection.keepalive(self.keepalive_interval)
+
+    def close_all(self):
+        with self.lock:
+            connections = list(self.connections.values())
+        for connection in connections:
+            connection.close()
@@ -0,0 +1,109 @@
+"""
+camera without hardware for the simulated workers (load tests of the coordinator, see simulated_fleet.py)
+
+Fake_camera has the methods of PiCamera used by the worker (resolution, capture, capture_continuous, close).
+The pictures are valid JPEG files of the camera resolution (uniform gray image) padded with comment segments
+of random bytes to the size of a real picture (bytes_per_pixel x width x height).
+Each capture takes latency seconds (plus a random jitter).
+"""
+
+import os
+import time
+import random
+import struct
+
+
+def synthetic_jpeg(width, height, size=0):
+    """
+    return a baseline JPEG of width x height pixels (uniform gray) of about size bytes
+
+    The image is made of 8x8 blocks without AC coefficients coded with single-code Huffman tables:
+    the entropy coded data is 2 bits per block, the rest of size is filled with comment segments.
+
+    Args:
+        width (int): width of the image
+        height (int): height of the image
+        size (int): minimum size of the JPEG data (in bytes), 0 for the smallest file
+
+    Returns:
+        bytes: JPEG data
+    """
+
+    def segment(marker, content):
+        return struct.pack(">BBH", 0xFF, marker, len(content) + 2) + content
+
+    blocks = ((width + 7) // 8) * ((height + 7) // 8)
+    # DC difference 0 (code 0) and end of block (code 0) for each block, padded with 1 bits
+    bits = 2 * blocks
+    entropy = b"\x00" * (bits // 8) + (bytes([0xFF >> (bits % 8)]) if bits % 8 else b"")
+
+    image = (segment(0xDB, b"\x00" + b"\x01" * 64)  # quantization table 0
+             + segment(0xC0, struct.pack(">BHHB", 8, height, width, 1) + b"\x01\x11\x00")  # frame: 1 component
+             + segment(0xC4, b"\x00" + b"\x01" + b"\x00" * 15 + b"\x00")  # DC table 0: one code for category 0
+             + segment(0xC4, b"\x10" + b"\x01" + b"\x00" * 15 + b"\x00")  # AC table 0: one code for end of block
+             + segment(0xDA, b"\x01\x01\x00\x00\x3f\x00")  # scan
+             + entropy)
+
+    # padding in comment segments (at most 65533 bytes each)
+    padding = []
+    missing = size - (len(image) + 4)
+    while missing > 4:
+        length = min(missing - 4, 65533)
+        padding.append(segment(0xFE, os.urandom(length)))
+        missing -= length + 4
+
+    return b"\xff\xd8" + b"".join(padding) + image + b"\xff\xd9"
+
+
+class Fake_camera:
+    """
+    camera producing synthetic JPEG pictures
+    """
+
+    def __init__(self, bytes_per_pixel=0.2, latency=0.1, jitter=0.0):
+        """
+        Args:
+            bytes_per_pixel (float): size of the pictures relative to the resolution (a JPEG of a Raspberry Pi camera
+                                     is about 0.2 to 0.5 byte by pixel)
+            latency (float): duration of a capture (in seconds)
+            jitter (float): maximum random duration added to latency (in seconds)
+        """
+        self.resolution = (640, 480)
+        self.bytes_per_pixel = bytes_per_pixel
+        self.latency = latency
+        self.jitter = jitter
+        self.captures = 0
+        # last picture generated (the pictures of the same resolution have the same content)
+        self.picture = (None, b"")
+
+    def frame(self, resize=None):
+        """
+        wait for the capture latency and return the JPEG data of a picture at the current resolution (or resize)
+        """
+        time.sleep(self.latency + random.uniform(0, self.jitter))
+        width, height = resize or self.resolution
+        if self.picture[0] != (width, height):
+            self.picture = ((width, height), synthetic_jpeg(width, height, int(width * height * self.bytes_per_pixel)))
+        self.captures += 1
+        return self.picture[1]
+
+    def capture(self, output, format="jpeg", use_video_port=False, resize=None):
+        """
+        capture a picture in output (path or writable file object)
+        """
+        if isinstance(output, str):
+            with open(output, "wb") as f_out:
+                f_out.write(self.frame(resize))
+        else:
+            output.write(self.frame(resize))
+
+    def capture_continuous(self, output, format="jpeg", use_video_port=False, resize=None):
+        """
+        capture pictures in the output stream, one for each iteration
+        """
+        while True:
+            output.write(self.frame(resize))
+            yield output
+
+    def close(self):
+        pass
@@ -0,0 +1,251 @@
+"""
+lightweight instrumentation of coordinator and worker (latencies, bytes, queue depths)
+
+This file is shared by the coordinator and the worker:
+src/coordinator/metrics.py and src/worker/metrics.py must be kept identical.
+
+Three kinds of metrics, identified by a name and labels (for example {"peer": address, "command": "status"}):
+
+    counter: value only increasing (bytes sent, messages, errors)
+    gauge: current value (queue depth), a callable is evaluated when the metrics are read
+    histogram: distribution of the observed values in fixed buckets (count, sum, min, max, quantiles)
+
+The histograms only keep one counter per bucket: observing a value is cheap and the memory used is constant.
+The metrics are exported as a list of entries (JSON serializable, see Metrics.entries),
+in the Prometheus text format (prometheus_text) or in CSV (csv_text).
+"""
+
+import os
+import bisect
+import threading
+import time
+
+# upper bounds of the buckets of the duration histograms (in seconds)
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+# upper bounds of the buckets of the size histograms (in bytes)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216, 67108864)
+
+# quantiles estimated from the buckets
+QUANTILES = (0.5, 0.9, 0.99)
+
+# prefix of the metric names in the Prometheus export
+PROMETHEUS_PREFIX = "timelapse_"
+
+
+class Histogram:
+    """
+    distribution of values in fixed buckets
+    """
+
+    def __init__(self, buckets=DURATION_BUCKETS):
+        """
+        Args:
+            buckets (tuple): upper bounds of the buckets (sorted), the last bucket (+Inf) is implicit
+        """
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def to_dict(self):
+        return {"buckets": list(self.buckets), "counts": list(self.counts),
+                "count": self.count, "sum": self.sum, "min": self.min, "max": self.max}
+
+
+def quantile(histogram, q):
+    """
+    estimate a quantile from the buckets of a histogram (upper bound of the bucket, limited to the maximum)
+
+    Args:
+        histogram (dict): histogram (see Histogram.to_dict)
+        q (float): quantile (0 to 1)
+
+    Returns:
+        float: estimated quantile (None if the histogram is empty)
+    """
+    if not histogram["count"]:
+        return None
+    rank, cumulated = q * histogram["count"], 0
+    for bound, count in zip(histogram["buckets"] + [None], histogram["counts"]):
+        cumulated += count
+        if cumulated >= rank and count:
+            return histogram["max"] if bound is None else min(bound, histogram["max"])
+    return histogram["max"]
+
+
+def summary(entry):
+    """
+    return the value of an entry in a short readable form
+    (value of counters and gauges, count, mean, quantiles and maximum of histograms)
+    """
+    if entry["type"] != "histogram":
+        return entry["value"]
+    histogram = entry["value"]
+    if not histogram["count"]:
+        return {"count": 0}
+    return {"count": histogram["count"],
+            "mean": histogram["sum"] / histogram["count"],
+            **{f"p{round(q * 100)}": quantile(histogram, q) for q in QUANTILES},
+            "max": histogram["max"]}
+
+
+class Metrics:
+    """
+    counters, gauges and histograms (thread safe)
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # (name, labels) -> value, labels is a sorted tuple of (label, value)
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+
+    def inc(self, name, amount=1, **labels):
+        """
+        add amount to a counter
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def set_gauge(self, name, value, **labels):
+        """
+        set a gauge
+
+        Args:
+            value (float or callable): value, or function returning the value when the metrics are read
+        """
+        with self.lock:
+            self.gauges[(name, tuple(sorted(labels.items())))] = value
+
+    def observe(self, name, value, buckets=DURATION_BUCKETS, **labels):
+        """
+        add a value to a histogram (created with buckets on the first observation)
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            if key not in self.histograms:
+                self.histograms[key] = Histogram(buckets)
+            self.histograms[key].observe(value)
+
+    def timer(self, name, **labels):
+        """
+        context manager observing its duration in the histogram name
+
+            with metrics.timer("capture_seconds", mode="single"):
+                camera.capture(file_name)
+        """
+        return Timer(self, name, labels)
+
+    def entries(self, **extra_labels):
+        """
+        return all the metrics (JSON serializable)
+
+        Args:
+            extra_labels: labels added to all the entries (for example the raspberry id)
+
+        Returns:
+            list: dict {"name": str, "type": "counter", "gauge" or "histogram", "labels": dict, "value": ...}
+                  the value of a histogram is a dict (see Histogram.to_dict)
+        """
+        with self.lock:
+            counters = list(self.counters.items())
+            gauges = list(self.gauges.items())
+            histograms = [(key, histogram.to_dict()) for key, histogram in self.histograms.items()]
+
+        entries = []
+        for kind, items in (("counter", counters), ("gauge", gauges), ("histogram", histograms)):
+            for (name, labels), value in sorted(items, key=lambda item: item[0]):
+                if callable(value):
+                    try:
+                        value = value()
+                    except Exception:
+                        continue
+                entries.append({"name": name, "type": kind, "labels": {**dict(labels), **extra_labels}, "value": value})
+        return entries
+
+
+class Timer:
+
+    def __init__(self, metrics, name, labels):
+        self.metrics, self.name, self.labels = metrics, name, labels
+
+    def __enter__(self):
+        self.start = time.monotonic()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.metrics.observe(self.name, time.monotonic() - self.start, **self.labels)
+        return False
+
+
+def format_labels(labels, extra=None):
+    labels = {**labels, **(extra or {})}
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for value in labels.values())
+    return "{" + ",".join(f'{label}="{value}"' for label, value in zip(labels, escaped)) + "}"
+
+
+def prometheus_text(entries):
+    """
+    format entries (see Metrics.entries) in the Prometheus text exposition format
+    """
+    lines, typed = [], set()
+    for entry in sorted(entries, key=lambda entry: entry["name"]):
+        name = PROMETHEUS_PREFIX + entry["name"]
+        if name not in typed:
+            lines.append(f'# TYPE {name} {entry["type"]}')
+            typed.add(name)
+        if entry["type"] != "histogram":
+            lines.append(f'{name}{format_labels(entry["labels"])} {entry["value"]}')
+            continue
+        histogram, cumulated = entry["value"], 0
+        for bound, count in zip(histogram["buckets"] + ["+Inf"], histogram["counts"]):
+            cumulated += count
+            lines.append(f'{name}_bucket{format_labels(entry["labels"], {"le": bound})} {cumulated}')
+        lines.append(f'{name}_sum{format_labels(entry["labels"])} {histogram["sum"]}')
+        lines.append(f'{name}_count{format_labels(entry["labels"])} {histogram["count"]}')
+    return "\n".join(lines) + "\n"
+
+
+def csv_text(entries):
+    """
+    format entries (see Metrics.entries) in CSV: one line per entry with the summary of the histograms
+    """
+    columns = ["count", "mean"] + [f"p{round(q * 100)}" for q in QUANTILES] + ["max"]
+    lines = [",".join(["name", "type", "labels", "value"] + columns)]
+    for entry in entries:
+        labels = " ".join(f"{label}={value}" for label, value in entry["labels"].items())
+        if entry["type"] == "histogram":
+            values = summary(entry)
+            row = ["", *("" if values.get(column) is None else f"{values[column]:g}" for column in columns)]
+        else:
+            row = [str(entry["value"])] + [""] * len(columns)
+        lines.append(",".join([entry["name"], entry["type"], f'"{labels}"'] + row))
+    return "\n".join(lines) + "\n"
+
+
+def write_metrics(path, entries):
+    """
+    write entries in a file: CSV if the path ends with .csv else Prometheus text format
+    The file is replaced atomically (it can be read by a collector at any time)
+    """
+    content = csv_text(entries) if path.lower().endswith(".csv") else prometheus_text(entries)
+    with open(path + ".tmp", "w", encoding="utf-8") as f_out:
+        f_out.write(content)
+    os.replace(path + ".tmp", path)
+
+
+metrics = Metrics()
@@ -0,0 +1,224 @@
+"""
+persistent index of the pictures saved in PICTURES_DIR
+
+The index is a SQLite database updated each time a picture is saved.
+The status does not need to list the pictures directory: the number of pictures,
+their total size and the time of the last one are kept in memory.
+The index is rebuilt from the directory content if the database does not exist.
+The pictures received by the coordinator are marked as confirmed (they are deleted first when the space is needed,
+see storage_manager.py).
+"""
+
+import os
+import time
+import shutil
+import pathlib
+import sqlite3
+import binascii
+import threading
+
+
+def file_crc32(path):
+    """
+    return the CRC32 of a file
+    """
+    crc = 0
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            crc = binascii.crc32(block, crc)
+    return crc
+
+
+class Picture_index:
+    """
+    index of pictures (name, size, modification time, CRC32)
+    """
+
+    def __init__(self, directory, db_path, log=print):
+        """
+        Args:
+            directory (str): pictures directory
+            db_path (str): path of SQLite database
+            log (callable): function for logging
+        """
+        self.directory = pathlib.Path(directory)
+        self.db_path = db_path
+        self.log = log
+        self.lock = threading.Lock()
+        self.db = None
+        self.count = 0
+        self.total_size = 0
+        self.last_mtime = 0
+        self.confirmed_count = 0
+        self.confirmed_size = 0
+        # bytes of the pictures added since the index was opened (capture rate, see storage_manager.py)
+        self.added_size = 0
+
+    def open(self):
+        """
+        open the database (rebuild it if it does not exist). Called on first use
+        """
+        if self.db is not None:
+            return
+        rebuild = not os.path.isfile(self.db_path)
+        self.db = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(("CREATE TABLE IF NOT EXISTS pictures "
+                         "(id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT UNIQUE, size INTEGER, mtime REAL, crc INTEGER, "
+                         "confirmed INTEGER DEFAULT 0)"))
+        # index created by an older version
+        if "confirmed" not in [row[1] for row in self.db.execute("PRAGMA table_info(pictures)")]:
+            self.db.execute("ALTER TABLE pictures ADD COLUMN confirmed INTEGER DEFAULT 0")
+        if rebuild:
+            self.rebuild()
+        (self.count, total_size, last_mtime,
+         self.confirmed_count, confirmed_size) = self.db.execute(("SELECT COUNT(*), SUM(size), MAX(mtime), "
+                                                                  "COALESCE(SUM(confirmed), 0), SUM(confirmed * size) "
+                                                                  "FROM pictures")).fetchone()
+        self.total_size, self.last_mtime, self.confirmed_size = total_size or 0, last_mtime or 0, confirmed_size or 0
+
+    def rebuild(self):
+        """
+        index the pictures of the directory (ordered by modification time)
+        """
+        t1 = time.time()
+        entries = []
+        if self.directory.is_dir():
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith(".jpg") and entry.is_file():
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, entry.name, stat.st_size))
+        entries.sort()
+        self.db.execute("DELETE FROM pictures")
+        self.db.executemany("INSERT INTO pictures (name, size, mtime, crc) VALUES (?, ?, ?, NULL)",
+                            [(name, size, mtime) for mtime, name, size in entries])
+        self.db.commit()
+        self.log(f"picture index rebuilt: {len(entries)} pictures in {time.time() - t1:.1f} s")
+
+    def add(self, paths, contents=None, time_offset=0.0):
+        """
+        add saved pictures to the index
+
+        Args:
+            paths (list): paths of pictures
+            contents (list): contents of pictures if they are in memory (for the CRC32)
+            time_offset (float): offset of the clock (in seconds) subtracted from the modification times
+        """
+        rows = []
+        for i, path in enumerate(paths):
+            stat = os.stat(path)
+            crc = binascii.crc32(contents[i]) if contents else file_crc32(path)
+            rows.append((pathlib.Path(path).name, stat.st_size, stat.st_mtime - time_offset, crc))
+        with self.lock:
+            self.open()
+            # pictures already indexed (overwritten files)
+            replaced = self.db.execute((f"SELECT COUNT(*), SUM(size), COALESCE(SUM(confirmed), 0), SUM(confirmed * size) "
+                                        f"FROM pictures WHERE name IN ({','.join('?' * len(rows))})"),
+                                       [row[0] for row in rows]).fetchone()
+            self.db.executemany("INSERT OR REPLACE INTO pictures (name, size, mtime, crc) VALUES (?, ?, ?, ?)", rows)
+            self.db.commit()
+            self.count += len(rows) - replaced[0]
+            self.total_size += sum(row[1] for row in rows) - (replaced[1] or 0)
+            self.confirmed_count -= replaced[2]
+            self.confirmed_size -= replaced[3] or 0
+            self.added_size += sum(row[1] for row in rows)
+            self.last_mtime = max([self.last_mtime] + [row[2] for row in rows])
+
+    def remove(self, names):
+        """
+        remove pictures from the index (the files are not deleted)
+        """
+        with self.lock:
+            self.open()
+            removed = self.db.execute((f"SELECT COUNT(*), SUM(size), COALESCE(SUM(confirmed), 0), SUM(confirmed * size) "
+                                       f"FROM pictures WHERE name IN ({','.join('?' * len(names))})"),
+                                      names).fetchone()
+            self.db.execute(f"DELETE FROM pictures WHERE name IN ({','.join('?' * len(names))})", names)
+            self.db.commit()
+            self.count -= removed[0]
+            self.total_size -= removed[1] or 0
+            self.confirmed_count -= removed[2]
+            self.confirmed_size -= removed[3] or 0
+
+    def confirm(self, cursor):
+        """
+        mark the pictures indexed up to cursor as received by the coordinator
+
+        Args:
+            cursor (int): id of the last picture received (see since)
+
+        Returns:
+            int: number of pictures newly confirmed
+        """
+        with self.lock:
+            self.open()
+            count, size = self.db.execute("SELECT COUNT(*), SUM(size) FROM pictures WHERE id <= ? AND confirmed = 0",
+                                          (cursor,)).fetchone()
+            self.db.execute("UPDATE pictures SET confirmed = 1 WHERE id <= ? AND confirmed = 0", (cursor,))
+            self.db.commit()
+            self.confirmed_count += count
+            self.confirmed_size += size or 0
+        return count
+
+    def oldest(self, limit, confirmed):
+        """
+        return the oldest pictures (candidates for deletion)
+
+        Args:
+            limit (int): maximum number of pictures
+            confirmed (bool): True for the pictures received by the coordinator, False for the other ones
+
+        Returns:
+            list: (name, size) of pictures
+        """
+        with self.lock:
+            self.open()
+            return self.db.execute("SELECT name, size FROM pictures WHERE confirmed = ? ORDER BY id LIMIT ?",
+                                   (int(confirmed), limit)).fetchall()
+
+    def summary(self):
+        """
+        Returns:
+            dict: number of pictures, total size, time of last picture and free space
+        """
+        with self.lock:
+            self.open()
+            usage = shutil.disk_usage(self.directory if self.directory.is_dir() else ".")
+            return {"number of pict": self.count,
+                    "pictures size (MB)": round(self.total_size / 1e6, 1),
+                    "confirmed pict": self.confirmed_count,
+                    "last picture": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.last_mtime)) if self.last_mtime else "",
+                    "free space (MB)": round(usage.free / 1e6, 1),
+                   }
+
+    def since(self, cursor, limit):
+        """
+        return the pictures indexed after cursor
+
+        Args:
+            cursor (int): id of the last picture already known (0 for all pictures)
+            limit (int): maximum number of pictures
+
+        Returns:
+            list: (id, name, size, CRC32, modification time) of pictures
+            bool: True if there is no more picture after the last one returned
+        """
+        with self.lock:
+            self.open()
+            rows = self.db.execute("SELECT id, name, size, crc, mtime FROM pictures WHERE id > ? ORDER BY id LIMIT ?",
+                                   (cursor, limit + 1)).fetchall()
+        complete = len(rows) <= limit
+        rows = rows[:limit]
+
+        # CRC32 of pictures indexed by rebuild are computed on first request
+        result = []
+        for id_, name, size, crc, mtime in rows:
+            if crc is None:
+                crc = file_crc32(self.directory / name)
+                with self.lock:
+                    self.db.execute("UPDATE pictures SET crc = ? WHERE id = ?", (crc, id_))
+            result.append((id_, name, size, crc, mtime))
+        with self.lock:
+            self.db.commit()
+        return result, complete
@@ -0,0 +1,101 @@
+"""
+downscaled previews of the time lapse frames pushed to the coordinator
+
+The previews are generated in a separate thread from the last saved frame
+(frames saved while a preview is being made are ignored) and sent at most every min_interval seconds.
+Require Pillow (python3 -m pip install pillow), the previews are disabled if it is not installed.
+"""
+
+import io
+import time
+import threading
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+
+def make_preview(path, size=(160, 120), quality=60):
+    """
+    return a downscaled JPEG version of the picture
+
+    Args:
+        path (str): path of picture file
+        size (tuple): maximum width and height of the preview
+        quality (int): JPEG quality of the preview
+
+    Returns:
+        bytes: content of JPEG preview
+    """
+    with Image.open(path) as img:
+        # the JPEG decoder downscales while decoding (much faster than decoding the full resolution)
+        img.draft("RGB", size)
+        img = img.convert("RGB")
+        img.thumbnail(size)
+        output = io.BytesIO()
+        img.save(output, format="JPEG", quality=quality)
+    return output.getvalue()
+
+
+class Preview_sender(threading.Thread):
+    """
+    thread generating and sending the previews
+    """
+
+    def __init__(self, send, size=(160, 120), quality=60, min_interval=60, log=print):
+        """
+        Args:
+            send (callable): called with (file name, preview bytes)
+            size (tuple): maximum width and height of the previews
+            quality (int): JPEG quality of the previews
+            min_interval (float): minimum time (in seconds) between 2 previews
+            log (callable): function for logging errors
+        """
+        super().__init__(name="preview", daemon=True)
+        self.send = send
+        self.size = size
+        self.quality = quality
+        self.min_interval = min_interval
+        self.log = log
+        self.latest = None
+        self.last_sent = None
+        self.stopped = False
+        self.condition = threading.Condition()
+
+    def offer(self, path):
+        """
+        propose a saved frame for the next preview (does not block the caller)
+        """
+        with self.condition:
+            self.latest = path
+            self.condition.notify()
+
+    def stop(self):
+        """
+        stop the thread (the pending frame is not sent)
+        """
+        with self.condition:
+            self.stopped = True
+            self.condition.notify()
+
+    def run(self):
+        if Image is None:
+            self.log("previews disabled: Pillow is not installed")
+            return
+        while True:
+            with self.condition:
+                while self.latest is None and not self.stopped:
+                    self.condition.wait()
+                if self.stopped:
+                    return
+                # rate limit
+                if self.last_sent is not None and time.monotonic() - self.last_sent < self.min_interval:
+                    self.condition.wait(self.min_interval - (time.monotonic() - self.last_sent))
+                    continue
+                path, self.latest = self.latest, None
+            try:
+                self.send(path, make_preview(path, self.size, self.quality))
+                self.last_sent = time.monotonic()
+            except Exception as exc:
+                self.log(f"error sending preview of {path}: {exc}")
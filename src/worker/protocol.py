@@ -0,0 +1,298 @@
+"""
+framing protocol used by coordinator and worker
+
+This file is shared by the coordinator and the worker:
+src/coordinator/protocol.py and src/worker/protocol.py must be kept identical.
+
+A message is made of:
+
+    header (HEADER.size bytes): magic, protocol version, message type, flags, metadata length, payload length
+    metadata: JSON encoded dictionary (UTF-8)
+    payload: raw binary sections (for example picture bytes) concatenated,
+             the names, sizes and codecs of the sections are listed in metadata["payloads"]
+
+Several messages can be sent on the same connection.
+
+Compression: the first message sent on a new connection is a MSG_HELLO listing the codecs supported by the sender.
+A side compresses the messages it sends only with a codec accepted by the other side.
+The metadata is compressed if the header flags contain the codec flag,
+each payload section is compressed independently (JPEG and other compressed data are sent as is).
+Metadata and sections smaller than min_size bytes are never compressed.
+"""
+
+import json
+import lzma
+import time
+import struct
+import threading
+import zlib
+
+MAGIC = b"TL"
+PROTOCOL_VERSION = 1
+
+# message types
+MSG_COMMAND = 1  # coordinator -> worker
+MSG_REPLY = 2  # worker -> coordinator
+MSG_KEEPALIVE = 3  # sent on idle long-lived connections, ignored by the receiver
+MSG_HELLO = 4  # first message of a connection: {"codecs": [...], "hostname": ..., "address": ...}
+
+# flags
+FLAG_NONE = 0
+FLAG_ZLIB = 1  # metadata compressed with zlib
+FLAG_LZMA = 2  # metadata compressed with lzma
+
+# codec name -> header flag, compress, decompress
+CODECS = {"zlib": (FLAG_ZLIB, lambda data: zlib.compress(data, 6), zlib.decompress),
+          "lzma": (FLAG_LZMA, lambda data: lzma.compress(data, preset=1), lzma.decompress),
+         }
+FLAG_CODECS = {flag: name for name, (flag, _, _) in CODECS.items()}
+
+# magic, version, type, flags, (padding), metadata length, payload length
+HEADER = struct.Struct("!2sBBBxIQ")
+
+MAX_METADATA_SIZE = 64 * 1024 * 1024
+
+# signatures of data already compressed (JPEG, PNG, gzip, zip)
+COMPRESSED_SIGNATURES = (b"\xff\xd8\xff", b"\x89PNG", b"\x1f\x8b", b"PK\x03\x04")
+
+
+class ProtocolError(Exception):
+    """
+    malformed message or unsupported protocol version
+    """
+
+
+class Compression_stats:
+    """
+    bytes saved and time spent by compression
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.compressed = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.compression_time = 0.0
+        self.decompression_time = 0.0
+
+    def add_compression(self, bytes_in, bytes_out, duration):
+        with self.lock:
+            self.compressed += 1
+            self.bytes_in += bytes_in
+            self.bytes_out += bytes_out
+            self.compression_time += duration
+
+    def add_decompression(self, duration):
+        with self.lock:
+            self.decompression_time += duration
+
+    def snapshot(self):
+        with self.lock:
+            return {"compressed sections": self.compressed,
+                    "bytes saved": self.bytes_in - self.bytes_out,
+                    "compression ratio": round(self.bytes_out / self.bytes_in, 3) if self.bytes_in else 1,
+                    "compression time (ms)": round(self.compression_time * 1000, 1),
+                    "decompression time (ms)": round(self.decompression_time * 1000, 1),
+                   }
+
+
+compression_stats = Compression_stats()
+
+
+def choose_codec(peer_codecs, preferred):
+    """
+    return the first codec of preferred accepted by the peer (None if no common codec)
+    """
+    for codec in preferred:
+        if codec in CODECS and codec in (peer_codecs or []):
+            return codec
+    return None
+
+
+def is_compressed(content):
+    return content.startswith(COMPRESSED_SIGNATURES)
+
+
+def compress(codec, content, min_size):
+    """
+    compress content with codec if it is worth it
+
+    Returns:
+        bytes: content (compressed or not)
+        bool: True if compressed
+    """
+    if codec is None or len(content) < min_size or is_compressed(content):
+        return content, False
+    t1 = time.perf_counter()
+    compressed = CODECS[codec][1](content)
+    if len(compressed) >= len(content):
+        return content, False
+    compression_stats.add_compression(len(content), len(compressed), time.perf_counter() - t1)
+    return compressed, True
+
+
+def decompress(codec, content):
+    if codec not in CODECS:
+        raise ProtocolError(f"unsupported codec {codec}")
+    t1 = time.perf_counter()
+    content = CODECS[codec][2](content)
+    compression_stats.add_decompression(time.perf_counter() - t1)
+    return content
+
+
+def encode_header(msg_type, flags, metadata_length, payload_length):
+    return HEADER.pack(MAGIC, PROTOCOL_VERSION, msg_type, flags, metadata_length, payload_length)
+
+
+def decode_header(header):
+    """
+    decode a message header
+
+    Returns:
+        int: message type
+        int: flags
+        int: metadata length
+        int: payload length
+    """
+    magic, version, msg_type, flags, metadata_length, payload_length = HEADER.unpack(header)
+    if magic != MAGIC:
+        raise ProtocolError(f"wrong magic {magic!r}")
+    if version != PROTOCOL_VERSION:
+        raise ProtocolError(f"unsupported protocol version {version}")
+    if metadata_length > MAX_METADATA_SIZE:
+        raise ProtocolError(f"metadata too large ({metadata_length} bytes)")
+    return msg_type, flags, metadata_length, payload_length
+
+
+def encode_message(metadata, payloads=None, msg_type=MSG_REPLY, flags=FLAG_NONE, codec=None, min_size=512):
+    """
+    encode a message
+
+    Args:
+        metadata (dict): JSON serializable dictionary
+        payloads (dict): name -> bytes of the binary sections
+        msg_type (int): message type
+        flags (int): message flags
+        codec (str): compression codec accepted by the receiver (None for no compression)
+        min_size (int): metadata and sections smaller than min_size bytes are not compressed
+
+    Returns:
+        list: header + metadata (bytes) followed by the payload sections
+    """
+    payloads = payloads or {}
+    metadata = dict(metadata)
+    sections = []
+    if payloads:
+        metadata["payloads"] = []
+        for name, content in payloads.items():
+            content, compressed = compress(codec, content, min_size)
+            metadata["payloads"].append([name, len(content), codec if compressed else ""])
+            sections.append(content)
+
+    metadata_bytes = json.dumps(metadata, separators=(",", ":")).encode("utf-8")
+    metadata_bytes, compressed = compress(codec, metadata_bytes, min_size)
+    if compressed:
+        flags |= CODECS[codec][0]
+    payload_length = sum(len(content) for content in sections)
+
+    return [encode_header(msg_type, flags, len(metadata_bytes), payload_length) + metadata_bytes] + sections
+
+
+def send_message(sock, metadata, payloads=None, msg_type=MSG_REPLY, flags=FLAG_NONE, codec=None, min_size=512):
+    """
+    send a message on a connected socket
+
+    Returns:
+        int: number of bytes sent
+    """
+    sent = 0
+    for part in encode_message(metadata, payloads, msg_type, flags, codec, min_size):
+        sock.sendall(part)
+        sent += len(part)
+    return sent
+
+
+def recv_exactly(sock, size, buffer_size=65536):
+    """
+    read exactly size bytes from socket
+
+    Returns:
+        bytes: data read (None if the connection was closed before the first byte)
+    """
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(min(buffer_size, size - len(data)))
+        if not chunk:
+            if not data:
+                return None
+            raise ProtocolError(f"connection closed after {len(data)} of {size} bytes")
+        data += chunk
+    return bytes(data)
+
+
+def recv_to_file(sock, size, file_object, buffer_size=65536):
+    """
+    read exactly size bytes from socket and write them to file_object
+    (only buffer_size bytes are kept in memory)
+    """
+    remaining = size
+    while remaining:
+        chunk = sock.recv(min(buffer_size, remaining))
+        if not chunk:
+            raise ProtocolError(f"connection closed after {size - remaining} of {size} bytes")
+        file_object.write(chunk)
+        remaining -= len(chunk)
+
+
+def recv_message(sock, buffer_size=65536, payload_sink=None, stats=None):
+    """
+    receive a message from a connected socket
+
+    Args:
+        sock (socket): connected socket
+        buffer_size (int): maximum size of a single read
+        payload_sink (function): called with (section name, section size, metadata) before reading each payload section.
+                                 If it returns a writable file object the section is streamed into it
+                                 (and is not added to the returned payloads)
+        stats (dict): if given, stats["bytes"] is set to the size of the message (header included)
+
+    Returns:
+        int: message type
+        int: flags
+        dict: metadata
+        dict: payloads (name -> bytes)
+
+        or None if the connection was closed
+    """
+    header = recv_exactly(sock, HEADER.size, buffer_size)
+    if header is None:
+        return None
+    msg_type, flags, metadata_length, payload_length = decode_header(header)
+    if stats is not None:
+        stats["bytes"] = HEADER.size + metadata_length + payload_length
+
+    metadata_bytes = recv_exactly(sock, metadata_length, buffer_size) if metadata_length else b"{}"
+    if metadata_bytes is None:
+        raise ProtocolError("connection closed after the header")
+    for flag, codec in FLAG_CODECS.items():
+        if flags & flag:
+            metadata_bytes = decompress(codec, metadata_bytes)
+    metadata = json.loads(metadata_bytes)
+
+    payloads = {}
+    sections = metadata.pop("payloads", [])
+    if sum(section[1] for section in sections) != payload_length:
+        raise ProtocolError("payload sections do not match payload length")
+    for name, size, *codec in sections:
+        codec = codec[0] if codec else ""
+        file_object = payload_sink(name, size, metadata) if payload_sink and not codec else None
+        if file_object is not None:
+            recv_to_file(sock, size, file_object, buffer_size)
+            continue
+        payloads[name] = recv_exactly(sock, size, buffer_size) if size else b""
+        if payloads[name] is None:
+            raise ProtocolError("connection closed in payload")
+        if codec:
+            payloads[name] = decompress(codec, payloads[name])
+
+    return msg_type, flags, metadata, payloads
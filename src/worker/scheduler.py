@@ -0,0 +1,110 @@
+"""
+drift-free scheduling of the time lapse frames
+
+The deadlines of the frames are computed from a monotonic clock anchored when the time lapse starts:
+deadline of frame n = anchor + n * interval.
+The time spent capturing, logging and sending messages does not accumulate
+and a change of the wall clock (sync time) does not move the next frames.
+"""
+
+import math
+import time
+
+
+class Frame_scheduler:
+    """
+    compute the deadlines of the frames and collect statistics about lateness
+    """
+
+    def __init__(self, interval, start_epoch, end_epoch, late_tolerance=0.5):
+        """
+        Args:
+            interval (float): seconds between 2 frames
+            start_epoch (float): time of the first frame (seconds since epoch)
+            end_epoch (float): no frame after this time (seconds since epoch)
+            late_tolerance (float): a frame captured more than late_tolerance seconds after its deadline is late
+        """
+        self.interval = interval
+        self.late_tolerance = late_tolerance
+
+        # wall clock -> monotonic clock, done once
+        now_epoch, now_monotonic = time.time(), time.monotonic()
+        self.anchor = now_monotonic + (start_epoch - now_epoch)
+        self.frames_number = int(math.floor((end_epoch - start_epoch) / interval)) + 1 if end_epoch >= start_epoch else 0
+
+        # time lapse started after the start time: begin with the next frame
+        self.index = max(0, math.ceil((now_monotonic - self.anchor) / interval))
+
+        self.taken = 0
+        self.missed = 0
+        self.late = 0
+        self.delay_mean = 0.0
+        self.delay_m2 = 0.0
+        self.delay_max = 0.0
+
+    def deadline(self, index):
+        """
+        monotonic time of the frame index
+        """
+        return self.anchor + index * self.interval
+
+    def finished(self):
+        return self.index >= self.frames_number
+
+    def wait(self, stop_event):
+        """
+        wait for the deadline of the next frame.
+        Frames whose deadline is older than one interval are counted as missed and skipped
+
+        Args:
+            stop_event (threading.Event): stop waiting when set
+
+        Returns:
+            float: deadline of the frame (monotonic) or None if the time lapse is finished or stopped
+        """
+        now = time.monotonic()
+        deadline = self.deadline(self.index)
+        if now > deadline + self.interval:
+            skipped = min(int((now - deadline) / self.interval), self.frames_number - self.index)
+            self.missed += skipped
+            self.index += skipped
+            deadline = self.deadline(self.index)
+
+        if self.finished():
+            return None
+        if stop_event.wait(max(0, deadline - now)):
+            return None
+        self.index += 1
+        return deadline
+
+    def record(self, deadline, capture_time):
+        """
+        record the delay between the deadline and the actual capture time of a frame
+
+        Args:
+            deadline (float): deadline returned by wait
+            capture_time (float): monotonic time of the capture
+        """
+        delay = capture_time - deadline
+        self.taken += 1
+        if delay > self.late_tolerance:
+            self.late += 1
+        # running mean and variance (Welford)
+        diff = delay - self.delay_mean
+        self.delay_mean += diff / self.taken
+        self.delay_m2 += diff * (delay - self.delay_mean)
+        self.delay_max = max(self.delay_max, delay)
+
+    def stats(self):
+        """
+        Returns:
+            dict: statistics of the time lapse
+        """
+        return {"frames taken": self.taken,
+                "frames missed": self.missed,
+                "frames late": self.late,
+                "frames remaining": max(0, self.frames_number - self.index),
+                "mean delay (ms)": round(self.delay_mean * 1000, 1),
+                "jitter (ms)": round(math.sqrt(self.delay_m2 / self.taken) * 1000, 1) if self.taken else 0,
+                "max delay (ms)": round(self.delay_max * 1000, 1),
+               }
@@ -0,0 +1,155 @@
+"""
+many simulated workers on one machine for the load tests of the coordinator
+
+Each simulated worker is a Worker (see worker_core.py) with a Fake_camera (see fake_camera.py),
+its own directory (log, picture index, pictures) and its own address on a loopback transport.
+The workers run in one process or are distributed over a pool of processes (--processes).
+
+Examples:
+
+    python3 simulated_fleet.py 50 --inventory /tmp/fleet.json
+    python3 simulated_fleet.py 200 --processes 4 --latency 0.2 --jitter 0.1 --inventory /tmp/fleet.json
+    python3 simulated_fleet.py 20 --transport tcp --coordinator 127.0.0.1 --inventory /tmp/fleet.csv
+
+The inventory file lists the simulated workers: use it as DEVICES_FILE of the coordinator
+(with the same TRANSPORT and TRANSPORT_OPTIONS). The workers stop on SIGINT or SIGTERM.
+"""
+
+import sys
+import csv
+import json
+import signal
+import pathlib
+import argparse
+import threading
+import multiprocessing
+
+from transport import get_transport
+from fake_camera import Fake_camera
+
+
+def parse_arguments(argv):
+    parser = argparse.ArgumentParser(description="simulated workers for the load tests of the coordinator")
+    parser.add_argument("number", type=int, help="number of simulated workers")
+    parser.add_argument("--processes", type=int, default=1, help="number of processes running the workers (default: 1)")
+    parser.add_argument("--transport", choices=("unix", "tcp"), default="unix", help="loopback transport (default: unix)")
+    parser.add_argument("--socket-dir", default="/tmp/time_lapse_sockets",
+                        help="directory of the sockets (unix transport, default: /tmp/time_lapse_sockets)")
+    parser.add_argument("--first-port", type=int, default=5610,
+                        help="port of the first worker (tcp transport, default: 5610)")
+    parser.add_argument("--coordinator", default="coordinator",
+                        help="address of the coordinator (LISTEN_ADDRESS of the coordinator, default: coordinator)")
+    parser.add_argument("--prefix", default="sim", help="prefix of the worker names (default: sim)")
+    parser.add_argument("--directory", default="/tmp/time_lapse_fleet",
+                        help="directory of the workers directories (default: /tmp/time_lapse_fleet)")
+    parser.add_argument("--bytes-per-pixel", type=float, default=0.2,
+                        help="size of the pictures relative to the resolution (default: 0.2)")
+    parser.add_argument("--latency", type=float, default=0.1, help="duration of a capture in seconds (default: 0.1)")
+    parser.add_argument("--jitter", type=float, default=0.0,
+                        help="maximum random duration added to a capture in seconds (default: 0)")
+    parser.add_argument("--inventory", help="inventory file (.json or .csv) of the workers written for the coordinator")
+    return parser.parse_args(argv)
+
+
+def fleet(args):
+    """
+    return the name and the address of each simulated worker
+    """
+    names = [f"{args.prefix}{idx:03d}" for idx in range(args.number)]
+    if args.transport == "tcp":
+        return [(name, f"127.0.0.1:{args.first_port + idx}") for idx, name in enumerate(names)]
+    return [(name, name) for name in names]
+
+
+def write_inventory(path, workers):
+    """
+    write the inventory of the workers (see registry.py of the coordinator)
+    """
+    with open(path, "w", newline="", encoding="utf-8") as f_out:
+        if path.lower().endswith(".csv"):
+            writer = csv.writer(f_out)
+            writer.writerow(["id", "address", "groups", "tags"])
+            for process, name, address in workers:
+                writer.writerow([name, address, "simulated", f"process{process}"])
+        else:
+            json.dump({name: {"address": address, "groups": ["simulated"], "tags": [f"process{process}"]}
+                       for process, name, address in workers}, f_out, indent=1)
+
+
+def run_workers(args, workers, stop_event):
+    """
+    run workers (list of (name, address)) until stop_event is set
+    """
+    # imported here: the configuration and the log of the workers are only needed in the processes running them
+    from worker_core import Worker
+
+    transport = get_transport(args.transport,
+                              {"socket_dir": args.socket_dir} if args.transport == "unix" else {})
+
+    def camera_factory():
+        return Fake_camera(bytes_per_pixel=args.bytes_per_pixel, latency=args.latency, jitter=args.jitter)
+
+    instances, threads = [], []
+    for name, address in workers:
+        work_dir = pathlib.Path(args.directory) / name
+        (work_dir / "pictures").mkdir(parents=True, exist_ok=True)
+        worker = Worker(name, camera_factory, transport, listen_address=address, coordinator_address=args.coordinator,
+                        pictures_dir=str(work_dir / "pictures"), work_dir=str(work_dir))
+        instances.append(worker)
+        threads.append(threading.Thread(target=worker.run, name=name, daemon=True))
+        threads[-1].start()
+
+    while not stop_event.wait(1):
+        pass
+    for worker in instances:
+        worker.stop()
+    for thread, worker in zip(threads, instances):
+        thread.join()
+        worker.close()
+
+
+def run_process(args, workers, stop_event):
+    """
+    run workers in a process of the pool (stopped by the main process)
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    run_workers(args, workers, stop_event)
+
+
+def main(argv=None):
+    args = parse_arguments(argv)
+    workers = fleet(args)
+    processes_number = max(1, min(args.processes, len(workers)))
+    # workers of each process
+    slices = [workers[idx::processes_number] for idx in range(processes_number)]
+
+    if args.inventory:
+        write_inventory(args.inventory, [(process, name, address)
+                                         for process, slice_ in enumerate(slices) for name, address in slice_])
+
+    # set by the signal handlers (a multiprocessing event cannot be set by a handler interrupting its own wait)
+    stopping = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopping.set())
+    signal.signal(signal.SIGINT, lambda signum, frame: stopping.set())
+
+    print(f"{len(workers)} simulated workers in {processes_number} process(es), coordinator: {args.coordinator}", flush=True)
+    if processes_number == 1:
+        run_workers(args, workers, stopping)
+        return 0
+
+    context = multiprocessing.get_context("spawn")
+    stop_event = context.Event()
+    processes = [context.Process(target=run_process, args=(args, slice_, stop_event), name=f"fleet{idx}")
+                 for idx, slice_ in enumerate(slices)]
+    for process in processes:
+        process.start()
+    while not stopping.wait(1) and any(process.is_alive() for process in processes):
+        pass
+    stop_event.set()
+    for process in processes:
+        process.join()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,181 @@
+"""
+disk space management of the pictures directory
+
+A thread checks the free space every check_interval seconds. When the free space is below min_free
+(or the pictures are larger than max_pictures), the oldest pictures are deleted until target_free is reached:
+first the pictures already received by the coordinator (confirmed, see Picture_index.confirm),
+then, with the ring buffer policy, the oldest pictures not yet received.
+The pictures are deleted by batches separated by a pause so that the deletion does not compete
+with the writing of the captured frames.
+
+The capture rate is measured from the pictures added to the index: the summary gives the headroom
+and the hours of capture remaining before pictures not yet received must be deleted (or the card is full).
+"""
+
+import os
+import sys
+import time
+import shutil
+import threading
+import collections
+
+from metrics import metrics
+
+# pictures policies when no confirmed picture is left
+POLICY_RING = "ring"
+POLICY_KEEP = "keep"
+
+
+class Storage_manager(threading.Thread):
+    """
+    thread deleting the oldest pictures when the free space is low
+    """
+
+    def __init__(self, picture_index, min_free=500e6, target_free=1000e6, max_pictures=0, policy=POLICY_RING,
+                 check_interval=30, batch_size=50, batch_pause=0.5, rate_window=3600, name="storage", log=None):
+        """
+        Args:
+            picture_index (Picture_index): index of the pictures (directory, confirmed pictures)
+            min_free (float): free space (in bytes) under which pictures are deleted
+            target_free (float): free space (in bytes) reached by the deletion
+            max_pictures (float): maximum size (in bytes) of the pictures, 0 for no limit
+            policy (str): POLICY_RING (the oldest pictures not yet received are deleted when no confirmed picture is left)
+                          or POLICY_KEEP (only the confirmed pictures are deleted)
+            check_interval (float): seconds between two checks of the free space
+            batch_size (int): maximum number of pictures deleted in one batch
+            batch_pause (float): seconds between two batches
+            rate_window (float): duration (in seconds) of the capture rate measurement
+            name (str): name of the worker (label of the metrics)
+            log (callable): write a message in the log of the worker
+        """
+        super().__init__(name=f"storage_{name}", daemon=True)
+        self.picture_index = picture_index
+        self.min_free = min_free
+        self.target_free = max(target_free, min_free)
+        self.max_pictures = max_pictures
+        self.policy = policy
+        self.check_interval = check_interval
+        self.batch_size = batch_size
+        self.batch_pause = batch_pause
+        self.log = log or (lambda msg: None)
+        self.stop_event = threading.Event()
+        # (monotonic time, bytes added to the index) of the last checks
+        self.samples = collections.deque(maxlen=max(2, int(rate_window / check_interval) + 1))
+        self.deleted = 0
+        self.deleted_unconfirmed = 0
+        metrics.set_gauge("storage_free_bytes", self.free_space, worker=name)
+
+    def free_space(self):
+        directory = self.picture_index.directory
+        return shutil.disk_usage(directory if directory.is_dir() else ".").free
+
+    def capture_rate(self):
+        """
+        Returns:
+            float: bytes of pictures added per hour during the last rate_window seconds (0 if unknown)
+        """
+        if len(self.samples) < 2:
+            return 0.0
+        (t1, size1), (t2, size2) = self.samples[0], self.samples[-1]
+        return (size2 - size1) / (t2 - t1) * 3600 if t2 > t1 else 0.0
+
+    def excess(self):
+        """
+        Returns:
+            float: bytes to delete (0 if the free space and the size of the pictures are within the limits)
+        """
+        free = self.free_space()
+        to_free = self.target_free - free if free < self.min_free else 0
+        if self.max_pictures and self.picture_index.total_size > self.max_pictures:
+            to_free = max(to_free, self.picture_index.total_size - self.max_pictures)
+        return to_free
+
+    def delete_batch(self, to_free):
+        """
+        delete the oldest pictures of one batch (confirmed pictures first)
+
+        Returns:
+            int: bytes deleted (0 if no picture can be deleted)
+        """
+        confirmed = True
+        candidates = self.picture_index.oldest(self.batch_size, confirmed=True)
+        if not candidates and self.policy == POLICY_RING:
+            confirmed = False
+            candidates = self.picture_index.oldest(self.batch_size, confirmed=False)
+        if not candidates:
+            return 0
+
+        t1 = time.monotonic()
+        names, freed = [], 0
+        for name, size in candidates:
+            if freed >= to_free:
+                break
+            try:
+                os.remove(self.picture_index.directory / name)
+            except FileNotFoundError:
+                pass
+            except OSError:
+                self.log(f"error deleting {name}")
+                continue
+            names.append(name)
+            freed += size
+        if names:
+            self.picture_index.remove(names)
+        metrics.observe("storage_delete_batch_seconds", time.monotonic() - t1)
+        metrics.inc("storage_deleted_pictures_total", len(names), confirmed="yes" if confirmed else "no")
+        self.deleted += len(names)
+        if not confirmed:
+            self.deleted_unconfirmed += len(names)
+        self.log(f"{len(names)} {'confirmed' if confirmed else 'unconfirmed'} pictures deleted ({freed / 1e6:.1f} MB)")
+        return freed
+
+    def check(self):
+        """
+        measure the capture rate and delete pictures until the limits are respected
+        """
+        self.samples.append((time.monotonic(), self.picture_index.added_size))
+        to_free = self.excess()
+        if to_free <= 0:
+            return
+        self.log(f"low space: {to_free / 1e6:.1f} MB to free")
+        while to_free > 0 and not self.stop_event.is_set():
+            freed = self.delete_batch(to_free)
+            if not freed:
+                self.log("low space: no picture can be deleted")
+                break
+            to_free -= freed
+            # let the captured frames be written between the batches
+            self.stop_event.wait(self.batch_pause)
+
+    def run(self):
+        while True:
+            try:
+                self.check()
+            except:
+                self.log(f"error checking the storage: {sys.exc_info()[1]}")
+            if self.stop_event.wait(self.check_interval):
+                return
+
+    def close(self):
+        self.stop_event.set()
+        if self.is_alive():
+            self.join()
+
+    def summary(self):
+        """
+        Returns:
+            dict: headroom, space reclaimable from the confirmed pictures, capture rate and hours of capture remaining
+        """
+        headroom = self.free_space() - self.min_free
+        if self.max_pictures:
+            headroom = min(headroom, self.max_pictures - self.picture_index.total_size)
+        reclaimable = self.picture_index.confirmed_size
+        rate = self.capture_rate()
+        return {"storage headroom (MB)": round(headroom / 1e6, 1),
+                "reclaimable (MB)": round(reclaimable / 1e6, 1),
+                "capture rate (MB/h)": round(rate / 1e6, 1),
+                # hours before pictures not yet received are deleted (ring buffer) or the captures fail
+                "hours remaining": round(max(0, headroom + reclaimable) / rate, 1) if rate else "",
+                "pictures deleted": self.deleted,
+                "unconfirmed pictures deleted": self.deleted_unconfirmed,
+               }
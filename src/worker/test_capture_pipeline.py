@@ -0,0 +1,112 @@
+"""
+tests of the high-rate capture pipeline (capture_pipeline.py) with a stub camera
+
+    cd src/worker
+    python3 -m pytest test_capture_pipeline.py
+"""
+
+import time
+import pathlib
+import tempfile
+import threading
+import unittest
+
+from scheduler import Frame_scheduler
+from capture_pipeline import Frame_writer, capture_frames
+
+
+class Stub_camera:
+    """
+    camera writing numbered frames after a fixed capture latency
+    """
+
+    def __init__(self, latency=0.002):
+        self.latency = latency
+        self.captures = 0
+
+    def capture_continuous(self, output, format="jpeg", use_video_port=False):
+        while True:
+            time.sleep(self.latency)
+            self.captures += 1
+            output.write(f"frame {self.captures}".encode())
+            yield output
+
+
+class Test_capture_pipeline(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.count = 0
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def file_name(self):
+        self.count += 1
+        return str(pathlib.Path(self.directory.name) / f"frame_{self.count:04d}.jpg")
+
+    def run_pipeline(self, interval, duration, writer):
+        start = time.time() + 0.05
+        scheduler = Frame_scheduler(interval, start, start + duration)
+        writer.start()
+        capture_frames(Stub_camera(), scheduler, threading.Event(), writer, self.file_name)
+        writer.close()
+        return scheduler
+
+    def test_all_frames_written(self):
+        batches = []
+        writer = Frame_writer(queue_size=16, batch_size=8, on_batch=lambda paths, contents: batches.append(paths))
+        scheduler = self.run_pipeline(0.05, 1.0, writer)
+
+        self.assertEqual(scheduler.missed, 0)
+        self.assertEqual(scheduler.taken, scheduler.frames_number)
+        self.assertEqual(writer.written, scheduler.taken)
+        self.assertEqual(sum(len(paths) for paths in batches), scheduler.taken)
+        files = sorted(pathlib.Path(self.directory.name).glob("*.jpg"))
+        self.assertEqual(len(files), scheduler.taken)
+        self.assertEqual([f.read_bytes() for f in files], [f"frame {i + 1}".encode() for i in range(len(files))])
+
+    def test_backpressure_when_queue_full(self):
+        # slow disk: each batch of one frame takes 50 ms, the frames are captured every 10 ms
+        writer = Frame_writer(queue_size=2, batch_size=1, on_batch=lambda paths, contents: time.sleep(0.05))
+        scheduler = self.run_pipeline(0.01, 0.5, writer)
+
+        # the capture waited for the writer instead of growing the queue or dropping frames
+        self.assertGreater(writer.blocked_time, 0.1)
+        self.assertLessEqual(writer.max_depth, 2)
+        # the frames that could not be captured in time are counted as missed, all the captured ones are written
+        self.assertGreater(scheduler.missed, 0)
+        self.assertEqual(writer.written, scheduler.taken)
+        self.assertEqual(len(list(pathlib.Path(self.directory.name).glob("*.jpg"))), scheduler.taken)
+
+    def test_write_errors(self):
+        # missing directory: every write fails, the writer keeps draining the queue and close returns
+        self.directory.cleanup()
+        messages = []
+        writer = Frame_writer(queue_size=2, batch_size=1, log=messages.append)
+        scheduler = self.run_pipeline(0.02, 0.3, writer)
+
+        self.assertFalse(writer.is_alive())
+        self.assertGreater(scheduler.taken, 0)
+        self.assertEqual(writer.written, 0)
+        self.assertEqual(writer.errors, scheduler.taken)
+        self.assertEqual(len(messages), scheduler.taken)
+
+    def test_stopped_writer(self):
+        # the writer thread stopped: put raises instead of blocking on the full queue and close returns
+        writer = Frame_writer(queue_size=1, batch_size=1)
+
+        def fail():
+            raise RuntimeError("writer failure")
+
+        writer.write_frames = fail
+        writer.start()
+        writer.join(5)
+        self.assertIsInstance(writer.failure, RuntimeError)
+        with self.assertRaises(OSError):
+            writer.put(self.file_name(), b"frame")
+        writer.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
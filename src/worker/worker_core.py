@@ -0,0 +1,937 @@
+"""
+worker of the time lapse (commands of the coordinator, camera and time lapse)
+
+Used by bluetooth_worker.py (one worker with the camera of the Raspberry Pi) and by simulated_fleet.py
+(many simulated workers with fake cameras for the load tests of the coordinator).
+The camera and the transport are given to the worker: this module does not require picamera or pybluez.
+The workers of the same process share the metrics (see metrics.py).
+"""
+
+import os
+import sys
+import logging
+import datetime
+import time
+import json
+import socket
+import subprocess
+import pathlib
+import threading
+import re
+import concurrent.futures
+
+from config import *
+from transport import WORKER_PORT, COORDINATOR_PORT, COORDINATOR_BULK_PORT
+from protocol import recv_message, MSG_REPLY, MSG_KEEPALIVE, MSG_HELLO, CODECS, compression_stats
+from connection import Connection_pool
+from scheduler import Frame_scheduler
+from capture_pipeline import Frame_writer, capture_frames
+from camera_manager import Camera_manager
+from storage_manager import Storage_manager
+from preview import Preview_sender
+from picture_index import Picture_index
+from metrics import metrics, write_metrics, SIZE_BUCKETS
+
+__version__ = "0.0.3"
+__version_date__ = "2020-04-02"
+
+
+def date_iso():
+    return datetime.datetime.now().isoformat().split(".")[0].replace("T", "_")
+
+
+class Request(str):
+    """
+    message received from the coordinator with the id of the request (None if the coordinator waits no reply)
+    and its reception time (time.time() when the message was decoded, None if unknown).
+    The handlers reply with {"reply_to": msg, ...}: sendMessageTo adds the request id to the reply
+    """
+
+    def __new__(cls, msg, request_id=None, received=None):
+        request = super().__new__(cls, msg)
+        request.request_id = request_id
+        request.received = received
+        return request
+
+
+class Time_lapse(threading.Thread):
+
+    def __init__(self, worker, group=None, target=None, name=None,
+                 args=(), kwargs=None, *, daemon=None):
+        """
+        Args:
+            worker (Worker): worker running the time lapse (camera, picture index and connection to the coordinator)
+        """
+        super().__init__(group=group, target=target, name=name,
+                         daemon=daemon)
+        self.worker = worker
+        self.args = args
+        self.kwargs = kwargs
+        self.stop_event = threading.Event()
+        self.scheduler = None
+        self.writer = None
+        self.preview = None
+
+    def stop(self):
+        """
+        stop the time lapse (the current frame is finished)
+        """
+        self.stop_event.set()
+
+    def stats(self):
+        """
+        Returns:
+            dict: statistics of the frames (see Frame_scheduler.stats)
+        """
+        stats = self.scheduler.stats() if self.scheduler else {}
+        if self.writer:
+            stats.update(self.writer.stats())
+        return stats
+
+    def frames_saved(self, paths, contents):
+        """
+        called by the writer thread after each batch
+        """
+        self.worker.picture_index.add(paths, contents, time_offset=self.worker.clock_offset)
+        self.worker.log(f"{len(paths)} pictures saved, last: {paths[-1]}")
+        if self.preview:
+            self.preview.offer(paths[-1])
+
+    def run_pipeline(self, width, height):
+        """
+        capture the frames in memory and write them to disk in a separate thread (short intervals)
+        """
+
+        def file_name():
+            # milliseconds are added: several frames can be taken in the same second
+            now = datetime.datetime.now()
+            return str(pathlib.Path(self.kwargs["directory"]) / "{prefix}_{date}.{ms:03d}.jpg".format(prefix=self.kwargs["prefix"],
+                                                                                                   date=now.strftime("%Y-%m-%d_%H:%M:%S"),
+                                                                                                   ms=now.microsecond // 1000))
+
+        self.writer = Frame_writer(queue_size=PIPELINE_QUEUE_SIZE,
+                                   batch_size=PIPELINE_BATCH_SIZE,
+                                   on_batch=self.frames_saved,
+                                   log=self.worker.log)
+        self.writer.start()
+        metrics.set_gauge("writer_queue_depth", self.writer.queue.qsize, worker=self.worker.hostname)
+        # the camera stays locked (and warm) during the whole time lapse
+        self.worker.camera.lock((width, height))
+        try:
+            capture_frames(self.worker.camera, self.scheduler, self.stop_event, self.writer, file_name)
+        finally:
+            self.worker.camera.unlock()
+            self.writer.close()
+
+    def run_single_frames(self, width, height):
+        """
+        capture each frame directly to a file
+        """
+        while True:
+
+            deadline = self.scheduler.wait(self.stop_event)
+            if deadline is None:
+                break
+
+            self.scheduler.record(deadline, time.monotonic())
+            pict_file_name = str(pathlib.Path(self.kwargs["directory"]) / "{prefix}_{file_name}.jpg".format(prefix=self.kwargs["prefix"],
+                                                                             file_name=date_iso()))
+
+            self.worker.camera.lock((width, height))
+            try:
+                with metrics.timer("capture_seconds", mode="single frames"):
+                    self.worker.camera.capture(pict_file_name)
+            finally:
+                # the camera is kept warm or released until the pre-warm of the next frame
+                self.worker.camera.unlock(next_use=None if self.scheduler.finished()
+                                          else self.scheduler.deadline(self.scheduler.index))
+            self.worker.picture_index.add([pict_file_name], time_offset=self.worker.clock_offset)
+            self.worker.log("picture saved {}".format(pict_file_name))
+            if self.preview:
+                self.preview.offer(pict_file_name)
+
+    def run(self):
+
+        # the start and end times are given by the coordinator: they are converted to the worker clock
+        start = datetime.datetime.fromisoformat(self.kwargs["start"]).timestamp() + self.worker.clock_offset
+        end = datetime.datetime.fromisoformat(self.kwargs["end"]).timestamp() + self.worker.clock_offset
+        if time.time() > end:
+            self.worker.log("time out of interval")
+            self.worker.remove_time_lapse_info()
+            return
+
+        self.scheduler = Frame_scheduler(self.kwargs["interval"], start, end, late_tolerance=LATE_FRAME_TOLERANCE)
+
+        if PREVIEW_ENABLED:
+            self.preview = Preview_sender(self.worker.send_preview, size=PREVIEW_SIZE, quality=PREVIEW_QUALITY,
+                                          min_interval=PREVIEW_MIN_INTERVAL, log=self.worker.log)
+            self.preview.start()
+
+        # the time lapse information is removed even if the capture fails (a new time lapse can be started)
+        try:
+            width, height = [int(x) for x in self.kwargs["resolution"].split("x")]
+            if not self.scheduler.finished():
+                self.worker.camera.prewarm(self.scheduler.deadline(self.scheduler.index))
+            if self.kwargs["interval"] < PIPELINE_INTERVAL:
+                self.run_pipeline(width, height)
+            else:
+                self.run_single_frames(width, height)
+        except:
+            self.worker.log(f"error in time lapse: {sys.exc_info()[1]}")
+        finally:
+            if self.preview:
+                self.preview.stop()
+            self.worker.remove_time_lapse_info()
+
+        self.worker.log(f"time lapse statistics: {self.stats()}")
+        if self.stop_event.is_set():
+            message = "Time lapse finished"
+        else:
+            message = "Time lapse finished: time out of time lapse interval"
+        self.worker.log(message)
+        r, msg = self.worker.sendMessageTo(self.worker.coordinator_address, {"msg": message})
+        if r:
+            self.worker.log(f"Error sending end of time lapse: {msg}")
+
+
+class Worker:
+    """
+    worker receiving the commands of the coordinator on WORKER_PORT and replying on COORDINATOR_PORT
+    """
+
+    def __init__(self, hostname, camera_factory, transport, listen_address=LISTEN_ADDRESS,
+                 coordinator_address=COORDINATOR_BLUETOOTH_ADDRESS, pictures_dir=PICTURES_DIR, work_dir="."):
+        """
+        Args:
+            hostname (str): name of the worker (sent to the coordinator)
+            camera_factory (callable): return an open camera (PiCamera or Fake_camera), None if the camera is not enabled
+            transport (Transport): transport used to communicate with the coordinator
+            listen_address (str): address the worker listens on (see LISTEN_ADDRESS)
+            coordinator_address (str): address of the coordinator
+            pictures_dir (str): directory of the pictures
+            work_dir (str): directory of the log file (HOSTNAME.log), of the picture index and of the time lapse information
+        """
+        self.hostname = hostname
+        self.camera_enabled = camera_factory is not None
+        self.transport = transport
+        self.listen_address = listen_address
+        self.coordinator_address = coordinator_address
+        self.pictures_dir = pictures_dir
+
+        work_dir = pathlib.Path(work_dir)
+        self.log_file = str(work_dir / f"{hostname}.log")
+        self.time_lapse_info_file = str(work_dir / "time_lapse_info.txt")
+        self.logger = logging.getLogger(f"worker.{hostname}")
+        self.logger.setLevel(logging.INFO)
+        self.logger.propagate = False
+        if not self.logger.handlers:
+            handler = logging.FileHandler(self.log_file)
+            handler.setFormatter(logging.Formatter("%(levelname)s:%(name)s:%(message)s"))
+            self.logger.addHandler(handler)
+
+        # read local bluetooth addr (or the address of the worker for the other transports)
+        self.address = transport.local_address(listen_address)
+
+        # long-lived connection to the coordinator
+        self.connection_pool = Connection_pool(transport, COORDINATOR_PORT, keepalive_interval=KEEPALIVE_INTERVAL,
+                                               hello={"hostname": hostname, "address": self.address, "codecs": list(CODECS)},
+                                               preferred_codecs=COMPRESSION_CODECS,
+                                               min_size=COMPRESSION_MIN_SIZE,
+                                               bulk_port=COORDINATOR_BULK_PORT,
+                                               bulk_min_size=BULK_MIN_SIZE)
+
+        self.log("started")
+        self.remove_time_lapse_info()
+
+        # the camera is used by the time lapse thread and by the picture commands (see Camera_manager.lock)
+        self.camera = Camera_manager(camera_factory, resolution=CAMERA_RESOLUTION, warm_up_time=CAMERA_WARM_UP_TIME,
+                                     keep_warm=CAMERA_KEEP_WARM, name=hostname, log=self.log)
+        self.camera.start()
+
+        self.picture_index = Picture_index(pictures_dir, str(work_dir / PICTURE_INDEX_FILE), log=self.log)
+        # deletion of the oldest pictures when the free space is low
+        self.storage = Storage_manager(self.picture_index, min_free=STORAGE_MIN_FREE_MB * 1e6,
+                                       target_free=STORAGE_TARGET_FREE_MB * 1e6, max_pictures=STORAGE_MAX_PICTURES_MB * 1e6,
+                                       policy=STORAGE_POLICY, check_interval=STORAGE_CHECK_INTERVAL,
+                                       batch_size=STORAGE_DELETE_BATCH, batch_pause=STORAGE_BATCH_PAUSE,
+                                       name=hostname, log=self.log)
+        self.storage.start()
+
+        self.thread_tl_main = None
+        # offset (in seconds) of the worker clock relative to the coordinator clock, measured by the coordinator
+        # (added to the times received from the coordinator, subtracted from the capture times of the frames)
+        self.clock_offset = 0.0
+        self.quit_event = threading.Event()
+        # executor for the slow commands (picture, shell command, time synchronization, log)
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=EXECUTOR_THREADS)
+        # thread running the fast commands in order: the reader threads never wait for a reply to be sent
+        self.fast_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        # slow commands waiting for a thread of the executor
+        self.executor_waiting = 0
+        self.executor_lock = threading.Lock()
+        metrics.set_gauge("executor_waiting_commands", lambda: self.executor_waiting, worker=hostname)
+
+
+    def remove_time_lapse_info(self):
+        if os.path.isfile(self.time_lapse_info_file):
+            os.remove(self.time_lapse_info_file)
+            self.log("time_lapse_info.txt deleted")
+
+
+    def log(self, msg):
+        """
+        write message to log
+
+        Args:
+            msg (str): message to write
+        """
+
+        self.logger.info(f'{date_iso().replace("_", " ")}: {msg}')
+
+
+    def take_one_picture(self, hostname, directory, width=640, height=380):
+        """
+        take one picture with resolution width / height
+
+        Args:
+            hostname (str): raspberry hostname to add to file name
+            directory (str): directory where the picture will be saved
+            width (int): horizontal resolution of picture
+            height (int): vertical resolution of picture
+
+        Returns:
+            bool: False if OK else True
+            str: path of picture file / error code
+        """
+
+        try:
+            if not self.camera.lock((width, height), timeout=CAMERA_LOCK_TIMEOUT):
+                return True, "the camera is busy"
+        except:
+            return True, f"error opening the camera: {sys.exc_info()[1]}"
+        try:
+            pict_file_name = str(pathlib.Path(directory) / "{hostname}_{file_name}.jpg".format(hostname=hostname,
+                                                                                               file_name=date_iso()))
+            with metrics.timer("capture_seconds", mode="one picture"):
+                self.camera.capture(pict_file_name)
+            self.picture_index.add([pict_file_name], time_offset=self.clock_offset)
+            return False, pict_file_name
+        except:
+            return True, str(sys.exc_info()[0])
+        finally:
+            self.camera.unlock()
+
+
+    def time_lapse(self, interval=60, directory="/tmp", hostname="", start="", end="", prefix="", resolution="1640x1232"):
+
+        thread_tl = Time_lapse(self, args=(1,), kwargs={"interval": interval,
+                                                        "directory": directory,
+                                                        "hostname": hostname,
+                                                        "start": start,
+                                                        "end": end,
+                                                        "prefix": prefix,
+                                                        "resolution": resolution})
+        # written before the start: the thread removes the file when the time lapse ends
+        with open(self.time_lapse_info_file, "w") as f:
+            f.write("{}\n{}\n{}\n".format(interval, start, end))
+        thread_tl.start()
+        return thread_tl
+
+
+    def sendMessageTo(self, targetBluetoothMacAddress, msg, payloads=None):
+        """
+        send message msg to target on port COORDINATOR_PORT
+
+        Args:
+            targetBluetoothMacAddress (str): address of receiver (bluetooth MAC address, IP address or name)
+            msg (dict): dictionary containing message to be sent
+            payloads (dict): binary sections to be sent with the message (for example {"picture": bytes})
+
+        Returns:
+            int: 0 -> OK 1 -> error
+            str: error message (if any)
+        """
+
+        try:
+            dict_to_send = {"hostname": self.hostname,
+                            "bluetooth_address": self.address,
+                            "datetime": date_iso()}
+            dict_to_send = {**dict_to_send, **msg}
+            # the coordinator identifies the reply by the id of the request
+            if getattr(msg.get("reply_to"), "request_id", None) is not None:
+                dict_to_send["request_id"] = msg["reply_to"].request_id
+
+            self.connection_pool.send(targetBluetoothMacAddress, dict_to_send, payloads, msg_type=MSG_REPLY)
+
+            return 0, ""
+        except:
+            return 1, str(sys.exc_info()[1])
+
+
+    def send_preview(self, path, content):
+        """
+        send the preview of a time lapse frame to the coordinator
+        """
+        r, msg = self.sendMessageTo(self.coordinator_address, {"preview": {"file_name": pathlib.Path(path).name}},
+                                    payloads={"preview": content})
+        if r:
+            self.log(f"Error sending preview: {msg}")
+
+
+    def status(self, msg):
+        self.log("sending status")
+
+        r, _ = self.sendMessageTo(self.coordinator_address,
+                                  {"reply_to": msg,
+                                   "msg": "status",
+                                   "status": "OK",
+                                   "local time": date_iso().replace("_", " "),
+                                   "epoch": time.time(),
+                                   "clock offset": self.clock_offset,
+                                   **self.picture_index.summary(),
+                                   **self.storage.summary(),
+                                   "version installed": __version__,
+                                   "camera enabled": self.camera_enabled,
+                                   "camera": self.camera.stats(),
+                                   "time lapse running": os.path.isfile(self.time_lapse_info_file),
+                                   "time lapse stats": self.thread_tl_main.stats() if self.thread_tl_main else {},
+                                   "compression": compression_stats.snapshot(),
+                                  })
+        self.log("Error sending status" if r else "status sent")
+
+
+    def quit_worker(self, msg):
+        if self.thread_tl_main:
+            self.thread_tl_main.stop()
+        self.log("exited")
+        self.quit_event.set()
+
+
+    def read_log(self, offset, level="", pattern="", max_size=262144):
+        """
+        read the lines of the log file written after offset
+
+        Args:
+            offset (int): position in log file of the first byte not yet read by the coordinator
+            level (str): minimum level of the lines returned (INFO, WARNING, ERROR, ...), "" for all lines
+            pattern (str): regular expression the lines returned must contain, "" for all lines
+            max_size (int): maximum number of bytes read
+
+        Returns:
+            str: lines
+            int: offset of the next line
+            bool: True if the end of the log file was reached
+        """
+        size = os.path.getsize(self.log_file)
+        # the log file was truncated or replaced
+        if offset > size:
+            offset = 0
+        with open(self.log_file, "rb") as f:
+            f.seek(offset)
+            content = f.read(max_size)
+        complete = offset + len(content) >= size
+        if not complete:
+            # do not split the last line
+            content = content[:content.rfind(b"\n") + 1] or content
+        next_offset = offset + len(content)
+
+        lines = content.decode("utf-8", errors="replace").splitlines()
+        if level:
+            min_level = logging.getLevelName(level.upper())
+            lines = [line for line in lines
+                     if isinstance(logging.getLevelName(line.split(":", 1)[0]), int)
+                     and logging.getLevelName(line.split(":", 1)[0]) >= min_level]
+        if pattern:
+            regex = re.compile(pattern)
+            lines = [line for line in lines if regex.search(line)]
+
+        return "\n".join(lines), next_offset, complete
+
+
+    def get_log(self, msg):
+        """
+        send the log lines written after the offset asked by the coordinator
+        get_log|{"offset": int, "level": str, "pattern": str}
+        """
+        try:
+            params = json.loads(msg.split("|", 1)[1]) if "|" in msg else {}
+            lines, offset, complete = self.read_log(params.get("offset", 0), params.get("level", ""),
+                                                    params.get("pattern", ""), max_size=LOG_MAX_SIZE)
+        except:
+            self.log(f"error reading log: {sys.exc_info()[1]}")
+            self.sendMessageTo(self.coordinator_address, {"msg": f"error reading log: {sys.exc_info()[1]}"})
+            return
+
+        # the log is compressed by the connection (see COMPRESSION_CODECS)
+        r, msg = self.sendMessageTo(self.coordinator_address,
+                                    {"log": {"offset": offset, "complete": complete}},
+                                    payloads={"log": lines.encode("utf-8")})
+        if r:
+            self.log(f"Error during log file transmission: {msg}")
+
+
+    def one_picture(self, msg):
+
+        if not self.camera_enabled:
+            self.sendMessageTo(self.coordinator_address, {"msg": f"The camera is not enabled on this raspberry"})
+            return
+        try:
+            _, width_height = msg.split("*")
+            w, h = [int(x) for x in width_height.split("x")]
+        except:
+            self.log(f"one picture wrong parameters: {msg}")
+            self.sendMessageTo(self.coordinator_address, {"msg": f"one picture wrong parameters {msg}"})
+            return
+
+        r, return_msg = self.take_one_picture(self.hostname, self.pictures_dir, width=w, height=h)
+        if r:
+            self.log(f"error taking one picture: {return_msg}")
+            self.sendMessageTo(self.coordinator_address, {"msg": f"error taking one picture: {return_msg}"})
+
+        else:
+            self.log(f"picture saved in {return_msg}")
+
+            msg = {"picture": {"file_name": pathlib.Path(return_msg).name}}
+
+            r, return_msg = self.sendMessageTo(self.coordinator_address, msg,
+                                               payloads={"picture": open(return_msg, "rb").read()})
+
+            self.log(f"Error: {return_msg}" if r else "image sent")
+
+
+    def capture_at(self, msg):
+        """
+        take a picture at a time given by the coordinator (synchronized capture of many raspberries)
+        The picture is taken in a separate thread: the reply is sent after the capture
+        """
+        if not self.camera_enabled:
+            self.sendMessageTo(self.coordinator_address, {"reply_to": msg, "error": "The camera is not enabled on this raspberry"})
+            return
+        try:
+            _, params = msg.split("|", 1)
+            params = json.loads(params)
+            epoch = float(params["epoch"])
+            width, height = [int(x) for x in params["resolution"].split("x")]
+        except:
+            self.log(f"error in capture parameters: {msg}")
+            self.sendMessageTo(self.coordinator_address, {"reply_to": msg, "error": f"error in capture parameters: {msg}"})
+            return
+
+        threading.Thread(target=self.scheduled_capture,
+                         args=(msg, epoch, width, height, params.get("prefix") or self.hostname),
+                         daemon=True).start()
+
+
+    def scheduled_capture(self, msg, epoch, width, height, prefix):
+        """
+        prepare the camera, wait for epoch (coordinator clock) and take the picture
+
+        The reply contains the capture time (coordinator clock) for measuring the skew between cameras
+        """
+        # capture time on the worker clock
+        target = epoch + self.clock_offset
+        # the camera must be ready (warmed up, resolution set) CAPTURE_ARM_TIME seconds before the capture:
+        # the warm-up of a released camera is shortened when the delay is short
+        ready_by = time.monotonic() + (target - time.time() - CAPTURE_ARM_TIME)
+        try:
+            if not self.camera.lock((width, height), timeout=max(0, ready_by - time.monotonic()), ready_by=ready_by):
+                self.sendMessageTo(self.coordinator_address, {"reply_to": msg, "error": "the camera is busy"})
+                return
+        except:
+            self.log(f"error opening the camera: {sys.exc_info()[1]}")
+            self.sendMessageTo(self.coordinator_address, {"reply_to": msg, "error": f"error opening the camera: {sys.exc_info()[1]}"})
+            return
+        try:
+            # the frames of all the raspberries have the same name (time of the capture)
+            file_name = datetime.datetime.fromtimestamp(epoch).strftime("%Y-%m-%d_%H:%M:%S.%f")[:-3]
+            pict_file_name = str(pathlib.Path(self.pictures_dir) / f"{prefix}_{file_name}.jpg")
+            if time.time() > target:
+                self.log(f"capture at {file_name} canceled: the request arrived too late")
+                self.sendMessageTo(self.coordinator_address,
+                                   {"reply_to": msg, "error": f"the request arrived {time.time() - target:.3f} s too late"})
+                return
+            # sleep until just before the capture time then wait actively (the sleep is not precise)
+            time.sleep(max(0, target - time.time() - 0.02))
+            while time.time() < target:
+                pass
+            triggered = time.time()
+            self.camera.capture(pict_file_name, use_video_port=True)
+            # the frame is only known to be captured when capture returns (includes the latency of the camera)
+            captured = time.time()
+            duration = captured - triggered
+            metrics.observe("capture_seconds", duration, mode="synchronized")
+        except:
+            self.log(f"error in synchronized capture: {sys.exc_info()[1]}")
+            self.sendMessageTo(self.coordinator_address, {"reply_to": msg, "error": f"error in capture: {sys.exc_info()[1]}"})
+            return
+        finally:
+            self.camera.unlock()
+
+        self.picture_index.add([pict_file_name], time_offset=self.clock_offset)
+        self.log(f"synchronized picture saved in {pict_file_name} ({captured - target:+.3f} s)")
+        self.sendMessageTo(self.coordinator_address,
+                           {"reply_to": msg,
+                            "msg": "picture taken",
+                            "capture": {"file_name": pathlib.Path(pict_file_name).name,
+                                        "captured": captured - self.clock_offset,
+                                        "duration": duration}})
+
+
+    def start_time_lapse(self, msg):
+
+        if not self.camera_enabled:
+            self.sendMessageTo(self.coordinator_address, {"reply_to": msg, "msg": f"The camera is not enabled on this raspberry"})
+            return
+        if os.path.isfile(self.time_lapse_info_file):
+            self.log("time lapse is already running")
+            self.sendMessageTo(self.coordinator_address, {"reply_to": msg, "msg": "Time lapse is already running"})
+            return
+
+        try:
+            _, cmd_str = msg.split("|")
+            cmd_json = json.loads(cmd_str)
+        except:
+            self.log(f"Error in time lapse parameters: {msg}")
+            self.sendMessageTo(self.coordinator_address, {"reply_to": msg, "msg": f'Error in time lapse parameters {msg}'})
+            return
+
+        if cmd_json["start"] >= cmd_json["end"]:
+            self.log(f'Error in time lapse parameters: from {cmd_json["start"]} to {cmd_json["end"]}')
+            self.sendMessageTo(self.coordinator_address, {"reply_to": msg, "msg": f'Error in time lapse parameters: from {cmd_json["start"]} to {cmd_json["end"]}'})
+            return
+
+        self.log((f'start time lapse for exp {cmd_json["prefix"]} every {cmd_json["interval"]} s '
+                  f'from {cmd_json["start"]} to {cmd_json["end"]} resolution {cmd_json["resolution"]}'))
+
+        self.thread_tl_main = self.time_lapse(start=cmd_json["start"],
+                                              end=cmd_json["end"],
+                                              interval=cmd_json["interval"],
+                                              prefix=cmd_json["prefix"],
+                                              resolution=cmd_json["resolution"],
+                                              directory=self.pictures_dir,
+                                              hostname=self.hostname,
+                                              )
+
+        self.log("time lapse started")
+        self.sendMessageTo(self.coordinator_address, {"reply_to": msg, "msg": "Time lapse started"})
+
+
+    def stop_time_lapse(self, msg):
+        if not self.camera_enabled:
+            self.sendMessageTo(self.coordinator_address, {"msg": f"The camera is not enabled on this raspberry"})
+            return
+        if self.thread_tl_main and self.thread_tl_main.is_alive():
+            self.thread_tl_main.stop()
+        else:
+            self.log("No time lapse is running")
+            self.sendMessageTo(self.coordinator_address, {"msg": "No time lapse is running"})
+
+
+    def execute_command(self, msg):
+        try:
+            _, command = msg.split("***")
+            self.log("execute: " + command)
+        except:
+            self.log("error in " + msg)
+            self.sendMessageTo(self.coordinator_address, {"msg": f"Error in {msg}"})
+            return
+        try:
+            output = subprocess.Popen(command, shell=True, stdout=subprocess.PIPE).stdout.read()
+
+            self.sendMessageTo(self.coordinator_address, {"msg": f"command output:\n{output.decode('utf-8')}"})
+        except:
+            self.log("error executing  " + command)
+            self.sendMessageTo(self.coordinator_address, {"msg": f"Error executing {command}"})
+
+
+    def sync_time(self, msg):
+        try:
+            _, date, hour = msg.split("*")
+        except:
+            self.log("error in sync time parameters " + msg)
+            self.sendMessageTo(self.coordinator_address, {"reply_to": msg, "msg": f"error in sync time parameters: {msg}"})
+            return
+        completed = subprocess.run(['sudo', 'timedatectl', 'set-ntp', '0'])
+        if completed.returncode:
+             self.log("Error in timedatectl set-ntp 0")
+             self.sendMessageTo(self.coordinator_address, {"reply_to": msg, "msg": "error in timedatectl set-ntp 0 command"})
+             return
+
+        completed = subprocess.run(['sudo', 'timedatectl','set-time', f"{date} {hour}"])
+
+        if completed.returncode:
+             self.log(f"Error in timedatectl set-time '{date} {hour}'")
+             self.sendMessageTo(self.coordinator_address, {"reply_to": msg, "msg": "time NOT synchronized"})
+        else:
+             self.log(f"time synchronized {date} {hour}")
+             self.sendMessageTo(self.coordinator_address,
+                                {"reply_to": msg, "msg": f'time synchronized\nRaspberry time is now {date_iso().replace("_"," ")}'})
+
+
+    def time_probe(self, msg):
+        """
+        answer a clock offset measurement of the coordinator with the reception and emission times
+        The reception time is taken when the message was decoded: the wait behind the other handlers is not counted
+        """
+        t1 = getattr(msg, "received", None) or time.time()
+        self.sendMessageTo(self.coordinator_address, {"reply_to": msg, "probe": {"t1": t1, "t2": time.time()}})
+
+
+    def adjust_time(self, msg):
+        """
+        correct the clock of the raspberry by the offset measured by the coordinator
+        """
+        try:
+            _, params = msg.split("|", 1)
+            offset = float(json.loads(params)["offset"])
+        except:
+            self.log(f"error in adjust time parameters: {msg}")
+            self.sendMessageTo(self.coordinator_address, {"reply_to": msg, "error": f"error in adjust time parameters: {msg}"})
+            return
+
+        completed = subprocess.run(['sudo', 'timedatectl', 'set-ntp', '0'])
+        if completed.returncode:
+            self.log("Error in timedatectl set-ntp 0")
+            self.sendMessageTo(self.coordinator_address, {"reply_to": msg, "error": "error in timedatectl set-ntp 0 command"})
+            return
+
+        # the new time is computed just before setting it
+        new_time = datetime.datetime.fromtimestamp(time.time() - offset).strftime("%Y-%m-%d %H:%M:%S.%f")
+        completed = subprocess.run(['sudo', 'timedatectl', 'set-time', new_time])
+        if completed.returncode:
+            self.log(f"Error in timedatectl set-time '{new_time}'")
+            self.sendMessageTo(self.coordinator_address, {"reply_to": msg, "error": "time NOT adjusted"})
+        else:
+            # the clock is corrected: the offset measured before must not be applied again
+            self.clock_offset = 0.0
+            self.log(f"time adjusted by {-offset:+.3f} s")
+            self.sendMessageTo(self.coordinator_address, {"reply_to": msg, "msg": "time adjusted"})
+
+
+    def set_clock_offset(self, msg):
+        """
+        record the residual offset of the clock (applied to the capture times of the frames)
+        """
+        try:
+            _, params = msg.split("|", 1)
+            self.clock_offset = float(json.loads(params)["offset"])
+        except:
+            self.log(f"error in clock offset parameters: {msg}")
+            self.sendMessageTo(self.coordinator_address, {"reply_to": msg, "error": f"error in clock offset parameters: {msg}"})
+            return
+        self.log(f"clock offset: {self.clock_offset:+.3f} s")
+        self.sendMessageTo(self.coordinator_address, {"reply_to": msg, "msg": "clock offset set"})
+
+
+    def manifest(self, msg):
+        """
+        send the list of the frames saved after the cursor (name, size, CRC32, capture time)
+        """
+        try:
+            _, params = msg.split("|", 1)
+            cursor = str(json.loads(params)["since"])
+            # cursor: id of the last frame in the picture index
+            frames, complete = self.picture_index.since(int(cursor) if cursor.isdigit() else 0, MANIFEST_LIMIT)
+        except:
+            self.log(f"error in manifest: {msg}")
+            self.sendMessageTo(self.coordinator_address, {"reply_to": msg, "error": f"error in manifest: {sys.exc_info()[1]}"})
+            return
+
+        if frames:
+            cursor = str(frames[-1][0])
+        self.sendMessageTo(self.coordinator_address,
+                           {"reply_to": msg,
+                            "manifest": {"frames": [[name, size, crc, mtime] for _, name, size, crc, mtime in frames],
+                                         "cursor": cursor,
+                                         "complete": complete}})
+        self.log(f"manifest sent: {len(frames)} frames")
+
+
+    def confirm_frames(self, msg):
+        """
+        mark the frames received by the coordinator (up to the cursor of a manifest) as confirmed:
+        they are deleted first when the space is needed
+        """
+        try:
+            _, params = msg.split("|", 1)
+            cursor = str(json.loads(params)["cursor"])
+            count = self.picture_index.confirm(int(cursor) if cursor.isdigit() else 0)
+        except:
+            self.log(f"error in confirm frames: {msg}")
+            self.sendMessageTo(self.coordinator_address, {"reply_to": msg, "error": f"error in confirm frames: {sys.exc_info()[1]}"})
+            return
+
+        self.log(f"{count} frames confirmed")
+        self.sendMessageTo(self.coordinator_address, {"reply_to": msg, "msg": f"{count} frames confirmed"})
+
+
+    def get_chunk(self, msg):
+        """
+        send a chunk of a frame
+        """
+        try:
+            _, params = msg.split("|", 1)
+            params = json.loads(params)
+            path = pathlib.Path(self.pictures_dir) / pathlib.Path(params["name"]).name
+            with open(path, "rb") as f:
+                f.seek(params["offset"])
+                content = f.read(params["length"])
+            size = path.stat().st_size
+        except:
+            self.log(f"error in get chunk: {msg}")
+            self.sendMessageTo(self.coordinator_address, {"reply_to": msg, "error": f"error in get chunk: {sys.exc_info()[1]}"})
+            return
+
+        self.sendMessageTo(self.coordinator_address,
+                           {"reply_to": msg, "chunk": {"name": params["name"], "offset": params["offset"], "size": size}},
+                           payloads={"chunk": content})
+
+
+    def send_metrics(self, msg):
+        """
+        send the metrics of the worker (see metrics.Metrics.entries)
+        The gauges of the other workers of the process are not sent
+        """
+        entries = [entry for entry in metrics.entries() if entry["labels"].get("worker", self.hostname) == self.hostname]
+        self.sendMessageTo(self.coordinator_address, {"reply_to": msg, "msg": "metrics", "metrics": entries})
+
+
+    # message matching function, handler, slow
+    # the slow handlers run on the executor, the other ones are answered in order by the fast executor
+    HANDLERS = [(lambda msg: msg == "status", status, False),
+                (lambda msg: msg == "quit", quit_worker, False),
+                (lambda msg: msg == "get_log" or msg.startswith("get_log|"), get_log, True),
+                (lambda msg: "one_picture*" in msg, one_picture, True),
+                (lambda msg: msg.startswith("capture_at|"), capture_at, False),
+                (lambda msg: "time_lapse|" in msg, start_time_lapse, False),
+                (lambda msg: msg == "stop_time_lapse", stop_time_lapse, False),
+                (lambda msg: "command***" in msg, execute_command, True),
+                (lambda msg: "sync_time*" in msg, sync_time, True),
+                (lambda msg: msg.startswith("time_probe|"), time_probe, False),
+                (lambda msg: msg.startswith("adjust_time|"), adjust_time, True),
+                (lambda msg: msg.startswith("set_clock_offset|"), set_clock_offset, False),
+                (lambda msg: msg.startswith("manifest|"), manifest, True),
+                (lambda msg: msg.startswith("get_chunk|"), get_chunk, True),
+                (lambda msg: msg.startswith("confirm_frames|"), confirm_frames, True),
+                (lambda msg: msg == "metrics", send_metrics, False),
+               ]
+
+
+    def run_handler(self, handler, msg, queued_at=None):
+        """
+        run a handler and record its duration (and its waiting time in the executor queue)
+
+        Args:
+            handler (function): method of HANDLERS
+            queued_at (float): time when the message was queued for the executor (None if not queued)
+        """
+        t1 = time.monotonic()
+        if queued_at is not None:
+            with self.executor_lock:
+                self.executor_waiting -= 1
+            metrics.observe("command_wait_seconds", t1 - queued_at, command=handler.__name__)
+        try:
+            handler(self, msg)
+        except:
+            metrics.inc("command_errors_total", command=handler.__name__)
+            self.log(f"error in {handler.__name__}: {sys.exc_info()[1]}")
+        finally:
+            metrics.observe("command_seconds", time.monotonic() - t1, command=handler.__name__)
+
+
+    def dispatch(self, msg):
+        """
+        run the handler of message msg
+        """
+        for match, handler, slow in self.HANDLERS:
+            if match(msg):
+                if slow:
+                    with self.executor_lock:
+                        self.executor_waiting += 1
+                    self.executor.submit(self.run_handler, handler, msg, time.monotonic())
+                else:
+                    self.fast_executor.submit(self.run_handler, handler, msg)
+                return
+        self.log(f"unknown message: {msg}")
+
+
+    def read_connection(self, client_sock, address):
+        """
+        read the messages sent on a connection of the coordinator and dispatch them
+        The connection is kept open for the next messages (closed after CONNECTION_IDLE_TIMEOUT seconds of inactivity)
+        """
+        try:
+            client_sock.settimeout(CONNECTION_IDLE_TIMEOUT)
+            while not self.quit_event.is_set():
+                stats = {}
+                message = recv_message(client_sock, stats=stats)
+                received = time.time()
+                if message is None:
+                    break
+                metrics.observe("received_message_bytes", stats["bytes"], buckets=SIZE_BUCKETS, peer=address)
+                metrics.inc("received_bytes_total", stats["bytes"], peer=address)
+                msg_type, _, metadata, _ = message
+                if msg_type == MSG_KEEPALIVE:
+                    continue
+                if msg_type == MSG_HELLO:
+                    # codecs accepted by the coordinator
+                    self.connection_pool.set_peer_codecs(self.coordinator_address, metadata.get("codecs", []))
+                    continue
+                msg = Request(metadata.get("msg", ""), metadata.get("request_id"), received)
+                # the time probes are answered without writing the log (the delay would bias the clock offset)
+                if not msg.startswith("time_probe|"):
+                    self.log("received from {address}: {msg}".format(address=address, msg=msg))
+                self.dispatch(msg)
+        except:
+            self.log(f"connection closed: {sys.exc_info()[1]}")
+        finally:
+            client_sock.close()
+
+
+    def run(self):
+        """
+        accept connections on port WORKER_PORT until the quit message is received (blocking).
+        Each connection is read in its own thread
+        """
+
+        server_sock = self.transport.listen(self.listen_address, WORKER_PORT, backlog=4)
+        server_sock.settimeout(1)
+        next_metrics = time.monotonic()
+        while not self.quit_event.is_set():
+            if METRICS_FILE and time.monotonic() >= next_metrics:
+                try:
+                    write_metrics(METRICS_FILE, metrics.entries())
+                except OSError:
+                    self.log(f"error writing {METRICS_FILE}: {sys.exc_info()[1]}")
+                next_metrics = time.monotonic() + METRICS_INTERVAL
+            try:
+                client_sock, address = server_sock.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                self.log(f"error accepting connection: {sys.exc_info()[1]}")
+                time.sleep(1)
+                continue
+            client_sock.settimeout(None)
+            threading.Thread(target=self.read_connection,
+                             args=(client_sock, address[0] if address else ""),
+                             daemon=True).start()
+        server_sock.close()
+
+
+    def stop(self):
+        """
+        stop the worker (run returns within one second) and the time lapse
+        """
+        self.quit_worker("quit")
+
+
+    def close(self):
+        """
+        release the resources of the worker (after run)
+        """
+        self.executor.shutdown(wait=False)
+        self.fast_executor.shutdown(wait=False)
+        self.camera.close()
+        self.storage.close()
+        self.connection_pool.close_all()